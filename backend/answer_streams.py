@@ -0,0 +1,210 @@
+"""
+Resumable answer streams.
+
+Each /ask answer is generated by its own task into a ring buffer of numbered
+events, decoupled from the HTTP response that reads it. Responses label every
+SSE frame with the number of the last event it carries (see sse.py), so a
+client that loses its connection can reconnect with Last-Event-ID and receive
+exactly the events it missed followed by the live tail, instead of asking
+again and paying for retrieval and generation twice.
+
+When the last reader of an unfinished stream goes away, generation carries on
+detached for `grace_seconds`; a reconnect within that window picks it up,
+otherwise it is cancelled, which unwinds the whole chain down to the
+provider call. Finished streams stay readable for
+`retention_seconds`. Only the newest `buffer_events` events are kept, so a
+reader that needs older ones gets StreamExpired.
+"""
+
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from metrics import ANSWER_STREAMS_TOTAL
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamExpired(Exception):
+    """The events a reader asked for are no longer in the ring buffer."""
+
+
+class AnswerStream:
+    """One answer being generated plus the ring buffer of events it has emitted."""
+    
+    def __init__(
+        self,
+        stream_id: str,
+        user_id: str,
+        source: AsyncIterator[Dict[str, Any]],
+        buffer_events: int,
+        on_done: Callable[["AnswerStream"], None]
+    ):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self.events = deque(maxlen=buffer_events)
+        self.last_id = 0
+        self.done = False
+        self.abandoned = False
+        self.readers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self.task = asyncio.create_task(self._run(source))
+    
+    @property
+    def first_id(self) -> int:
+        """Number of the oldest event still buffered."""
+        return self.events[0][0] if self.events else self.last_id + 1
+    
+    async def _run(self, source: AsyncIterator[Dict[str, Any]]):
+        outcome = "completed"
+        try:
+            async for event in source:
+                self._append(event)
+        except asyncio.CancelledError:
+            outcome = "abandoned"
+        except Exception as e:
+            logger.error(f"Answer stream {self.stream_id} failed: {e}")
+            self._append({"type": "error", "error": str(e)})
+            outcome = "failed"
+        finally:
+            self.done = True
+            ANSWER_STREAMS_TOTAL.inc(outcome=outcome)
+            self._notify()
+            self._on_done(self)
+    
+    def _append(self, event: Dict[str, Any]):
+        self.last_id += 1
+        self.events.append((self.last_id, event))
+        self._notify()
+    
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    def can_resume(self, after: int) -> bool:
+        """Whether every event numbered after `after` is still available."""
+        return self.first_id - 1 <= after <= self.last_id
+    
+    async def read(self, after: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the events numbered after `after`, then the live tail until the stream ends."""
+        next_id = after + 1
+        while True:
+            while next_id <= self.last_id:
+                first_id = self.first_id
+                if next_id < first_id:
+                    raise StreamExpired(f"Event {next_id} of stream {self.stream_id} is no longer buffered")
+                yield self.events[next_id - first_id][1]
+                next_id += 1
+            
+            if self.done:
+                return
+            
+            await self._changed.wait()
+
+
+class AnswerStreams:
+    """Registry of resumable answer streams."""
+    
+    def __init__(
+        self,
+        buffer_events: int = 4096,
+        grace_seconds: float = 10.0,
+        retention_seconds: float = 300.0,
+        max_streams: int = 1000
+    ):
+        """
+        Args:
+            buffer_events: Events kept per stream for replay
+            grace_seconds: How long an unfinished stream keeps generating with no reader
+            retention_seconds: How long a finished stream stays readable
+            max_streams: Finished streams are dropped oldest first beyond this many
+        """
+        self.buffer_events = buffer_events
+        self.grace_seconds = grace_seconds
+        self.retention_seconds = retention_seconds
+        self.max_streams = max_streams
+        self._streams: "OrderedDict[str, AnswerStream]" = OrderedDict()
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+    
+    def start(self, user_id: str, source: AsyncIterator[Dict[str, Any]]) -> AnswerStream:
+        """Start generating `source` into a new stream."""
+        self._evict()
+        stream = AnswerStream(uuid.uuid4().hex, user_id, source, self.buffer_events, self._finished)
+        self._streams[stream.stream_id] = stream
+        # Abandoned unless a reader attaches within the grace period
+        self._schedule(stream, self.grace_seconds, self._abandon)
+        return stream
+    
+    def get(self, stream_id: str, user_id: str) -> Optional[AnswerStream]:
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.user_id != user_id:
+            return None
+        return stream
+    
+    async def attach(self, stream: AnswerStream, after: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Read a stream for one client connection; the grace period starts when the last reader leaves."""
+        if not stream.done:
+            self._cancel_timer(stream.stream_id)
+        stream.readers += 1
+        try:
+            async for event in stream.read(after):
+                yield event
+        finally:
+            stream.readers -= 1
+            if stream.readers == 0 and not stream.done:
+                self._schedule(stream, self.grace_seconds, self._abandon)
+    
+    def _abandon(self, stream: AnswerStream):
+        self._timers.pop(stream.stream_id, None)
+        if stream.readers == 0 and not stream.done:
+            logger.info(f"Cancelling answer stream {stream.stream_id}: no reader for {self.grace_seconds}s")
+            self.cancel(stream)
+    
+    def cancel(self, stream: AnswerStream):
+        """Stop generating a stream now; attached readers get what was produced so far."""
+        if not stream.done:
+            stream.abandoned = True
+            stream.task.cancel()
+    
+    def _finished(self, stream: AnswerStream):
+        self._cancel_timer(stream.stream_id)
+        if stream.abandoned:
+            self._forget(stream)
+        else:
+            self._schedule(stream, self.retention_seconds, self._forget)
+    
+    def _forget(self, stream: AnswerStream):
+        self._cancel_timer(stream.stream_id)
+        if self._streams.get(stream.stream_id) is stream:
+            del self._streams[stream.stream_id]
+    
+    def _evict(self):
+        excess = len(self._streams) - self.max_streams + 1
+        if excess <= 0:
+            return
+        finished = [stream for stream in self._streams.values() if stream.done and stream.readers == 0]
+        for stream in finished[:excess]:
+            self._forget(stream)
+    
+    def _schedule(self, stream: AnswerStream, delay: float, callback: Callable[[AnswerStream], None]):
+        self._cancel_timer(stream.stream_id)
+        self._timers[stream.stream_id] = asyncio.get_running_loop().call_later(delay, callback, stream)
+    
+    def _cancel_timer(self, stream_id: str):
+        timer = self._timers.pop(stream_id, None)
+        if timer is not None:
+            timer.cancel()
+    
+    def cancel_all(self):
+        for stream in list(self._streams.values()):
+            self.cancel(stream)
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+    
+    def __len__(self) -> int:
+        return len(self._streams)
@@ -4,34 +4,168 @@ Authentication and authorization module.
 
 import os
 import jwt
+import time
 import hashlib
 import secrets
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Dict, Set, Tuple
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 
 from models import User, UserCreate, UserRole
 from database import DatabaseManager
+from metrics import AUTH_HASH_SECONDS, AUTH_HASH_REJECTED_TOTAL
+
+
+class TokenCache:
+    """
+    Bounded TTL cache of verified token -> User.
+    
+    Entries expire at the earlier of the token's own `exp` and the cache TTL,
+    so revocations made by other workers are picked up within one TTL.
+    Deactivation and role changes in this process invalidate immediately.
+    """
+    
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 60):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # token -> (user, cache expiry, token's own exp claim)
+        self._entries: "OrderedDict[str, Tuple[User, float, Optional[float]]]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, token: str) -> Optional[User]:
+        entry = self.get_with_expiry(token)
+        return entry[0] if entry is not None else None
+    
+    def get_with_expiry(self, token: str) -> Optional[Tuple[User, Optional[float]]]:
+        """The cached user and the token's `exp` claim, without decoding the token again."""
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        
+        user, expires_at, token_exp = entry
+        if time.time() >= expires_at:
+            with self._lock:
+                self._remove(token)
+            return None
+        return user, token_exp
+    
+    def put(self, token: str, user: User, token_exp: Optional[float] = None):
+        expires_at = time.time() + self.ttl_seconds
+        if token_exp is not None:
+            expires_at = min(expires_at, float(token_exp))
+        
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (user, expires_at, float(token_exp) if token_exp is not None else None)
+            self._tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+    
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+    
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[0].id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[0].id]
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a bounded thread pool instead of the event loop.
+    
+    bcrypt releases the GIL while hashing, so threads give real parallelism
+    without pickling overhead. Work beyond `max_pending` queued or running
+    calls is rejected with a 503 so a login storm cannot build an unbounded
+    backlog.
+    """
+    
+    def __init__(self, rounds: int = 12, max_workers: int = 2, max_pending: int = 32):
+        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+    
+    @property
+    def pending(self) -> int:
+        return self._pending
+    
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.pwd_context.hash, password)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", self.pwd_context.verify, plain_password, hashed_password)
+    
+    async def _run(self, operation: str, func, *args):
+        if self._pending >= self.max_pending:
+            AUTH_HASH_REJECTED_TOTAL.inc(operation=operation)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        
+        self._pending += 1
+        try:
+            with AUTH_HASH_SECONDS.time(operation=operation):
+                return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self._pending -= 1
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
 
 
 class AuthManager:
     """Handles authentication and user management."""
     
-    def __init__(self, secret_key: str):
+    def __init__(
+        self,
+        secret_key: str,
+        db_manager: Optional[DatabaseManager] = None,
+        cache_ttl_seconds: float = 60,
+        cache_max_size: int = 10000,
+        bcrypt_rounds: int = 12,
+        hash_workers: int = 2,
+        hash_max_pending: int = 32
+    ):
         self.secret_key = secret_key
         self.algorithm = "HS256"
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.hasher = PasswordHasher(rounds=bcrypt_rounds, max_workers=hash_workers, max_pending=hash_max_pending)
+        self.pwd_context = self.hasher.pwd_context
         self.security = HTTPBearer()
+        self.db_manager = db_manager or DatabaseManager(os.getenv("DATABASE_URL", "sqlite:///./pdf_qa.db"))
+        self.token_cache = TokenCache(max_size=cache_max_size, ttl_seconds=cache_ttl_seconds)
     
-    def hash_password(self, password: str) -> str:
-        """Hash a password."""
-        return self.pwd_context.hash(password)
+    async def hash_password(self, password: str) -> str:
+        """Hash a password off the event loop."""
+        return await self.hasher.hash(password)
     
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        """Verify a password against its hash."""
-        return self.pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash off the event loop."""
+        return await self.hasher.verify(plain_password, hashed_password)
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None) -> str:
         """Create JWT access token."""
@@ -66,52 +200,109 @@ class AuthManager:
     
     async def create_user(self, email: str, password: str, role: UserRole = UserRole.USER) -> User:
         """Create a new user."""
-        # Simple in-memory user storage for MVP
-        # In production, this should use the database
-        user_id = secrets.token_urlsafe(16)
-        hashed_password = self.hash_password(password)
-        
-        user = User(
-            id=user_id,
-            email=email,
-            role=role,
-            created_at=datetime.utcnow()
-        )
+        existing = await self.db_manager.get_user_by_email(email)
+        if existing:
+            raise ValueError("Email already registered")
         
-        # Store user (simplified for MVP)
-        # In production: await db_manager.create_user(user, hashed_password)
-        _users_store[email] = {
-            "user": user,
-            "password_hash": hashed_password
-        }
-        
-        return user
+        hashed_password = await self.hash_password(password)
+        return await self.db_manager.create_user(email, hashed_password, role)
     
     async def authenticate_user(self, email: str, password: str) -> Optional[User]:
         """Authenticate user with email and password."""
-        # Simple in-memory authentication for MVP
-        # In production: user = await db_manager.get_user_by_email(email)
-        user_data = _users_store.get(email)
+        user_data = await self.db_manager.get_user_by_email(email)
         
-        if not user_data:
+        if not user_data or not user_data["user"].is_active:
             return None
         
-        if not self.verify_password(password, user_data["password_hash"]):
+        if not await self.verify_password(password, user_data["password_hash"]):
             return None
         
         return user_data["user"]
     
     async def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user by email."""
-        user_data = _users_store.get(email)
+        user_data = await self.db_manager.get_user_by_email(email)
         return user_data["user"] if user_data else None
+    
+    async def update_user(
+        self,
+        user_id: str,
+        role: Optional[UserRole] = None,
+        is_active: Optional[bool] = None
+    ) -> Optional[User]:
+        """Change a user's role or active flag and drop their cached tokens."""
+        user = await self.db_manager.update_user(user_id, role=role, is_active=is_active)
+        self.token_cache.invalidate_user(user_id)
+        return user
+    
+    async def resolve_token(self, token: str) -> User:
+        """
+        Resolve a bearer token to an active user.
+        
+        Cache hits are a dict lookup; misses verify the JWT, load the user
+        and populate the cache until the token's expiry or the cache TTL.
+        """
+        user, _ = await self.resolve_token_with_expiry(token)
+        return user
+    
+    async def resolve_token_with_expiry(self, token: str) -> Tuple[User, Optional[float]]:
+        """resolve_token, also returning the token's `exp` claim (None if it has none)."""
+        cached = self.token_cache.get_with_expiry(token)
+        if cached is not None:
+            return cached
+        
+        payload = self.verify_token(token)
+        
+        email = payload.get("sub")
+        if email is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials"
+            )
+        
+        user = await self.get_user_by_email(email)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
+        
+        if not user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User is inactive"
+            )
+        
+        token_exp = payload.get("exp")
+        self.token_cache.put(token, user, token_exp)
+        return user, float(token_exp) if token_exp is not None else None
 
 
 # Global auth manager instance
 auth_manager = None
 
-# Simple in-memory user storage for MVP
-_users_store = {}
+def init_auth_manager(
+    secret_key: str,
+    db_manager: DatabaseManager,
+    cache_ttl_seconds: float = 60,
+    cache_max_size: int = 10000,
+    bcrypt_rounds: int = 12,
+    hash_workers: int = 2,
+    hash_max_pending: int = 32
+) -> AuthManager:
+    """Create the global auth manager bound to the application's database."""
+    global auth_manager
+    auth_manager = AuthManager(
+        secret_key,
+        db_manager=db_manager,
+        cache_ttl_seconds=cache_ttl_seconds,
+        cache_max_size=cache_max_size,
+        bcrypt_rounds=bcrypt_rounds,
+        hash_workers=hash_workers,
+        hash_max_pending=hash_max_pending
+    )
+    return auth_manager
+
 
 def get_auth_manager() -> AuthManager:
     """Get global auth manager instance."""
@@ -130,27 +321,9 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(H
         # Extract token from credentials
         token = credentials.credentials
         
-        # Verify token
-        payload = auth_mgr.verify_token(token)
-        
-        # Get user email from token
-        email = payload.get("sub")
-        if email is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials"
-            )
-        
-        # Get user
-        user = await auth_mgr.get_user_by_email(email)
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
-        
-        return user
-        
+        # Verify token (cached) and resolve user
+        return await auth_mgr.resolve_token(token)
+    
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -159,6 +332,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(H
         )
 
 
+async def authenticate_token(token: str) -> Tuple[User, Optional[float]]:
+    """Resolve a bearer token for a long-lived connection, returning the user and the token's expiry timestamp."""
+    return await get_auth_manager().resolve_token_with_expiry(token)
+
+
 async def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
     """Get current user and verify admin role."""
     if current_user.role != UserRole.ADMIN:
@@ -169,7 +347,7 @@ async def get_current_admin_user(current_user: User = Depends(get_current_user))
     return current_user
 
 
-def create_default_admin():
+async def create_default_admin():
     """Create default admin user for development."""
     try:
         auth_mgr = get_auth_manager()
@@ -178,27 +356,9 @@ def create_default_admin():
         admin_email = "admin@example.com"
         admin_password = "admin123"
         
-        if admin_email not in _users_store:
-            user_id = secrets.token_urlsafe(16)
-            hashed_password = auth_mgr.hash_password(admin_password)
-            
-            admin_user = User(
-                id=user_id,
-                email=admin_email,
-                role=UserRole.ADMIN,
-                created_at=datetime.utcnow()
-            )
-            
-            _users_store[admin_email] = {
-                "user": admin_user,
-                "password_hash": hashed_password
-            }
-            
+        if await auth_mgr.get_user_by_email(admin_email) is None:
+            await auth_mgr.create_user(admin_email, admin_password, role=UserRole.ADMIN)
             print(f"Created default admin user: {admin_email} / {admin_password}")
     
     except Exception as e:
         print(f"Error creating default admin: {e}")
-
-
-# Create default admin on module import
-create_default_admin()
@@ -0,0 +1,3 @@
+"""
+Benchmark suite for ingest and query paths, runnable without live provider keys.
+"""
@@ -0,0 +1,245 @@
+"""
+Per-question LangChain overhead micro-benchmark.
+
+Streams answers from an in-process stub chat model (no network, no sleeps)
+through two generation paths:
+
+- per_request: what RAGChain.ask_question used to do for every question:
+  build a ChatPromptTemplate, a with_config LLM wrapper carrying a
+  StreamingCallbackHandler that buffers every token, and a RunnableParallel
+  chain, then concatenate the answer with +=.
+- compiled: what it does now: the prompt string already formatted for
+  token counting is streamed straight from the LLM built at startup.
+- compiled_chain: the same prompt through the chain _create_chain builds
+  once (LLM | StrOutputParser), as ask_batch uses it, streamed. Shows
+  what the per-token parser run costs on top of the LLM stream.
+
+With the model cost near zero, the time and memory left are framework
+overhead. Reports wall and CPU microseconds per question and bytes
+allocated per question (tracemalloc peak), so the two paths can be compared
+on one machine.
+
+Usage (from the backend directory):
+    python -m benchmarks.chain_overhead --out chain.json
+    python -m benchmarks.chain_overhead --questions 500 --tokens 200
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tracemalloc
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema.runnable import RunnablePassthrough, RunnableParallel
+from langchain.schema.output_parser import StrOutputParser
+from langchain.callbacks.base import AsyncCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from benchmarks.common import percentiles, build_metadata, write_report, load_report, compare_reports
+from rag_chain import RAGChain
+
+
+CONTEXT = "\n\n".join(
+    f"[S{i}] (Page {i}): The calibration procedure for sensor array {i} requires a warm-up period "
+    f"and a reference measurement before each run; drift above two percent triggers a reset."
+    for i in range(1, 7)
+)
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that streams a fixed number of tokens instantly, reporting each like ChatOpenAI does."""
+    
+    tokens: int = 200
+    
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+    
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = "".join(f" token{i}" for i in range(self.tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+    
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop=None,
+        run_manager=None,
+        **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        for i in range(self.tokens):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=f" token{i}"))
+            yield chunk
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+
+
+class StreamingCallbackHandler(AsyncCallbackHandler):
+    """The per-request token buffer the old path attached to the LLM."""
+    
+    def __init__(self):
+        self.tokens = []
+        self.current_token = ""
+    
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.current_token = token
+        self.tokens.append(token)
+
+
+class _Settings:
+    LLM_MODEL = "stub"
+
+
+async def per_request(rag: RAGChain, question: str) -> str:
+    """Generation stage as it was: chain objects built for every question."""
+    history_section = ""
+    # Formatted once for token counting, then again by the prompt template
+    rag.system_prompt.format(context=CONTEXT, history=history_section, question=question)
+    
+    streaming_handler = StreamingCallbackHandler()
+    prompt = ChatPromptTemplate.from_template(rag.system_prompt)
+    llm_with_callbacks = rag.llm.with_config({"callbacks": [streaming_handler]})
+    temp_chain = (
+        RunnableParallel({
+            "context": lambda x: CONTEXT,
+            "history": lambda x: history_section,
+            "question": RunnablePassthrough()
+        })
+        | prompt
+        | llm_with_callbacks
+        | StrOutputParser()
+    )
+    
+    full_response = ""
+    async for chunk in temp_chain.astream(question):
+        if chunk:
+            full_response += chunk
+    return full_response
+
+
+async def compiled(rag: RAGChain, question: str) -> str:
+    """Generation stage as RAGChain.ask_question runs it now."""
+    prompt = rag.system_prompt.format(context=CONTEXT, history="", question=question)
+    answer_parts = []
+    token_stream = rag.llm.astream(prompt)
+    try:
+        async for chunk in token_stream:
+            if chunk.content:
+                answer_parts.append(chunk.content)
+    finally:
+        await token_stream.aclose()
+    return "".join(answer_parts)
+
+
+async def compiled_chain(rag: RAGChain, question: str) -> str:
+    """The prebuilt chain, streamed."""
+    prompt = rag.system_prompt.format(context=CONTEXT, history="", question=question)
+    answer_parts = []
+    token_stream = rag.chain.astream(prompt)
+    try:
+        async for chunk in token_stream:
+            if chunk:
+                answer_parts.append(chunk)
+    finally:
+        await token_stream.aclose()
+    return "".join(answer_parts)
+
+
+async def bench_path(name: str, path, rag: RAGChain, args) -> Dict[str, Any]:
+    questions = [f"How is sensor array {i % 6 + 1} calibrated?" for i in range(args.questions)]
+    
+    # Warm up imports and caches
+    for question in questions[:args.warmup]:
+        await path(rag, question)
+    
+    wall_us = []
+    cpu_us = []
+    for question in questions:
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        answer = await path(rag, question)
+        cpu_us.append((time.process_time() - cpu_start) * 1e6)
+        wall_us.append((time.perf_counter() - wall_start) * 1e6)
+    
+    # Memory is measured in a separate pass: tracemalloc slows allocation-heavy code
+    peaks = []
+    tracemalloc.start()
+    for question in questions[:args.memory_questions]:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        await path(rag, question)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - baseline)
+    tracemalloc.stop()
+    
+    return {
+        "path": name,
+        "answer_chars": len(answer),
+        "wall_us": percentiles(wall_us),
+        "wall_us_mean": round(sum(wall_us) / len(wall_us), 1),
+        "cpu_us_mean": round(sum(cpu_us) / len(cpu_us), 1),
+        "us_per_token": round(sum(wall_us) / len(wall_us) / args.tokens, 2),
+        "peak_bytes_per_question": int(sum(peaks) / len(peaks)) if peaks else None
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    rag = RAGChain(_Settings())
+    rag.llm = StubChatModel(tokens=args.tokens)
+    rag._create_chain()
+    
+    baseline = await bench_path("per_request", per_request, rag, args)
+    current = await bench_path("compiled", compiled, rag, args)
+    return {
+        "per_request": baseline,
+        "compiled": current,
+        "compiled_chain": await bench_path("compiled_chain", compiled_chain, rag, args),
+        "wall_reduction": round(1 - current["wall_us_mean"] / baseline["wall_us_mean"], 3),
+        "cpu_reduction": round(1 - current["cpu_us_mean"] / baseline["cpu_us_mean"], 3),
+        "memory_reduction": round(1 - current["peak_bytes_per_question"] / baseline["peak_bytes_per_question"], 3)
+        if baseline["peak_bytes_per_question"] else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request and compiled generation chains")
+    parser.add_argument("--out", help="Write JSON report to this path (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against a previously saved report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    parser.add_argument("--questions", type=int, default=300, help="Questions streamed per path")
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens per answer")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed questions per path")
+    parser.add_argument("--memory-questions", type=int, default=50, help="Questions traced for allocations")
+    args = parser.parse_args()
+    
+    report = {
+        "meta": build_metadata({
+            "questions": args.questions,
+            "tokens": args.tokens,
+            "context_chars": len(CONTEXT)
+        }),
+        **asyncio.run(run(args))
+    }
+    
+    exit_code = 0
+    if args.baseline:
+        comparison = compare_reports(report, load_report(args.baseline), args.tolerance)
+        report["comparison"] = comparison
+        if comparison["regressions"]:
+            print(f"Regressions: {', '.join(comparison['regressions'])}", file=sys.stderr)
+            exit_code = 1
+    
+    write_report(report, args.out)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
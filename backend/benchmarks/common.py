@@ -0,0 +1,154 @@
+"""
+Shared helpers for the benchmark suite: timing, percentiles, memory and reports.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """Summarize latency samples (milliseconds) as p50/p95/p99."""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "count": 0}
+    
+    ordered = sorted(samples)
+    
+    def pick(fraction: float) -> float:
+        index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+        return round(ordered[index], 2)
+    
+    return {
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "count": len(ordered)
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in megabytes."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if sys.platform == "darwin":
+        return round(usage / (1024 * 1024), 2)
+    return round(usage / 1024, 2)
+
+
+def rate(count: int, seconds: float) -> float:
+    """Items per second, guarded against zero durations."""
+    return round(count / seconds, 2) if seconds > 0 else 0.0
+
+
+class Stopwatch:
+    """Context manager measuring wall-clock time in seconds."""
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+        return False
+
+
+def build_metadata(extra: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Describe the machine and run so reports can be compared meaningfully."""
+    metadata = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+    if extra:
+        metadata.update(extra)
+    return metadata
+
+
+def write_report(report: Dict[str, Any], path: Optional[str]):
+    """Write the report as JSON to a file, or stdout when no path is given."""
+    payload = json.dumps(report, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+
+def flatten_metrics(report: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Flatten nested numeric values into dotted keys, skipping run metadata."""
+    flat = {}
+    for key, value in report.items():
+        if key in ("meta", "comparison"):
+            continue
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def higher_is_better(metric: str) -> bool:
+    """Throughput metrics improve upwards; latencies, counts of work and memory improve downwards."""
+    return metric.endswith("_per_sec") or metric.endswith("_per_second")
+
+
+def compare_reports(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.10
+) -> Dict[str, Any]:
+    """
+    Compare a report against a baseline.
+    
+    Args:
+        current: Freshly produced report
+        baseline: Previously saved report
+        tolerance: Allowed relative slowdown before a metric counts as a regression
+    
+    Returns:
+        Dictionary with per-metric deltas and the list of regressions
+    """
+    current_flat = flatten_metrics(current)
+    baseline_flat = flatten_metrics(baseline)
+    
+    deltas = {}
+    regressions = []
+    
+    for metric, base_value in baseline_flat.items():
+        if metric not in current_flat or metric.endswith(".count"):
+            continue
+        
+        value = current_flat[metric]
+        if base_value == 0:
+            continue
+        
+        change = (value - base_value) / abs(base_value)
+        deltas[metric] = {
+            "baseline": base_value,
+            "current": value,
+            "change_pct": round(change * 100, 2)
+        }
+        
+        worse = -change if higher_is_better(metric) else change
+        if worse > tolerance:
+            regressions.append(metric)
+    
+    return {
+        "tolerance_pct": round(tolerance * 100, 2),
+        "deltas": deltas,
+        "regressions": sorted(regressions)
+    }
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    """Load a previously written JSON report."""
+    with open(path) as f:
+        return json.load(f)
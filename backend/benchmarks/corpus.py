@@ -0,0 +1,155 @@
+"""
+Deterministic synthetic PDF corpus for benchmarks.
+
+PDFs are written directly in PDF syntax (Helvetica text streams) so the
+generator has no dependencies and produces byte-identical files per seed.
+"""
+
+import os
+import random
+from typing import List, Dict, Any
+
+
+VOCABULARY = (
+    "warranty installation voltage calibration firmware sensor pressure valve "
+    "maintenance schedule inspection torque bearing filter coolant turbine "
+    "compliance policy employee benefit payroll invoice contract clause liability "
+    "revenue forecast quarter margin customer retention pipeline shipment "
+    "protocol latency throughput replication cluster backup recovery encryption "
+    "patient dosage clinical trial outcome placebo cohort enrollment adverse"
+).split()
+
+
+# name -> (pages, lines per page, words per line)
+CORPUS_PROFILES = {
+    "sparse": (10, 6, 8),
+    "small": (5, 30, 12),
+    "medium": (40, 45, 14),
+    "dense": (25, 60, 18),
+    "large": (150, 45, 14),
+}
+
+
+def _escape(text: str) -> str:
+    """Escape characters that are special inside PDF literal strings."""
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_lines(rng: random.Random, lines: int, words: int, page_num: int) -> List[str]:
+    """Generate the text lines for one page."""
+    result = [f"Section {page_num}: {rng.choice(VOCABULARY).title()} overview"]
+    for _ in range(lines - 1):
+        result.append(" ".join(rng.choice(VOCABULARY) for _ in range(words)))
+    return result
+
+
+def build_pdf(pages: List[List[str]]) -> bytes:
+    """
+    Build a minimal PDF with one text stream per page.
+    
+    Args:
+        pages: Text lines for each page
+    
+    Returns:
+        PDF file contents
+    """
+    objects = []
+    
+    # 1: catalog, 2: page tree, 3: font; pages and contents follow
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    
+    for index, lines in enumerate(pages):
+        content_id = page_ids[index] + 1
+        objects.append((
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Contents {content_id} 0 R /Resources << /Font << /F1 3 0 R >> >> >>"
+        ).encode())
+        
+        stream_lines = ["BT", "/F1 9 Tf", "11 TL", "40 760 Td"]
+        for line in lines:
+            stream_lines.append(f"({_escape(line)}) Tj T*")
+        stream_lines.append("ET")
+        stream = "\n".join(stream_lines).encode("latin-1", "replace")
+        objects.append(
+            f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream"
+        )
+    
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode()
+    output += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode()
+    
+    return bytes(output)
+
+
+def generate_corpus(
+    output_dir: str,
+    profiles: List[str] = None,
+    scale: float = 1.0,
+    seed: int = 1234
+) -> List[Dict[str, Any]]:
+    """
+    Write the synthetic corpus to disk.
+    
+    Args:
+        output_dir: Directory for the generated PDFs
+        profiles: Profile names from CORPUS_PROFILES (default: all)
+        scale: Multiplier applied to page counts
+        seed: Random seed so runs are reproducible
+    
+    Returns:
+        List of dictionaries describing each generated file
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    
+    corpus = []
+    for name in profiles or list(CORPUS_PROFILES):
+        page_count, lines, words = CORPUS_PROFILES[name]
+        page_count = max(1, int(page_count * scale))
+        
+        pages = [_page_lines(rng, lines, words, num) for num in range(1, page_count + 1)]
+        data = build_pdf(pages)
+        
+        path = os.path.join(output_dir, f"{name}.pdf")
+        with open(path, "wb") as f:
+            f.write(data)
+        
+        corpus.append({
+            "name": name,
+            "path": path,
+            "pages": page_count,
+            "bytes": len(data),
+            "chars": sum(len(line) for page in pages for line in page)
+        })
+    
+    return corpus
+
+
+def sample_questions(count: int, seed: int = 99) -> List[str]:
+    """Questions built from the corpus vocabulary so retrieval finds matches."""
+    rng = random.Random(seed)
+    templates = [
+        "What does the document say about {a} and {b}?",
+        "How is {a} related to {b}?",
+        "Summarize the {a} requirements.",
+        "Which section covers {a}?",
+    ]
+    return [
+        rng.choice(templates).format(a=rng.choice(VOCABULARY), b=rng.choice(VOCABULARY))
+        for _ in range(count)
+    ]
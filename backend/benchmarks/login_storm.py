@@ -0,0 +1,184 @@
+"""
+Login storm benchmark.
+
+Measures /auth/login throughput and the latency of concurrent /ask streams on
+main.py while many clients log in at once. Chat latency is measured first on
+a quiet server and then under the storm so the impact of password hashing on
+the event loop is visible in one report.
+
+Usage (from the backend directory):
+    python -m benchmarks.login_storm --out storm.json
+    python -m benchmarks.login_storm --concurrency 64 --duration 20 --bcrypt-rounds 12
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import List, Dict, Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.common import percentiles, rate, build_metadata, write_report, load_report, compare_reports
+from benchmarks.corpus import generate_corpus, sample_questions
+from benchmarks.stub_server import StubConfig, StubServer
+from benchmarks.run_benchmarks import configure_environment, _wait_until_ready
+
+
+async def _ask_loop(client, headers: Dict[str, str], doc_id: str, questions: List[str], stop: asyncio.Event):
+    """Ask questions back to back until stopped, returning TTFT and total latencies."""
+    ttft = []
+    total = []
+    index = 0
+    while not stop.is_set():
+        question = questions[index % len(questions)]
+        index += 1
+        start = time.perf_counter()
+        first_token = None
+        async with client.stream(
+            "POST", "/ask", json={"question": question, "doc_ids": [doc_id]}, headers=headers
+        ) as stream:
+            async for line in stream.aiter_lines():
+                if first_token is None and line.startswith("data:") and '"token"' in line:
+                    first_token = time.perf_counter()
+        end = time.perf_counter()
+        if first_token is not None:
+            ttft.append((first_token - start) * 1000)
+        total.append((end - start) * 1000)
+    return ttft, total
+
+
+async def _login_worker(client, credentials: Dict[str, str], stop: asyncio.Event, results: Dict[int, list]):
+    """Log in repeatedly, recording latency per status code."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.post("/auth/login", json=credentials)
+        elapsed = (time.perf_counter() - start) * 1000
+        results.setdefault(response.status_code, []).append(elapsed)
+        if response.status_code == 503:
+            # Back off briefly instead of honouring the full Retry-After so the storm stays hot
+            await asyncio.sleep(0.1)
+
+
+async def _measure_chat(client, headers, doc_id, questions, duration: float) -> Dict[str, Any]:
+    stop = asyncio.Event()
+    task = asyncio.create_task(_ask_loop(client, headers, doc_id, questions, stop))
+    await asyncio.sleep(duration)
+    stop.set()
+    ttft, total = await task
+    return {"ttft_ms": percentiles(ttft), "total_ms": percentiles(total)}
+
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+    
+    workdir = tempfile.mkdtemp(prefix="pdfqa_storm_")
+    stub_config = StubConfig(ttft_ms=args.ttft_ms, tokens_per_second=args.tokens_per_second, answer_tokens=40)
+    
+    with StubServer(stub_config, port=args.stub_port) as stub:
+        configure_environment(workdir, stub.url)
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+        os.environ["AUTH_HASH_WORKERS"] = str(args.hash_workers)
+        os.environ["AUTH_HASH_MAX_PENDING"] = str(args.max_pending)
+        os.chdir(workdir)
+        
+        corpus = generate_corpus(os.path.join(workdir, "corpus"), profiles=["small"], seed=args.seed)
+        questions = sample_questions(10, seed=args.seed)
+        
+        import main
+        await main.app.router.startup()
+        
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            credentials = {"email": "storm@example.com", "password": "storm-password"}
+            response = await client.post("/auth/register", json=credentials)
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            
+            with open(corpus[0]["path"], "rb") as f:
+                response = await client.post(
+                    "/upload",
+                    files={"file": ("small.pdf", f.read(), "application/pdf")},
+                    headers=headers
+                )
+            response.raise_for_status()
+            doc_id = response.json()["doc_id"]
+            await _wait_until_ready(client, headers, doc_id)
+            
+            quiet = await _measure_chat(client, headers, doc_id, questions, args.quiet_seconds)
+            
+            stop = asyncio.Event()
+            results: Dict[int, list] = {}
+            workers = [
+                asyncio.create_task(_login_worker(client, credentials, stop, results))
+                for _ in range(args.concurrency)
+            ]
+            storm_start = time.perf_counter()
+            storm = await _measure_chat(client, headers, doc_id, questions, args.duration)
+            stop.set()
+            await asyncio.gather(*workers)
+            storm_seconds = time.perf_counter() - storm_start
+        
+        await main.app.router.shutdown()
+    
+    ok = results.get(200, [])
+    return {
+        "meta": build_metadata({
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "hash_workers": args.hash_workers,
+            "max_pending": args.max_pending,
+            "stub": stub_config.as_dict()
+        }),
+        "login": {
+            "logins_per_sec": rate(len(ok), storm_seconds),
+            "latency_ms": percentiles(ok),
+            "shed": len(results.get(503, [])),
+            "other_errors": sum(len(v) for k, v in results.items() if k not in (200, 503))
+        },
+        "chat_quiet": quiet,
+        "chat_storm": storm
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login throughput and chat latency under a login storm")
+    parser.add_argument("--out", help="Write JSON report to this path (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against a previously saved report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent login clients")
+    parser.add_argument("--duration", type=float, default=15.0, help="Storm length in seconds")
+    parser.add_argument("--quiet-seconds", type=float, default=5.0, help="Chat measurement before the storm")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--hash-workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--stub-port", type=int, default=8766)
+    parser.add_argument("--ttft-ms", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    args = parser.parse_args()
+    
+    out_path = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    
+    report = asyncio.run(run(args))
+    
+    exit_code = 0
+    if baseline_path:
+        comparison = compare_reports(report, load_report(baseline_path), args.tolerance)
+        report["comparison"] = comparison
+        if comparison["regressions"]:
+            print(f"Regressions: {', '.join(comparison['regressions'])}", file=sys.stderr)
+            exit_code = 1
+    
+    write_report(report, out_path)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
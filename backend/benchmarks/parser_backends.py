@@ -0,0 +1,203 @@
+"""
+PDF parser backend micro-benchmark.
+
+Extracts every page of each corpus file with every installed backend and
+reports pages/sec, open time, extracted characters per page and errors, plus
+the quality of each backend relative to the best one on the same file. The
+auto policy used by PDFProcessor is run on the same files so its choices and
+overhead can be compared with the fixed backends.
+
+Usage (from the backend directory):
+    python -m benchmarks.parser_backends --out parsers.json
+    python -m benchmarks.parser_backends --corpus-dir /data/manuals --repeat 3
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+from typing import List, Dict, Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.common import rate, build_metadata, write_report, load_report, compare_reports
+from benchmarks.corpus import generate_corpus
+from pdf_backends import BACKENDS, PDFExtractor, available_backends, visible_chars
+
+
+def _load_corpus(args) -> List[Dict[str, Any]]:
+    if args.corpus_dir:
+        paths = sorted(glob.glob(os.path.join(args.corpus_dir, "**", "*.pdf"), recursive=True))
+        if not paths:
+            raise SystemExit(f"No PDFs found under {args.corpus_dir}")
+        return [{"name": os.path.relpath(path, args.corpus_dir), "path": path} for path in paths]
+    
+    workdir = tempfile.mkdtemp(prefix="pdfqa_parsers_")
+    profiles = args.profiles.split(",") if args.profiles else None
+    return generate_corpus(workdir, profiles=profiles, scale=args.scale, seed=args.seed)
+
+
+def _run_backend(backend, path: str) -> Dict[str, Any]:
+    """Open a file and extract every page once."""
+    start = time.perf_counter()
+    document = backend.open(path)
+    open_seconds = time.perf_counter() - start
+    
+    chars = 0
+    errors = 0
+    try:
+        start = time.perf_counter()
+        for index in range(document.page_count):
+            try:
+                chars += visible_chars(document.page_text(index))
+            except Exception:
+                errors += 1
+        extract_seconds = time.perf_counter() - start
+    finally:
+        document.close()
+    
+    return {
+        "pages": document.page_count,
+        "open_seconds": open_seconds,
+        "extract_seconds": extract_seconds,
+        "chars": chars,
+        "errors": errors
+    }
+
+
+def bench_backends(backends, corpus: List[Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    """Best-of-`repeat` extraction of every file with every backend."""
+    per_file: Dict[str, Dict[str, Any]] = {}
+    
+    for item in corpus:
+        per_file[item["name"]] = {}
+        for backend in backends:
+            best = None
+            try:
+                for _ in range(repeat):
+                    run = _run_backend(backend, item["path"])
+                    total = run["open_seconds"] + run["extract_seconds"]
+                    if best is None or total < best["open_seconds"] + best["extract_seconds"]:
+                        best = run
+            except Exception as e:
+                best = {"failed": str(e)}
+            per_file[item["name"]][backend.name] = best
+    
+    summary = {}
+    for backend in backends:
+        pages = chars = errors = failed = 0
+        seconds = open_seconds = 0.0
+        quality = []
+        
+        for name, runs in per_file.items():
+            run = runs[backend.name]
+            if "failed" in run:
+                failed += 1
+                continue
+            pages += run["pages"]
+            chars += run["chars"]
+            errors += run["errors"]
+            seconds += run["open_seconds"] + run["extract_seconds"]
+            open_seconds += run["open_seconds"]
+            
+            best_chars = max(r.get("chars", 0) for r in runs.values())
+            quality.append(run["chars"] / best_chars if best_chars else 1.0)
+        
+        summary[backend.name] = {
+            "pages_per_sec": rate(pages, seconds),
+            "open_ms_per_file": round(open_seconds * 1000 / max(1, len(corpus) - failed), 3),
+            "chars_per_page": round(chars / pages, 1) if pages else None,
+            "min_quality": round(min(quality), 3) if quality else None,
+            "mean_quality": round(sum(quality) / len(quality), 3) if quality else None,
+            "page_errors": errors,
+            "failed_files": failed
+        }
+    
+    files = {
+        name: {
+            backend: {
+                "pages_per_sec": rate(run["pages"], run["open_seconds"] + run["extract_seconds"]),
+                "chars": run["chars"],
+                "errors": run["errors"]
+            } if "failed" not in run else run
+            for backend, run in runs.items()
+        }
+        for name, runs in per_file.items()
+    }
+    return {"backends": summary, "files": files}
+
+
+def bench_auto(corpus: List[Dict[str, Any]], quality_floor: float, probe_pages: int) -> Dict[str, Any]:
+    """Run the auto-selection policy over the corpus."""
+    extractor = PDFExtractor("auto", quality_floor=quality_floor, probe_pages=probe_pages)
+    choices = {}
+    pages = 0
+    seconds = 0.0
+    
+    for item in corpus:
+        start = time.perf_counter()
+        extraction = extractor.extract(item["path"])
+        seconds += time.perf_counter() - start
+        pages += len(extraction.pages)
+        choices[item["name"]] = extraction.backend
+    
+    return {
+        "pages_per_sec": rate(pages, seconds),
+        "choices": choices,
+        "stats": extractor.backend_stats()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PDF parser backends on a corpus")
+    parser.add_argument("--out", help="Write JSON report to this path (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against a previously saved report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    parser.add_argument("--corpus-dir", help="Directory of real PDFs (default: synthetic corpus)")
+    parser.add_argument("--profiles", help="Comma-separated synthetic corpus profiles")
+    parser.add_argument("--scale", type=float, default=1.0, help="Synthetic corpus page multiplier")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--backends", help="Comma-separated backends (default: all installed)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per file and backend; the best is kept")
+    parser.add_argument("--quality-floor", type=float, default=0.9)
+    parser.add_argument("--probe-pages", type=int, default=2)
+    args = parser.parse_args()
+    
+    backends = available_backends()
+    if args.backends:
+        names = args.backends.split(",")
+        backends = [BACKENDS[name] for name in names if name in BACKENDS and BACKENDS[name].is_available()]
+    if not backends:
+        raise SystemExit("No PDF parser backends are installed")
+    
+    corpus = _load_corpus(args)
+    report = {
+        "meta": build_metadata({
+            "files": len(corpus),
+            "corpus": args.corpus_dir or f"synthetic (scale {args.scale}, seed {args.seed})",
+            "repeat": args.repeat,
+            "quality_floor": args.quality_floor,
+            "probe_pages": args.probe_pages
+        }),
+        **bench_backends(backends, corpus, args.repeat),
+        "auto": bench_auto(corpus, args.quality_floor, args.probe_pages)
+    }
+    
+    exit_code = 0
+    if args.baseline:
+        comparison = compare_reports(report, load_report(args.baseline), args.tolerance)
+        report["comparison"] = comparison
+        if comparison["regressions"]:
+            print(f"Regressions: {', '.join(comparison['regressions'])}", file=sys.stderr)
+            exit_code = 1
+    
+    write_report(report, args.out)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
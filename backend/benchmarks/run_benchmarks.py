@@ -0,0 +1,322 @@
+"""
+Ingest and query benchmark runner.
+
+Generates a synthetic corpus, starts the local provider stub and drives
+PDFProcessor.process_pdf, RAGChain.add_document_chunks, RAGChain.ask_question
+and the /upload -> /ask HTTP flow of each entry point. Results are written as
+JSON and can be compared against a saved baseline.
+
+Usage (from the backend directory):
+    python -m benchmarks.run_benchmarks --out results.json
+    python -m benchmarks.run_benchmarks --baseline baseline.json --tolerance 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import importlib
+import traceback
+from typing import List, Dict, Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.common import (
+    Stopwatch, percentiles, peak_rss_mb, rate, build_metadata,
+    write_report, load_report, compare_reports
+)
+from benchmarks.corpus import generate_corpus, sample_questions, CORPUS_PROFILES
+from benchmarks.stub_server import StubConfig, StubServer
+
+
+ENTRY_POINTS = ["main", "enhanced_main", "gemini_main", "production_main", "simple_main"]
+
+
+def configure_environment(workdir: str, stub_url: str):
+    """Point every entry point at the stub provider and a scratch directory."""
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-benchmark-stub",
+        "OPENAI_API_BASE": f"{stub_url}/v1",
+        "GEMINI_API_KEY": "benchmark-stub",
+        "SECRET_KEY": "benchmark_secret_key_with_at_least_32_characters",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "VECTOR_DB_PERSIST_DIR": os.path.join(workdir, "chroma_db"),
+        "LOG_LEVEL": "WARNING",
+    })
+    os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
+
+
+def point_gemini_at_stub(stub_url: str):
+    """Reconfigure google-generativeai to use the REST transport against the stub."""
+    import google.generativeai as genai
+    
+    genai.configure(
+        api_key="benchmark-stub",
+        transport="rest",
+        client_options={"api_endpoint": stub_url}
+    )
+
+
+async def bench_extraction(settings, corpus: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Measure PDFProcessor.process_pdf throughput over the corpus."""
+    from pdf_processor import PDFProcessor
+    
+    processor = PDFProcessor(settings)
+    per_file = {}
+    chunks_by_doc = {}
+    total_pages = 0
+    total_chunks = 0
+    total_seconds = 0.0
+    
+    for item in corpus:
+        doc_id = f"bench_{item['name']}"
+        with Stopwatch() as sw:
+            chunks = await processor.process_pdf(item["path"], doc_id)
+        
+        chunks_by_doc[doc_id] = chunks
+        total_pages += item["pages"]
+        total_chunks += len(chunks)
+        total_seconds += sw.elapsed
+        per_file[item["name"]] = {
+            "pages": item["pages"],
+            "chunks": len(chunks),
+            "seconds": round(sw.elapsed, 4),
+            "pages_per_sec": rate(item["pages"], sw.elapsed),
+            "chunks_per_sec": rate(len(chunks), sw.elapsed)
+        }
+    
+    summary = {
+        "pages_per_sec": rate(total_pages, total_seconds),
+        "chunks_per_sec": rate(total_chunks, total_seconds),
+        "files": per_file
+    }
+    return summary, chunks_by_doc
+
+
+async def bench_indexing(rag_chain, chunks_by_doc: Dict[str, list], user_id: str) -> Dict[str, Any]:
+    """Measure RAGChain.add_document_chunks throughput."""
+    total_chunks = 0
+    total_seconds = 0.0
+    
+    for doc_id, chunks in chunks_by_doc.items():
+        with Stopwatch() as sw:
+            await rag_chain.add_document_chunks(chunks, doc_id, user_id)
+        total_chunks += len(chunks)
+        total_seconds += sw.elapsed
+    
+    return {
+        "chunks_per_sec": rate(total_chunks, total_seconds),
+        "documents": len(chunks_by_doc),
+        "chunks": total_chunks
+    }
+
+
+async def bench_queries(rag_chain, user_id: str, questions: List[str]) -> Dict[str, Any]:
+    """Measure time-to-first-token and total latency of RAGChain.ask_question."""
+    ttft = []
+    total = []
+    errors = 0
+    
+    for question in questions:
+        start = time.perf_counter()
+        first_token = None
+        
+        async for chunk in rag_chain.ask_question(question=question, user_id=user_id):
+            if chunk.get("type") == "token" and first_token is None:
+                first_token = time.perf_counter()
+            elif chunk.get("type") == "error":
+                errors += 1
+        
+        end = time.perf_counter()
+        if first_token is not None:
+            ttft.append((first_token - start) * 1000)
+        total.append((end - start) * 1000)
+    
+    return {
+        "ttft_ms": percentiles(ttft),
+        "total_ms": percentiles(total),
+        "errors": errors
+    }
+
+
+async def _auth_headers(client, module_name: str) -> Dict[str, str]:
+    """Register a throwaway user where the entry point enforces auth."""
+    credentials = {"email": f"bench_{int(time.time() * 1000)}@example.com", "password": "benchmark-pass"}
+    response = await client.post("/auth/register", json=credentials)
+    if response.status_code != 200:
+        response = await client.post("/auth/login", json={"email": "admin@example.com", "password": "admin123"})
+    token = response.json().get("access_token", "")
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+async def _wait_until_ready(client, headers: Dict[str, str], doc_id: str, timeout: float = 120.0):
+    """Poll /documents until background processing finishes."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = await client.get("/documents", headers=headers)
+        for doc in response.json().get("documents", []):
+            if doc.get("id") == doc_id and doc.get("status") in ("ready", "failed"):
+                return doc["status"]
+        await asyncio.sleep(0.1)
+    return "timeout"
+
+
+async def bench_http_entry_point(
+    module_name: str,
+    pdf_path: str,
+    questions: List[str],
+    stub_url: str
+) -> Dict[str, Any]:
+    """Drive /upload then /ask through an entry point's ASGI app in-process."""
+    import httpx
+    
+    module = importlib.import_module(module_name)
+    if module_name != "main" and module_name != "enhanced_main":
+        point_gemini_at_stub(stub_url)
+    
+    await module.app.router.startup()
+    
+    transport = httpx.ASGITransport(app=module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        headers = await _auth_headers(client, module_name)
+        
+        with open(pdf_path, "rb") as f:
+            content = f.read()
+        
+        with Stopwatch() as upload_sw:
+            response = await client.post(
+                "/upload",
+                files={"file": (os.path.basename(pdf_path), content, "application/pdf")},
+                headers=headers
+            )
+            response.raise_for_status()
+            doc_id = response.json().get("doc_id")
+            status = await _wait_until_ready(client, headers, doc_id)
+        
+        ttft = []
+        total = []
+        for question in questions:
+            start = time.perf_counter()
+            first_token = None
+            async with client.stream(
+                "POST", "/ask", json={"question": question, "doc_ids": [doc_id]}, headers=headers
+            ) as stream:
+                async for line in stream.aiter_lines():
+                    if first_token is None and line.startswith("data:") and '"token"' in line:
+                        first_token = time.perf_counter()
+            end = time.perf_counter()
+            if first_token is not None:
+                ttft.append((first_token - start) * 1000)
+            total.append((end - start) * 1000)
+    
+    await module.app.router.shutdown()
+    
+    return {
+        "upload_status": status,
+        "upload_to_ready_ms": round(upload_sw.elapsed * 1000, 2),
+        "ttft_ms": percentiles(ttft),
+        "total_ms": percentiles(total)
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="pdfqa_bench_")
+    stub_config = StubConfig(
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        embedding_latency_ms=args.embedding_latency_ms
+    )
+    
+    with StubServer(stub_config, port=args.stub_port) as stub:
+        configure_environment(workdir, stub.url)
+        os.chdir(workdir)
+        
+        corpus = generate_corpus(
+            os.path.join(workdir, "corpus"),
+            profiles=args.profiles,
+            scale=args.scale,
+            seed=args.seed
+        )
+        questions = sample_questions(args.questions, seed=args.seed)
+        
+        report = {
+            "meta": build_metadata({
+                "stub": stub_config.as_dict(),
+                "corpus": [{k: v for k, v in item.items() if k != "path"} for item in corpus],
+                "questions": len(questions),
+                "seed": args.seed
+            })
+        }
+        
+        from config import Settings
+        from rag_chain import RAGChain
+        
+        settings = Settings()
+        extraction, chunks_by_doc = await bench_extraction(settings, corpus)
+        report["extraction"] = extraction
+        
+        rag_chain = RAGChain(settings)
+        await rag_chain.initialize()
+        report["indexing"] = await bench_indexing(rag_chain, chunks_by_doc, "bench_user")
+        report["query"] = await bench_queries(rag_chain, "bench_user", questions)
+        
+        http_pdf = next((item["path"] for item in corpus if item["name"] == "small"), corpus[0]["path"])
+        report["http"] = {}
+        for module_name in args.entry_points:
+            try:
+                report["http"][module_name] = await bench_http_entry_point(
+                    module_name, http_pdf, questions[:args.http_questions], stub.url
+                )
+            except Exception as e:
+                traceback.print_exc()
+                report["http"][module_name] = {"error": str(e)}
+        
+        report["peak_rss_mb"] = peak_rss_mb()
+    
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF-QA ingest and query benchmarks")
+    parser.add_argument("--out", help="Write JSON report to this path (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against a previously saved report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    parser.add_argument("--profiles", nargs="+", default=list(CORPUS_PROFILES), choices=list(CORPUS_PROFILES))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply corpus page counts")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--http-questions", type=int, default=10)
+    parser.add_argument("--entry-points", nargs="+", default=ENTRY_POINTS, choices=ENTRY_POINTS)
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    
+    out_path = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    
+    report = asyncio.run(run(args))
+    
+    exit_code = 0
+    if baseline_path:
+        comparison = compare_reports(report, load_report(baseline_path), args.tolerance)
+        report["comparison"] = comparison
+        if comparison["regressions"]:
+            print(f"Regressions: {', '.join(comparison['regressions'])}", file=sys.stderr)
+            exit_code = 1
+    
+    write_report(report, out_path)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+SSE framing micro-benchmark.
+
+Streams synthetic answers over a local socket pair twice: once with the old
+one-frame-per-token framing (json.dumps per event, one write per frame) and
+once through sse.SSEWriter. Reports frames and socket writes per answer,
+bytes on the wire, CPU time per stream and time to first token, so the
+effect of coalescing and the JSON encoder can be compared on one machine.
+
+Usage (from the backend directory):
+    python -m benchmarks.sse_framing --out sse.json
+    python -m benchmarks.sse_framing --tokens 800 --token-interval-ms 2 --streams 50
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import threading
+from typing import Any, AsyncIterator, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.common import percentiles, rate, build_metadata, write_report, load_report, compare_reports
+import sse
+
+
+WORDS = (
+    "the document describes a procedure for calibrating the sensor array before each "
+    "measurement run and notes that drift above two percent requires a full reset"
+).split()
+
+
+async def synthetic_answer(tokens: int, interval: float, seed: int) -> AsyncIterator[Dict[str, Any]]:
+    """Token events like a model stream, followed by a complete event."""
+    rng = random.Random(seed)
+    answer = []
+    for _ in range(tokens):
+        if interval:
+            await asyncio.sleep(interval)
+        token = " " + rng.choice(WORDS)
+        answer.append(token)
+        yield {"type": "token", "content": token}
+    yield {
+        "type": "complete",
+        "final_response": {
+            "answer": "".join(answer),
+            "citations": [{"doc_id": "bench", "page": 1, "score": 0.9, "excerpt": " ".join(WORDS)}],
+            "latency_ms": 0,
+            "usage": {"total_tokens": tokens}
+        }
+    }
+
+
+async def per_token_frames(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Framing used before SSEWriter: one json.dumps and one frame per event."""
+    async for event in events:
+        yield f"data: {json.dumps(event)}\n\n".encode("utf-8")
+
+
+def _drain(sock: socket.socket, totals: Dict[str, int]):
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        totals["bytes"] += len(data)
+
+
+async def _stream(framer, args, seed: int) -> Dict[str, Any]:
+    """Write one answer to a socket, counting writes, bytes and CPU time."""
+    loop = asyncio.get_running_loop()
+    writer, reader = socket.socketpair()
+    writer.setblocking(False)
+    totals = {"bytes": 0}
+    drain = threading.Thread(target=_drain, args=(reader, totals), daemon=True)
+    drain.start()
+    
+    events = synthetic_answer(args.tokens, args.token_interval_ms / 1000, seed)
+    writes = 0
+    first_token = None
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        async for frame in framer(events):
+            await loop.sock_sendall(writer, frame)
+            writes += 1
+            if first_token is None and b'"token"' in frame:
+                first_token = time.perf_counter() - start
+    finally:
+        cpu_seconds = time.process_time() - cpu_start
+        writer.close()
+        drain.join()
+        reader.close()
+    
+    return {
+        "writes": writes,
+        "bytes": totals["bytes"],
+        "cpu_ms": cpu_seconds * 1000,
+        "ttft_ms": (first_token or 0.0) * 1000,
+        "seconds": time.perf_counter() - start
+    }
+
+
+async def bench_framing(name: str, framer, args) -> Dict[str, Any]:
+    runs = [await _stream(framer, args, seed) for seed in range(args.streams)]
+    seconds = sum(run["seconds"] for run in runs)
+    return {
+        "framing": name,
+        "writes_per_answer": round(sum(run["writes"] for run in runs) / len(runs), 2),
+        "bytes_per_answer": round(sum(run["bytes"] for run in runs) / len(runs), 1),
+        "cpu_ms_per_answer": round(sum(run["cpu_ms"] for run in runs) / len(runs), 3),
+        "tokens_per_sec": rate(args.tokens * len(runs), seconds),
+        "ttft_ms": percentiles([run["ttft_ms"] for run in runs])
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    def coalesced(events):
+        return sse.SSEWriter(
+            events,
+            coalesce_ms=args.coalesce_ms,
+            coalesce_bytes=args.coalesce_bytes,
+            heartbeat_seconds=args.heartbeat_seconds
+        )
+    
+    baseline = await bench_framing("per_token", per_token_frames, args)
+    current = await bench_framing("coalesced", coalesced, args)
+    return {
+        "per_token": baseline,
+        "coalesced": current,
+        "write_reduction": round(1 - current["writes_per_answer"] / baseline["writes_per_answer"], 3),
+        "cpu_reduction": round(1 - current["cpu_ms_per_answer"] / baseline["cpu_ms_per_answer"], 3)
+        if baseline["cpu_ms_per_answer"] else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-token and coalesced SSE framing")
+    parser.add_argument("--out", help="Write JSON report to this path (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against a previously saved report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    parser.add_argument("--streams", type=int, default=20, help="Answers streamed per framing")
+    parser.add_argument("--tokens", type=int, default=400, help="Tokens per answer")
+    parser.add_argument("--token-interval-ms", type=float, default=1.0, help="Delay between model tokens")
+    parser.add_argument("--coalesce-ms", type=float, default=20)
+    parser.add_argument("--coalesce-bytes", type=int, default=256)
+    parser.add_argument("--heartbeat-seconds", type=float, default=15)
+    args = parser.parse_args()
+    
+    report = {
+        "meta": build_metadata({
+            "streams": args.streams,
+            "tokens": args.tokens,
+            "token_interval_ms": args.token_interval_ms,
+            "coalesce_ms": args.coalesce_ms,
+            "coalesce_bytes": args.coalesce_bytes,
+            "json_encoder": "orjson" if sse.orjson is not None else "json"
+        }),
+        **asyncio.run(run(args))
+    }
+    
+    exit_code = 0
+    if args.baseline:
+        comparison = compare_reports(report, load_report(args.baseline), args.tolerance)
+        report["comparison"] = comparison
+        if comparison["regressions"]:
+            print(f"Regressions: {', '.join(comparison['regressions'])}", file=sys.stderr)
+            exit_code = 1
+    
+    write_report(report, args.out)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Local stand-in for the OpenAI and Gemini HTTP APIs.
+
+Implements just enough of chat completions, embeddings, streamGenerateContent
+and embedContent for the application code paths to run without live keys.
+Latency and token rates are configurable so benchmarks can model providers.
+"""
+
+import json
+import time
+import base64
+import struct
+import asyncio
+import hashlib
+import threading
+from typing import List, Any
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+
+
+class StubConfig:
+    """Latency and shape parameters for the stub provider."""
+    
+    def __init__(
+        self,
+        ttft_ms: float = 150.0,
+        tokens_per_second: float = 80.0,
+        answer_tokens: int = 120,
+        embedding_latency_ms: float = 20.0,
+        embedding_dim: int = 256
+    ):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.embedding_latency_ms = embedding_latency_ms
+        self.embedding_dim = embedding_dim
+    
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+ANSWER_WORDS = (
+    "Based on the provided context the document states that the procedure "
+    "requires inspection before installation [S1] and that calibration values "
+    "must be recorded in the maintenance schedule [S2] "
+).split()
+
+
+def _embed_text(value: Any, dim: int) -> List[float]:
+    """Hashed bag-of-words embedding so similar inputs land close together."""
+    if isinstance(value, list):
+        # OpenAI clients may send pre-tokenized input as lists of token IDs
+        features = [str(token) for token in value]
+    else:
+        features = str(value).lower().split()
+    
+    vector = [0.0] * dim
+    for feature in features:
+        digest = hashlib.md5(feature.encode()).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def _answer_tokens(count: int) -> List[str]:
+    return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(count)]
+
+
+def create_stub_app(config: StubConfig) -> FastAPI:
+    """Create the FastAPI app serving OpenAI and Gemini compatible routes."""
+    app = FastAPI(title="LLM provider stub")
+    
+    async def token_stream():
+        await asyncio.sleep(config.ttft_ms / 1000)
+        interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0
+        for index, token in enumerate(_answer_tokens(config.answer_tokens)):
+            if index and interval:
+                await asyncio.sleep(interval)
+            yield token
+    
+    # OpenAI compatible routes
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        created = int(time.time())
+        
+        if not body.get("stream"):
+            tokens = [token async for token in token_stream()]
+            return JSONResponse({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+            })
+        
+        async def events():
+            async for token in token_stream():
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        
+        await asyncio.sleep(config.embedding_latency_ms / 1000)
+        
+        data = []
+        for index, value in enumerate(inputs):
+            vector = _embed_text(value, config.embedding_dim)
+            if body.get("encoding_format") == "base64":
+                packed = struct.pack(f"<{len(vector)}f", *vector)
+                vector = base64.b64encode(packed).decode()
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        
+        return JSONResponse({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0}
+        })
+    
+    # Gemini compatible routes (REST transport)
+    
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini(model_action: str, request: Request):
+        body = await request.json()
+        _, _, action = model_action.partition(":")
+        
+        if action == "streamGenerateContent":
+            async def events():
+                async for token in token_stream():
+                    chunk = {
+                        "candidates": [{
+                            "content": {"parts": [{"text": token}], "role": "model"},
+                            "index": 0
+                        }]
+                    }
+                    yield f"data: {json.dumps(chunk)}\r\n\r\n"
+            
+            return StreamingResponse(events(), media_type="text/event-stream")
+        
+        if action == "generateContent":
+            tokens = [token async for token in token_stream()]
+            return JSONResponse({
+                "candidates": [{
+                    "content": {"parts": [{"text": "".join(tokens)}], "role": "model"},
+                    "finishReason": "STOP",
+                    "index": 0
+                }]
+            })
+        
+        await asyncio.sleep(config.embedding_latency_ms / 1000)
+        
+        if action == "embedContent":
+            text = " ".join(part.get("text", "") for part in body.get("content", {}).get("parts", []))
+            return JSONResponse({"embedding": {"values": _embed_text(text, config.embedding_dim)}})
+        
+        if action == "batchEmbedContents":
+            embeddings = []
+            for item in body.get("requests", []):
+                text = " ".join(part.get("text", "") for part in item.get("content", {}).get("parts", []))
+                embeddings.append({"values": _embed_text(text, config.embedding_dim)})
+            return JSONResponse({"embeddings": embeddings})
+        
+        return JSONResponse({"error": {"message": f"Unsupported action {action}"}}, status_code=404)
+    
+    return app
+
+
+class StubServer:
+    """Runs the stub app with uvicorn on a background thread."""
+    
+    def __init__(self, config: StubConfig, host: str = "127.0.0.1", port: int = 8765):
+        self.config = config
+        self.host = host
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(
+            create_stub_app(config),
+            host=host,
+            port=port,
+            log_level="warning"
+        ))
+        self.thread = None
+    
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+    
+    def start(self, timeout: float = 10.0):
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("Stub server did not start in time")
+            time.sleep(0.05)
+    
+    def stop(self):
+        self.server.should_exit = True
+        if self.thread:
+            self.thread.join(timeout=5)
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Run the OpenAI/Gemini stub server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    
+    uvicorn.run(
+        create_stub_app(StubConfig(
+            ttft_ms=args.ttft_ms,
+            tokens_per_second=args.tokens_per_second,
+            answer_tokens=args.answer_tokens,
+            embedding_latency_ms=args.embedding_latency_ms
+        )),
+        host="127.0.0.1",
+        port=args.port
+    )
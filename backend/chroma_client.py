@@ -0,0 +1,197 @@
+"""
+Chroma client construction and batched writes.
+
+The vector store runs in one of two modes:
+
+- embedded (default): Chroma runs inside the API process on
+  VECTOR_DB_PERSIST_DIR. Each worker process would open its own copy of the
+  index and they must not write the same directory, so this suits a single
+  worker.
+- http: the API talks to a Chroma server (the `chroma` service in
+  docker-compose), so any number of workers and replicas share one index and
+  the index is loaded once instead of once per worker.
+
+In http mode each worker keeps one pool of keep-alive connections, sized for
+the executor threads that call Chroma concurrently, with connect and read
+timeouts so a stuck server fails requests instead of hanging them. Only
+failed connection attempts are retried: nothing reached the server, so a
+retry cannot apply a write twice.
+"""
+
+import logging
+from typing import Any, Dict, List
+
+import chromadb
+import requests
+from chromadb.config import Settings as ChromaSettings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DB_MODES = ("embedded", "http")
+
+
+class _TimeoutAdapter(HTTPAdapter):
+    """Connection pool that applies default timeouts to requests made without one."""
+    
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+    
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def create_chroma_client(
+    mode: str = "embedded",
+    persist_directory: str = "./chroma_db",
+    host: str = "localhost",
+    port: int = 8000,
+    ssl: bool = False,
+    auth_token: str = "",
+    pool_size: int = 32,
+    connect_timeout: float = 3.0,
+    timeout: float = 30.0,
+    retries: int = 2
+):
+    """
+    Create the Chroma client shared by every collection a process uses.
+    
+    Args:
+        mode: "embedded" or "http"
+        persist_directory: Index directory (embedded mode)
+        host, port, ssl: Chroma server address (http mode)
+        auth_token: Bearer token for a server started with token auth
+        pool_size: Keep-alive connections kept open to the server
+        connect_timeout: Seconds to establish a connection
+        timeout: Seconds to wait for a response
+        retries: Retries of connection attempts that failed
+    
+    Returns:
+        A chromadb client to pass to langchain's Chroma(client=...)
+    """
+    if mode not in VECTOR_DB_MODES:
+        raise ValueError(f"VECTOR_DB_MODE must be one of {', '.join(VECTOR_DB_MODES)}, got {mode!r}")
+    
+    if mode == "embedded":
+        return chromadb.PersistentClient(path=persist_directory)
+    
+    # HttpClient checks the tenant and database with an unbounded request as it
+    # is constructed; a bounded heartbeat first turns a down or hung server
+    # into a prompt startup error instead of a hang
+    base_url = f"{'https' if ssl else 'http'}://{host}:{port}"
+    try:
+        requests.get(f"{base_url}/api/v1/heartbeat", timeout=(connect_timeout, timeout)).raise_for_status()
+    except requests.RequestException as e:
+        raise RuntimeError(f"Chroma server at {base_url} is not reachable: {e}") from e
+    
+    settings: Dict[str, Any] = {}
+    if auth_token:
+        settings["chroma_client_auth_provider"] = "chromadb.auth.token.TokenAuthClientProvider"
+        settings["chroma_client_auth_credentials"] = auth_token
+    
+    client = chromadb.HttpClient(
+        host=host,
+        port=str(port),
+        ssl=ssl,
+        settings=ChromaSettings(**settings)
+    )
+    
+    # chromadb sends every call through one requests.Session, whose default
+    # pool keeps 10 connections and never times out
+    adapter = _TimeoutAdapter(
+        timeout=(connect_timeout, timeout),
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=retries, connect=retries, read=0, status=0, other=0, backoff_factor=0.2)
+    )
+    session = getattr(getattr(client, "_server", None), "_session", None)
+    if not isinstance(session, requests.Session):
+        raise RuntimeError(
+            f"chromadb {chromadb.__version__} does not expose the HTTP session to configure; "
+            "use the version pinned in requirements.txt"
+        )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    
+    logger.info(f"Using Chroma server at {base_url} (pool of {pool_size})")
+    return client
+
+
+def upsert_batched(
+    collection,
+    ids: List[str],
+    embeddings: List[List[float]],
+    metadatas: List[Dict[str, Any]],
+    documents: List[str],
+    batch_size: int = 256
+) -> int:
+    """
+    Upsert in batches of at most `batch_size` records.
+    
+    Keeps each request to a Chroma server (or each embedded write) bounded
+    for large documents, and below the server's maximum batch size.
+    
+    Returns:
+        Number of batches written
+    """
+    batch_size = max(1, batch_size)
+    batches = 0
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=embeddings[start:end],
+            metadatas=metadatas[start:end],
+            documents=documents[start:end]
+        )
+        batches += 1
+    return batches
+
+
+def copy_collections(source, target, batch_size: int = 256) -> Dict[str, int]:
+    """
+    Copy every collection of one Chroma client into another.
+    
+    Records are read and upserted `batch_size` at a time with their stored
+    embeddings, so nothing is re-embedded and running the copy again only
+    rewrites the same ids.
+    
+    Returns:
+        Number of records copied per collection name
+    """
+    batch_size = max(1, batch_size)
+    copied = {}
+    for listed in source.list_collections():
+        collection = source.get_collection(listed.name, embedding_function=None)
+        destination = target.get_or_create_collection(
+            listed.name,
+            metadata=collection.metadata,
+            embedding_function=None
+        )
+        
+        copied[listed.name] = 0
+        while True:
+            page = collection.get(
+                include=["embeddings", "metadatas", "documents"],
+                limit=batch_size,
+                offset=copied[listed.name]
+            )
+            if not page["ids"]:
+                break
+            upsert_batched(
+                destination,
+                page["ids"],
+                page["embeddings"],
+                page["metadatas"],
+                page["documents"],
+                batch_size=batch_size
+            )
+            copied[listed.name] += len(page["ids"])
+        
+        logger.info(f"Copied {copied[listed.name]} records of collection {listed.name}")
+    return copied
@@ -0,0 +1,146 @@
+"""
+Single-flight coalescing of identical in-flight question streams.
+
+The first request for a key drives the underlying generator in its own task;
+identical requests that arrive while it is running attach to the same stream
+and receive every chunk emitted so far followed by the live tail. When the
+last subscriber goes away the driving task is cancelled.
+"""
+
+import re
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+
+from metrics import COALESCED_REQUESTS_TOTAL
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question for coalescing keys."""
+    return _WHITESPACE.sub(" ", question).strip().lower()
+
+
+def question_key(
+    user_id: str,
+    question: str,
+    doc_ids: Optional[List[str]],
+    k: int,
+    model: str,
+    conversation_id: Optional[str] = None
+) -> Tuple:
+    """Key identifying requests that would retrieve and generate the same answer."""
+    return (
+        user_id,
+        conversation_id,
+        tuple(sorted(doc_ids)) if doc_ids else None,
+        normalize_question(question),
+        k,
+        model
+    )
+
+
+class _Flight:
+    """One running stream plus the buffer of chunks it has emitted."""
+    
+    def __init__(self, source: AsyncIterator[Any], on_done: Callable[["_Flight"], None]):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self.task = asyncio.create_task(self._run(source))
+    
+    async def _run(self, source: AsyncIterator[Any]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            self._on_done(self)
+    
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    async def iterate(self) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            
+            await self._changed.wait()
+
+
+class Subscription:
+    """A request's view of a flight; `leader` is True for the request that started it."""
+    
+    def __init__(self, coalescer: "SingleFlight", flight: _Flight, leader: bool):
+        self._coalescer = coalescer
+        self._flight = flight
+        self.leader = leader
+    
+    async def __aiter__(self):
+        try:
+            async for chunk in self._flight.iterate():
+                yield chunk
+        finally:
+            self._coalescer._leave(self._flight)
+
+
+class SingleFlight:
+    """Coalesces concurrent streams that share a key."""
+    
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+    
+    def subscribe(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> Subscription:
+        """
+        Attach to the running stream for `key`, or start one with `factory`.
+        
+        Args:
+            key: Coalescing key, see question_key
+            factory: Creates the source stream when no flight is running
+        
+        Returns:
+            Subscription to iterate; late joiners replay chunks already emitted
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        
+        if leader:
+            flight = _Flight(factory(), lambda finished: self._finish(key, finished))
+            self._flights[key] = flight
+        
+        flight.subscribers += 1
+        COALESCED_REQUESTS_TOTAL.inc(role="leader" if leader else "follower")
+        return Subscription(self, flight, leader)
+    
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._flights
+    
+    def _finish(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+    
+    def _leave(self, flight: _Flight):
+        flight.subscribers -= 1
+        if flight.subscribers <= 0 and not flight.done:
+            flight.task.cancel()
+    
+    def __len__(self) -> int:
+        return len(self._flights)
@@ -12,11 +12,17 @@ class Settings(BaseSettings):
     
     # OpenAI Configuration
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    OPENAI_API_BASE: str = os.getenv("OPENAI_API_BASE", "")
     
     # Authentication
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your_super_secret_jwt_key_here_minimum_32_characters")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+    AUTH_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    AUTH_HASH_WORKERS: int = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+    AUTH_HASH_MAX_PENDING: int = int(os.getenv("AUTH_HASH_MAX_PENDING", "32"))
     
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./pdf_qa.db")
@@ -25,10 +31,30 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
     VECTOR_DB_PERSIST_DIR: str = os.getenv("VECTOR_DB_PERSIST_DIR", "./chroma_db")
     
+    # Vector Store: embedded (in-process, one worker) or http (a Chroma server shared by all workers)
+    VECTOR_DB_MODE: str = os.getenv("VECTOR_DB_MODE", "embedded")
+    VECTOR_DB_HOST: str = os.getenv("VECTOR_DB_HOST", "localhost")
+    VECTOR_DB_PORT: int = int(os.getenv("VECTOR_DB_PORT", "8000"))
+    VECTOR_DB_SSL: bool = os.getenv("VECTOR_DB_SSL", "false").lower() == "true"
+    VECTOR_DB_AUTH_TOKEN: str = os.getenv("VECTOR_DB_AUTH_TOKEN", "")
+    VECTOR_DB_POOL_SIZE: int = int(os.getenv("VECTOR_DB_POOL_SIZE", "32"))  # keep-alive connections per worker
+    VECTOR_DB_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("VECTOR_DB_CONNECT_TIMEOUT_SECONDS", "3"))
+    VECTOR_DB_TIMEOUT_SECONDS: float = float(os.getenv("VECTOR_DB_TIMEOUT_SECONDS", "30"))
+    VECTOR_DB_RETRIES: int = int(os.getenv("VECTOR_DB_RETRIES", "2"))  # failed connection attempts only
+    VECTOR_DB_UPSERT_BATCH_SIZE: int = int(os.getenv("VECTOR_DB_UPSERT_BATCH_SIZE", "256"))
+    
     # Rate Limiting
     MAX_FILE_SIZE_MB: int = int(os.getenv("MAX_FILE_SIZE_MB", "100"))
     MAX_FILES_PER_USER: int = int(os.getenv("MAX_FILES_PER_USER", "50"))
     RATE_LIMIT_PER_MINUTE: int = int(os.getenv("RATE_LIMIT_PER_MINUTE", "20"))
+    UPLOAD_RATE_LIMIT_PER_MINUTE: int = int(os.getenv("UPLOAD_RATE_LIMIT_PER_MINUTE", "10"))
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory or sqlite
+    RATE_LIMIT_DB_PATH: str = os.getenv("RATE_LIMIT_DB_PATH", "./rate_limits.db")
+    
+    # LLM Admission Control
+    LLM_MAX_CONCURRENT_STREAMS: int = int(os.getenv("LLM_MAX_CONCURRENT_STREAMS", "16"))
+    LLM_QUEUE_MAX: int = int(os.getenv("LLM_QUEUE_MAX", "64"))
+    LLM_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
     
     # LLM Configuration
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
@@ -36,6 +62,87 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1200"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
     RETRIEVAL_K: int = int(os.getenv("RETRIEVAL_K", "6"))
+    CONTEXT_MAX_TOKENS: int = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+    CONTEXT_DEDUP_THRESHOLD: float = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85"))
+    
+    # PDF Parsing
+    PDF_PARSER_BACKEND: str = os.getenv("PDF_PARSER_BACKEND", "auto")  # auto, pdfium, pypdf or pdfminer
+    PDF_PARSER_QUALITY_FLOOR: float = float(os.getenv("PDF_PARSER_QUALITY_FLOOR", "0.9"))
+    PDF_PARSER_PROBE_PAGES: int = int(os.getenv("PDF_PARSER_PROBE_PAGES", "2"))
+    PDF_ANALYSIS_CACHE_SIZE: int = int(os.getenv("PDF_ANALYSIS_CACHE_SIZE", "16"))
+    PDF_MIN_TEXT_CHARS: int = int(os.getenv("PDF_MIN_TEXT_CHARS", "50"))  # below this, a page with images is a scan
+    
+    # OCR of scanned pages (Tesseract, in a separate process pool)
+    OCR_ENABLED: bool = os.getenv("OCR_ENABLED", "true").lower() == "true"
+    OCR_MAX_WORKERS: int = int(os.getenv("OCR_MAX_WORKERS", "2"))
+    OCR_MAX_PENDING_PAGES: int = int(os.getenv("OCR_MAX_PENDING_PAGES", "32"))
+    OCR_LANGUAGE: str = os.getenv("OCR_LANGUAGE", "eng")
+    OCR_DPI: int = int(os.getenv("OCR_DPI", "300"))
+    OCR_PAGE_TIMEOUT_SECONDS: float = float(os.getenv("OCR_PAGE_TIMEOUT_SECONDS", "120"))
+    OCR_BATCH_PAGES: int = int(os.getenv("OCR_BATCH_PAGES", "8"))
+    
+    # Document Routing (two-stage retrieval across large libraries)
+    ROUTING_ENABLED: bool = os.getenv("ROUTING_ENABLED", "true").lower() == "true"
+    ROUTING_TOP_DOCS: int = int(os.getenv("ROUTING_TOP_DOCS", "8"))
+    
+    # Conversation Memory
+    CONVERSATION_WINDOW_TURNS: int = int(os.getenv("CONVERSATION_WINDOW_TURNS", "6"))
+    CONVERSATION_HISTORY_MAX_TOKENS: int = int(os.getenv("CONVERSATION_HISTORY_MAX_TOKENS", "1000"))
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "300"))
+    CONVERSATION_CACHE_SIZE: int = int(os.getenv("CONVERSATION_CACHE_SIZE", "1000"))
+    
+    # Document Summaries (generated in the background after ingest)
+    SUMMARY_ENABLED: bool = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+    SUMMARY_MAX_CONCURRENCY: int = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+    SUMMARY_GROUP_MAX_TOKENS: int = int(os.getenv("SUMMARY_GROUP_MAX_TOKENS", "6000"))
+    
+    # SSE framing: tokens are coalesced into one frame per window
+    SSE_COALESCE_MS: float = float(os.getenv("SSE_COALESCE_MS", "20"))
+    SSE_COALESCE_BYTES: int = int(os.getenv("SSE_COALESCE_BYTES", "256"))
+    SSE_HEARTBEAT_SECONDS: float = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+    
+    # Resumable answer streams: replay buffer per answer and how long generation
+    # continues after the client disconnects
+    ANSWER_STREAM_BUFFER_EVENTS: int = int(os.getenv("ANSWER_STREAM_BUFFER_EVENTS", "4096"))
+    ANSWER_STREAM_GRACE_SECONDS: float = float(os.getenv("ANSWER_STREAM_GRACE_SECONDS", "10"))
+    ANSWER_STREAM_RETENTION_SECONDS: float = float(os.getenv("ANSWER_STREAM_RETENTION_SECONDS", "300"))
+    ANSWER_STREAM_MAX: int = int(os.getenv("ANSWER_STREAM_MAX", "1000"))
+    
+    # Batch questions (/ask/batch): retrieval is shared, generations run this many at a time
+    ASK_BATCH_MAX_QUESTIONS: int = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "200"))
+    ASK_BATCH_MAX_CONCURRENCY: int = int(os.getenv("ASK_BATCH_MAX_CONCURRENCY", "4"))
+    ASK_BATCH_RATE_LIMIT_PER_MINUTE: int = int(os.getenv("ASK_BATCH_RATE_LIMIT_PER_MINUTE", "5"))
+    
+    # Chat socket (/ws/chat): many question streams over one authenticated connection
+    WS_AUTH_TIMEOUT_SECONDS: float = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+    WS_MAX_STREAMS_PER_CONNECTION: int = int(os.getenv("WS_MAX_STREAMS_PER_CONNECTION", "8"))
+    WS_STREAM_WINDOW_FRAMES: int = int(os.getenv("WS_STREAM_WINDOW_FRAMES", "64"))  # frames sent before credit is needed
+    WS_STREAM_BUFFER_BYTES: int = int(os.getenv("WS_STREAM_BUFFER_BYTES", "16384"))  # then the LLM stream is paused
+    WS_STREAM_STALL_SECONDS: float = float(os.getenv("WS_STREAM_STALL_SECONDS", "60"))
+    
+    # Passage search (/search): ranked chunks with offsets and highlights, no LLM call
+    SEARCH_MAX_RESULTS: int = int(os.getenv("SEARCH_MAX_RESULTS", "100"))  # deepest offset + limit served
+    SEARCH_RATE_LIMIT_PER_MINUTE: int = int(os.getenv("SEARCH_RATE_LIMIT_PER_MINUTE", "120"))
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    
+    # Coalesce identical in-flight questions into one retrieval and generation
+    ASK_COALESCING_ENABLED: bool = os.getenv("ASK_COALESCING_ENABLED", "true").lower() == "true"
+    
+    # Tracing
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACE_DB_PATH: str = os.getenv("TRACE_DB_PATH", "./traces.db")
+    TRACE_RETENTION_HOURS: float = float(os.getenv("TRACE_RETENTION_HOURS", "24"))
+    
+    # Health checks (readiness is served from the background prober's cache)
+    HEALTH_PROBE_INTERVAL_SECONDS: float = float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "15"))
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "5"))
+    HEALTH_DEEP_RATE_LIMIT_PER_MINUTE: int = int(os.getenv("HEALTH_DEEP_RATE_LIMIT_PER_MINUTE", "2"))
+    
+    # Profiling
+    LOOP_MONITOR_ENABLED: bool = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+    LOOP_LAG_INTERVAL_MS: float = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+    LOOP_STALL_THRESHOLD_MS: float = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "250"))
+    PROFILER_MAX_SECONDS: float = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
     
     # Development
     DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
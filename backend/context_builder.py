@@ -0,0 +1,198 @@
+"""
+Token-budgeted context packing for the RAG prompt.
+
+Retrieved chunks from the same page are merged where they overlap or abut,
+near-duplicate passages are dropped, and the remainder is packed by relevance
+score into a hard token budget measured with the model's tiktoken encoding.
+Passages are numbered [S1], [S2], ... in packing order, and citations are
+built from the same list so the mapping stays consistent.
+"""
+
+import re
+from typing import List, Dict, Any, Tuple
+
+import tiktoken
+from langchain.schema import Document
+
+from metrics import CONTEXT_TOKENS, CONTEXT_PASSAGES_DROPPED_TOTAL
+
+
+_WORD = re.compile(r"\w+")
+
+
+class ContextPassage:
+    """A packed passage: one or more merged chunks from the same page."""
+    
+    __slots__ = ("text", "metadata", "score", "tokens", "chunk_ids")
+    
+    def __init__(self, text: str, metadata: Dict[str, Any], score: float, chunk_ids: List[str]):
+        self.text = text
+        self.metadata = metadata
+        self.score = score
+        self.tokens = 0
+        self.chunk_ids = chunk_ids
+
+
+def _overlap_length(left: str, right: str, window: int, min_overlap: int = 16) -> int:
+    """
+    Length of the longest suffix of `left` that is a prefix of `right`.
+    
+    Only the last `window` chars of `left` are searched, and overlaps shorter
+    than `min_overlap` are treated as coincidental.
+    """
+    probe = right[:min_overlap]
+    if len(probe) < min_overlap:
+        return 0
+    
+    start = max(0, len(left) - window)
+    index = left.find(probe, start)
+    while index != -1:
+        overlap = len(left) - index
+        if right.startswith(left[index:]):
+            return overlap
+        index = left.find(probe, index + 1)
+    return 0
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class ContextBuilder:
+    """Builds the prompt context from retrieved chunks within a token budget."""
+    
+    def __init__(
+        self,
+        model: str,
+        max_tokens: int = 3000,
+        dedup_threshold: float = 0.85,
+        overlap_window: int = 400
+    ):
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.overlap_window = overlap_window
+        
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+    
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+    
+    def build(self, docs: List[Document]) -> Tuple[str, List[ContextPassage]]:
+        """
+        Merge, deduplicate and pack retrieved chunks.
+        
+        Args:
+            docs: Retrieved chunks; `metadata["score"]` is used for ranking when present
+        
+        Returns:
+            Tuple of the formatted context and the packed passages in [S#] order
+        """
+        passages = self._merge_adjacent(docs)
+        passages = self._drop_near_duplicates(passages)
+        packed = self._pack(passages)
+        
+        context = "\n\n".join(self._format_passage(i, p) for i, p in enumerate(packed, 1))
+        CONTEXT_TOKENS.observe(sum(p.tokens for p in packed))
+        return context, packed
+    
+    def _prefix(self, index: int, metadata: Dict[str, Any]) -> str:
+        return f"[S{index}] (Page {metadata.get('page', 'Unknown')}): "
+    
+    def _format_passage(self, index: int, passage: ContextPassage) -> str:
+        return self._prefix(index, passage.metadata) + passage.text
+    
+    def _merge_adjacent(self, docs: List[Document]) -> List[ContextPassage]:
+        """Merge chunks from the same page whose text overlaps or whose offsets abut."""
+        groups: Dict[Tuple[Any, Any], List[Document]] = {}
+        for doc in docs:
+            key = (doc.metadata.get("doc_id"), doc.metadata.get("page"))
+            groups.setdefault(key, []).append(doc)
+        
+        passages = []
+        for group in groups.values():
+            group.sort(key=lambda d: (d.metadata.get("char_start") or 0))
+            
+            current = None
+            for doc in group:
+                score = doc.metadata.get("score", 0.0)
+                chunk_id = doc.metadata.get("chunk_id", "")
+                
+                if current is not None:
+                    overlap = _overlap_length(current.text, doc.page_content, self.overlap_window)
+                    char_start = doc.metadata.get("char_start")
+                    abuts = (
+                        overlap == 0
+                        and char_start is not None
+                        and char_start > 0
+                        and char_start == current.metadata.get("char_end")
+                    )
+                    if overlap or abuts:
+                        joiner = "" if overlap else " "
+                        current.text = current.text + joiner + doc.page_content[overlap:]
+                        current.metadata["char_end"] = doc.metadata.get("char_end")
+                        current.score = max(current.score, score)
+                        current.chunk_ids.append(chunk_id)
+                        CONTEXT_PASSAGES_DROPPED_TOTAL.inc(reason="merged")
+                        continue
+                    passages.append(current)
+                
+                current = ContextPassage(doc.page_content, dict(doc.metadata), score, [chunk_id])
+            
+            if current is not None:
+                passages.append(current)
+        
+        return passages
+    
+    def _drop_near_duplicates(self, passages: List[ContextPassage]) -> List[ContextPassage]:
+        """Keep the best-scoring passage of any group whose shingle Jaccard similarity exceeds the threshold."""
+        kept: List[Tuple[ContextPassage, set]] = []
+        for passage in sorted(passages, key=lambda p: p.score, reverse=True):
+            shingles = _shingles(passage.text)
+            duplicate = False
+            for _, other in kept:
+                union = len(shingles | other)
+                if union and len(shingles & other) / union >= self.dedup_threshold:
+                    duplicate = True
+                    break
+            
+            if duplicate:
+                CONTEXT_PASSAGES_DROPPED_TOTAL.inc(reason="duplicate")
+                continue
+            kept.append((passage, shingles))
+        
+        return [passage for passage, _ in kept]
+    
+    def _pack(self, passages: List[ContextPassage]) -> List[ContextPassage]:
+        """Greedily pack passages, already sorted by score, into the token budget."""
+        packed = []
+        used = 0
+        
+        for passage in passages:
+            # Account for the "[S#] (Page n): " prefix and the blank-line separator
+            overhead = self.count_tokens(self._prefix(len(packed) + 1, passage.metadata)) + 1
+            passage.tokens = self.count_tokens(passage.text) + overhead
+            
+            if used + passage.tokens <= self.max_tokens:
+                packed.append(passage)
+                used += passage.tokens
+                continue
+            
+            if not packed:
+                # Never return an empty context: truncate the best passage to fit
+                budget = max(0, self.max_tokens - overhead)
+                tokens = self.encoding.encode(passage.text, disallowed_special=())[:budget]
+                passage.text = self.encoding.decode(tokens)
+                passage.tokens = len(tokens) + overhead
+                packed.append(passage)
+                used += passage.tokens
+                continue
+            
+            CONTEXT_PASSAGES_DROPPED_TOTAL.inc(reason="budget")
+        
+        return packed
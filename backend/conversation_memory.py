@@ -0,0 +1,243 @@
+"""
+Server-side conversation memory for multi-turn chat.
+
+Each conversation keeps an in-process window of its most recent messages and
+a rolling summary of everything older. Messages are appended to the window
+immediately and written to the database in the background, in order, so the
+answer stream never waits on storage. When the window overflows, the evicted
+turns are folded into the summary by a background task; until that finishes
+they remain in the window and are used as raw history if the budget allows.
+
+The database is the source of truth: several workers may serve the same
+conversation, so before a cached window is used its message count and
+summary coverage are checked against the stored ones, and it is reloaded
+when another worker has recorded turns or summarized further.
+"""
+
+import asyncio
+import logging
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from database import DatabaseManager
+from metrics import CONVERSATION_HISTORY_TOKENS
+
+
+logger = logging.getLogger(__name__)
+
+
+class _ConversationState:
+    """Cached view of one conversation."""
+    
+    def __init__(self, user_id: str, summary: str, summarized_count: int, recent: List[Dict[str, str]]):
+        self.user_id = user_id
+        self.summary = summary
+        # Messages covered by the summary; `recent` holds everything after them
+        self.summarized_count = summarized_count
+        self.recent = recent
+        # Messages in `recent` whose background write has not finished
+        self.unsaved = 0
+        self.summarizing = False
+
+
+class ConversationMemory:
+    """Windowed conversation history with asynchronous persistence and summarization."""
+    
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        summarizer: Callable[[str, List[Dict[str, str]], int], Awaitable[str]],
+        count_tokens: Callable[[str], int],
+        window_turns: int = 6,
+        history_max_tokens: int = 1000,
+        summary_max_tokens: int = 300,
+        max_conversations: int = 1000
+    ):
+        """
+        Args:
+            db_manager: Storage for messages and summaries
+            summarizer: Coroutine (previous_summary, messages, max_tokens) -> new summary
+            count_tokens: Token counter matching the LLM's encoding
+            window_turns: Question/answer pairs kept verbatim before summarizing
+            history_max_tokens: Budget for summary plus recent turns in the prompt
+            summary_max_tokens: Target length of the rolling summary
+            max_conversations: Conversations kept in the in-process cache
+        """
+        self.db_manager = db_manager
+        self.summarizer = summarizer
+        self.count_tokens = count_tokens
+        self.window_messages = window_turns * 2
+        self.history_max_tokens = history_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.max_conversations = max_conversations
+        self._states: "OrderedDict[str, _ConversationState]" = OrderedDict()
+        # One write lock per conversation, cached or not, kept while anything holds it
+        self._write_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._tasks: Set[asyncio.Task] = set()
+    
+    async def get_history(self, conversation_id: str, user_id: str) -> Optional[str]:
+        """
+        Prompt-ready history for a conversation.
+        
+        Returns:
+            Formatted history (empty for a new conversation), or None if the
+            conversation does not exist or belongs to another user
+        """
+        state = await self._load(conversation_id)
+        if state is None or state.user_id != user_id:
+            return None
+        return self._format(state)
+    
+    def record_exchange(self, conversation_id: str, question: str, final_response: Dict[str, Any]):
+        """Append a question and answer to the window and persist them in the background."""
+        state = self._states.get(conversation_id)
+        messages = [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": final_response.get("answer", "")}
+        ]
+        if state is not None:
+            state.recent.extend(messages)
+            state.unsaved += len(messages)
+            self._states.move_to_end(conversation_id)
+        
+        self._spawn(self._persist(conversation_id, state, question, final_response))
+        
+        if state is not None and len(state.recent) > self.window_messages and not state.summarizing:
+            state.summarizing = True
+            self._spawn(self._summarize(conversation_id, state))
+    
+    async def drain(self):
+        """Wait for pending writes and summaries, e.g. on shutdown."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+    
+    def _write_lock(self, conversation_id: str) -> asyncio.Lock:
+        lock = self._write_locks.get(conversation_id)
+        if lock is None:
+            lock = self._write_locks[conversation_id] = asyncio.Lock()
+        return lock
+    
+    async def _is_current(self, conversation_id: str, state: _ConversationState) -> bool:
+        """Whether a cached state still matches the database, once this worker's own writes are done."""
+        async with self._write_lock(conversation_id):
+            version = await self.db_manager.get_conversation_version(conversation_id)
+        # A local summary may be ahead of the stored one while it is being saved
+        return (
+            version["message_count"] + state.unsaved == state.summarized_count + len(state.recent)
+            and version["summarized_count"] <= state.summarized_count
+        )
+    
+    async def _load(self, conversation_id: str) -> Optional[_ConversationState]:
+        state = self._states.get(conversation_id)
+        if state is not None:
+            if await self._is_current(conversation_id, state):
+                self._states.move_to_end(conversation_id)
+                return state
+            # Another worker recorded turns or summarized; read it again
+            if self._states.get(conversation_id) is state:
+                del self._states[conversation_id]
+        
+        conversation = await self.db_manager.get_conversation(conversation_id)
+        if conversation is None:
+            return None
+        
+        summary_row = await self.db_manager.get_conversation_summary(conversation_id)
+        summary = summary_row["summary"] if summary_row else ""
+        summarized_count = summary_row["summarized_count"] if summary_row else 0
+        
+        # Only read what the summary does not cover
+        rows = await self.db_manager.get_conversation_messages(conversation_id, offset=summarized_count)
+        recent = [{"role": row["role"], "content": row["content"]} for row in rows]
+        state = _ConversationState(conversation["user_id"], summary, summarized_count, recent)
+        
+        # Another coroutine may have loaded it while this one awaited
+        existing = self._states.get(conversation_id)
+        if existing is not None:
+            return existing
+        
+        self._states[conversation_id] = state
+        while len(self._states) > self.max_conversations:
+            self._states.popitem(last=False)
+        
+        if len(state.recent) > self.window_messages:
+            state.summarizing = True
+            self._spawn(self._summarize(conversation_id, state))
+        
+        return state
+    
+    def _format(self, state: _ConversationState) -> str:
+        """Summary plus as many recent messages as fit in the history budget, newest kept first."""
+        budget = self.history_max_tokens
+        parts = []
+        
+        if state.summary:
+            summary = f"Summary of earlier conversation: {state.summary}"
+            budget -= self.count_tokens(summary)
+            parts.append(summary)
+        
+        lines = []
+        for message in reversed(state.recent):
+            speaker = "User" if message["role"] == "user" else "Assistant"
+            line = f"{speaker}: {message['content']}"
+            tokens = self.count_tokens(line)
+            if tokens > budget:
+                break
+            budget -= tokens
+            lines.append(line)
+        
+        parts.extend(reversed(lines))
+        history = "\n".join(parts)
+        CONVERSATION_HISTORY_TOKENS.observe(self.history_max_tokens - budget)
+        return history
+    
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _persist(
+        self,
+        conversation_id: str,
+        state: Optional[_ConversationState],
+        question: str,
+        final_response: Dict[str, Any]
+    ):
+        async with self._write_lock(conversation_id):
+            try:
+                await self.db_manager.add_message(conversation_id, "user", question)
+                await self.db_manager.add_message(
+                    conversation_id,
+                    "assistant",
+                    final_response.get("answer", ""),
+                    citations=final_response.get("citations"),
+                    latency_ms=final_response.get("latency_ms"),
+                    token_usage=final_response.get("usage")
+                )
+            except Exception as e:
+                logger.error(f"Error saving messages for conversation {conversation_id}: {e}")
+            finally:
+                # A failed write leaves the cache ahead of the database, so it is reloaded
+                if state is not None:
+                    state.unsaved -= 2
+    
+    async def _summarize(self, conversation_id: str, state: _ConversationState):
+        """Fold messages beyond the window into the rolling summary."""
+        try:
+            # Fold in bounded batches so a long backlog never becomes one huge prompt
+            while len(state.recent) > self.window_messages:
+                batch = min(len(state.recent) - self.window_messages, 2 * self.window_messages)
+                overflow = state.recent[:batch]
+                
+                summary = await self.summarizer(state.summary, overflow, self.summary_max_tokens)
+                
+                # New messages are only ever appended, so the overflow is still at the front
+                state.summary = summary
+                state.summarized_count += batch
+                del state.recent[:batch]
+                
+                await self.db_manager.save_conversation_summary(conversation_id, summary, state.summarized_count)
+        except Exception as e:
+            logger.error(f"Error summarizing conversation {conversation_id}: {e}")
+        finally:
+            state.summarizing = False
@@ -11,6 +11,7 @@ import json
 import os
 
 from models import Document, DocumentStatus, User, UserCreate, UserRole
+from metrics import timed_db_call
 
 
 class DatabaseManager:
@@ -24,6 +25,7 @@ class DatabaseManager:
         else:
             self.db_path = "pdf_qa.db"
     
+    @timed_db_call("init_db")
     async def init_db(self):
         """Initialize database with required tables."""
         try:
@@ -61,6 +63,30 @@ class DatabaseManager:
                     )
                 """)
                 
+                # Add columns to documents tables created before they existed
+                cursor = await db.execute("PRAGMA table_info(documents)")
+                columns = {row[1] for row in await cursor.fetchall()}
+                for column, definition in (
+                    ("summary", "TEXT"),
+                    ("summary_status", "TEXT"),
+                    ("summary_updated_at", "TIMESTAMP"),
+                    ("version", "INTEGER DEFAULT 1"),
+                ):
+                    if column not in columns:
+                        await db.execute(f"ALTER TABLE documents ADD COLUMN {column} {definition}")
+                
+                # Create document pages table (fingerprints for incremental re-ingest)
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS document_pages (
+                        doc_id TEXT NOT NULL,
+                        page INTEGER NOT NULL,
+                        fingerprint TEXT NOT NULL,
+                        chunk_ids TEXT NOT NULL, -- JSON string
+                        PRIMARY KEY (doc_id, page),
+                        FOREIGN KEY (doc_id) REFERENCES documents (id)
+                    )
+                """)
+                
                 # Create conversations table
                 await db.execute("""
                     CREATE TABLE IF NOT EXISTS conversations (
@@ -88,6 +114,17 @@ class DatabaseManager:
                     )
                 """)
                 
+                # Create conversation summaries table
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS conversation_summaries (
+                        conversation_id TEXT PRIMARY KEY,
+                        summary TEXT NOT NULL,
+                        summarized_count INTEGER NOT NULL,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+                    )
+                """)
+                
                 # Create jobs table
                 await db.execute("""
                     CREATE TABLE IF NOT EXISTS jobs (
@@ -104,11 +141,102 @@ class DatabaseManager:
                 
                 await db.commit()
                 print("Database initialized successfully")
-                
+        
         except Exception as e:
             print(f"Database initialization error: {e}")
             raise
     
+    @timed_db_call("ping")
+    async def ping(self) -> Dict[str, Any]:
+        """Cheap connectivity check for health probes."""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("SELECT 1")
+            await cursor.fetchone()
+        return {}
+    
+    @timed_db_call("create_user")
+    async def create_user(
+        self,
+        email: str,
+        password_hash: str,
+        role: UserRole = UserRole.USER
+    ) -> User:
+        """Create a new user record."""
+        user_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                INSERT INTO users (id, email, password_hash, role, is_active, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (user_id, email, password_hash, role.value, True, now))
+            await db.commit()
+        
+        return User(
+            id=user_id,
+            email=email,
+            role=role,
+            is_active=True,
+            created_at=now
+        )
+    
+    @timed_db_call("get_user_by_email")
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Get a user and password hash by email."""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT * FROM users WHERE email = ?
+            """, (email,))
+            row = await cursor.fetchone()
+            
+            if row:
+                return {
+                    "user": self._row_to_user(row),
+                    "password_hash": row["password_hash"]
+                }
+            return None
+    
+    @timed_db_call("get_user")
+    async def get_user(self, user_id: str) -> Optional[User]:
+        """Get user by ID."""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT * FROM users WHERE id = ?
+            """, (user_id,))
+            row = await cursor.fetchone()
+            
+            return self._row_to_user(row) if row else None
+    
+    @timed_db_call("update_user")
+    async def update_user(
+        self,
+        user_id: str,
+        role: Optional[UserRole] = None,
+        is_active: Optional[bool] = None
+    ) -> Optional[User]:
+        """Update a user's role and/or active flag."""
+        async with aiosqlite.connect(self.db_path) as db:
+            if role is not None:
+                await db.execute("UPDATE users SET role = ? WHERE id = ?", (role.value, user_id))
+            if is_active is not None:
+                await db.execute("UPDATE users SET is_active = ? WHERE id = ?", (is_active, user_id))
+            await db.commit()
+        
+        return await self.get_user(user_id)
+    
+    def _row_to_user(self, row) -> User:
+        """Convert a users row to a User model."""
+        return User(
+            id=row["id"],
+            email=row["email"],
+            role=UserRole(row["role"]),
+            is_active=bool(row["is_active"]),
+            created_at=datetime.fromisoformat(row["created_at"].replace('Z', '+00:00')) if row["created_at"] else datetime.utcnow()
+        )
+    
+    @timed_db_call("create_document")
     async def create_document(
         self, 
         name: str, 
@@ -139,6 +267,7 @@ class DatabaseManager:
             updated_at=now
         )
     
+    @timed_db_call("get_document")
     async def get_document(self, doc_id: str) -> Optional[Document]:
         """Get document by ID."""
         async with aiosqlite.connect(self.db_path) as db:
@@ -158,12 +287,14 @@ class DatabaseManager:
                     status=DocumentStatus(row["status"]),
                     page_count=row["page_count"],
                     chunk_count=row["chunk_count"],
+                    version=row["version"] or 1,
                     error=row["error"],
                     created_at=datetime.fromisoformat(row["created_at"].replace('Z', '+00:00')) if row["created_at"] else datetime.utcnow(),
                     updated_at=datetime.fromisoformat(row["updated_at"].replace('Z', '+00:00')) if row["updated_at"] else datetime.utcnow()
                 )
             return None
     
+    @timed_db_call("get_user_documents")
     async def get_user_documents(self, user_id: str) -> List[Document]:
         """Get all documents for a user."""
         documents = []
@@ -187,6 +318,7 @@ class DatabaseManager:
                     status=DocumentStatus(row["status"]),
                     page_count=row["page_count"],
                     chunk_count=row["chunk_count"],
+                    version=row["version"] or 1,
                     error=row["error"],
                     created_at=datetime.fromisoformat(row["created_at"].replace('Z', '+00:00')) if row["created_at"] else datetime.utcnow(),
                     updated_at=datetime.fromisoformat(row["updated_at"].replace('Z', '+00:00')) if row["updated_at"] else datetime.utcnow()
@@ -194,6 +326,17 @@ class DatabaseManager:
         
         return documents
     
+    @timed_db_call("count_user_documents")
+    async def count_user_documents(self, user_id: str) -> int:
+        """Count documents owned by a user."""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("""
+                SELECT COUNT(*) FROM documents WHERE user_id = ?
+            """, (user_id,))
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+    
+    @timed_db_call("update_document_status")
     async def update_document_status(
         self, 
         doc_id: str, 
@@ -220,12 +363,87 @@ class DatabaseManager:
                 """, (status, error, now, doc_id))
             await db.commit()
     
+    @timed_db_call("update_document_summary")
+    async def update_document_summary(self, doc_id: str, status: str, summary: Optional[str] = None):
+        """Store a document's summary and its generation status (pending, ready, failed or disabled)."""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                UPDATE documents
+                SET summary = ?, summary_status = ?, summary_updated_at = ?
+                WHERE id = ?
+            """, (summary, status, datetime.utcnow(), doc_id))
+            await db.commit()
+    
+    @timed_db_call("get_document_summary")
+    async def get_document_summary(self, doc_id: str) -> Optional[Dict]:
+        """Get a document's stored summary and its generation status."""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT summary, summary_status, summary_updated_at FROM documents
+                WHERE id = ?
+            """, (doc_id,))
+            row = await cursor.fetchone()
+            
+            if row:
+                return {
+                    "summary": row["summary"],
+                    "status": row["summary_status"],
+                    "updated_at": row["summary_updated_at"]
+                }
+            return None
+    
+    @timed_db_call("start_document_version")
+    async def start_document_version(self, doc_id: str, name: str, size: int) -> int:
+        """Record a new uploaded version of a document and return its version number."""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                UPDATE documents
+                SET name = ?, size = ?, version = COALESCE(version, 1) + 1, status = ?, error = NULL, updated_at = ?
+                WHERE id = ?
+            """, (name, size, "processing", datetime.utcnow(), doc_id))
+            cursor = await db.execute("SELECT version FROM documents WHERE id = ?", (doc_id,))
+            row = await cursor.fetchone()
+            await db.commit()
+            return row[0]
+    
+    @timed_db_call("get_document_pages")
+    async def get_document_pages(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Get the stored page fingerprints and chunk IDs of a document, in page order."""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT page, fingerprint, chunk_ids FROM document_pages
+                WHERE doc_id = ?
+                ORDER BY page
+            """, (doc_id,))
+            rows = await cursor.fetchall()
+            
+            return [
+                {"page": row["page"], "fingerprint": row["fingerprint"], "chunk_ids": json.loads(row["chunk_ids"])}
+                for row in rows
+            ]
+    
+    @timed_db_call("replace_document_pages")
+    async def replace_document_pages(self, doc_id: str, pages: List[Dict[str, Any]]):
+        """Replace a document's page fingerprints in a single transaction."""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("DELETE FROM document_pages WHERE doc_id = ?", (doc_id,))
+            await db.executemany("""
+                INSERT INTO document_pages (doc_id, page, fingerprint, chunk_ids)
+                VALUES (?, ?, ?, ?)
+            """, [(doc_id, p["page"], p["fingerprint"], json.dumps(p["chunk_ids"])) for p in pages])
+            await db.commit()
+    
+    @timed_db_call("delete_document")
     async def delete_document(self, doc_id: str):
         """Delete document record."""
         async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("DELETE FROM document_pages WHERE doc_id = ?", (doc_id,))
             await db.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
             await db.commit()
     
+    @timed_db_call("create_conversation")
     async def create_conversation(self, user_id: str, title: str) -> str:
         """Create a new conversation."""
         conv_id = str(uuid.uuid4())
@@ -240,6 +458,7 @@ class DatabaseManager:
         
         return conv_id
     
+    @timed_db_call("add_message")
     async def add_message(
         self, 
         conversation_id: str, 
@@ -266,8 +485,34 @@ class DatabaseManager:
         
         return msg_id
     
-    async def get_conversation_messages(self, conversation_id: str) -> List[Dict]:
-        """Get all messages in a conversation."""
+    @timed_db_call("get_conversation")
+    async def get_conversation(self, conversation_id: str) -> Optional[Dict]:
+        """Get conversation by ID."""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT * FROM conversations WHERE id = ?
+            """, (conversation_id,))
+            row = await cursor.fetchone()
+            
+            if row:
+                return {
+                    "id": row["id"],
+                    "user_id": row["user_id"],
+                    "title": row["title"],
+                    "created_at": row["created_at"],
+                    "updated_at": row["updated_at"]
+                }
+            return None
+    
+    @timed_db_call("get_conversation_messages")
+    async def get_conversation_messages(
+        self,
+        conversation_id: str,
+        offset: int = 0,
+        limit: int = None
+    ) -> List[Dict]:
+        """Get messages in a conversation, oldest first, optionally a slice of them."""
         messages = []
         
         async with aiosqlite.connect(self.db_path) as db:
@@ -276,7 +521,8 @@ class DatabaseManager:
                 SELECT * FROM messages 
                 WHERE conversation_id = ? 
                 ORDER BY created_at ASC
-            """, (conversation_id,))
+                LIMIT ? OFFSET ?
+            """, (conversation_id, limit if limit is not None else -1, offset))
             rows = await cursor.fetchall()
             
             for row in rows:
@@ -294,6 +540,45 @@ class DatabaseManager:
         
         return messages
     
+    @timed_db_call("get_conversation_summary")
+    async def get_conversation_summary(self, conversation_id: str) -> Optional[Dict]:
+        """Get the rolling summary of a conversation's older messages."""
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT summary, summarized_count FROM conversation_summaries
+                WHERE conversation_id = ?
+            """, (conversation_id,))
+            row = await cursor.fetchone()
+            
+            if row:
+                return {"summary": row["summary"], "summarized_count": row["summarized_count"]}
+            return None
+    
+    @timed_db_call("get_conversation_version")
+    async def get_conversation_version(self, conversation_id: str) -> Dict[str, int]:
+        """Stored message count and summary coverage, to tell whether a cached view is current."""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM messages WHERE conversation_id = ?),
+                    (SELECT summarized_count FROM conversation_summaries WHERE conversation_id = ?)
+            """, (conversation_id, conversation_id))
+            message_count, summarized_count = await cursor.fetchone()
+            return {"message_count": message_count, "summarized_count": summarized_count or 0}
+    
+    @timed_db_call("save_conversation_summary")
+    async def save_conversation_summary(self, conversation_id: str, summary: str, summarized_count: int):
+        """Store the rolling summary covering the first `summarized_count` messages."""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO conversation_summaries
+                (conversation_id, summary, summarized_count, updated_at)
+                VALUES (?, ?, ?, ?)
+            """, (conversation_id, summary, summarized_count, datetime.utcnow()))
+            await db.commit()
+    
+    @timed_db_call("create_job")
     async def create_job(self, job_type: str, data: Dict = None) -> str:
         """Create a background job."""
         job_id = str(uuid.uuid4())
@@ -309,6 +594,7 @@ class DatabaseManager:
         
         return job_id
     
+    @timed_db_call("update_job_status")
     async def update_job_status(self, job_id: str, status: str, error: str = None):
         """Update job status."""
         now = datetime.utcnow()
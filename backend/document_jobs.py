@@ -0,0 +1,37 @@
+"""
+Per-document background tasks.
+
+Work that runs after an upload has been answered (summaries, OCR of scanned
+pages) is tracked by document so that re-ingest or delete can cancel it.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Dict
+
+
+class DocumentJobs:
+    """Tracks one background task per document."""
+    
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+    
+    def schedule(self, doc_id: str, coroutine: Awaitable[Any]) -> asyncio.Task:
+        """Start a task, cancelling any still running for the same document."""
+        self.cancel(doc_id)
+        task = asyncio.create_task(coroutine)
+        self._tasks[doc_id] = task
+        task.add_done_callback(lambda finished: self._forget(doc_id, finished))
+        return task
+    
+    def cancel(self, doc_id: str):
+        task = self._tasks.pop(doc_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+    
+    def cancel_all(self):
+        for doc_id in list(self._tasks):
+            self.cancel(doc_id)
+    
+    def _forget(self, doc_id: str, task: asyncio.Task):
+        if self._tasks.get(doc_id) is task:
+            del self._tasks[doc_id]
@@ -0,0 +1,184 @@
+"""
+Document summaries generated once, in the background, after ingest.
+
+Short documents are summarized in a single call. Larger ones use map-reduce:
+consecutive pages are grouped up to a token budget, each group is summarized
+in parallel under a shared concurrency limit, and the partial summaries are
+reduced (recursively if needed) into the final summary. The summarizer only
+needs an async `generate(prompt) -> str`, so both the OpenAI and the Gemini
+entry points can use it.
+"""
+
+import re
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from metrics import DOCUMENT_SUMMARY_SECONDS, SUMMARY_LLM_CALLS_TOTAL
+
+_PAGE_MARKER = re.compile(r"\n--- Page (\d+) ---\n")
+
+SINGLE_PROMPT = """Summarize the following document in at most {words} words. Cover its purpose, main topics and key facts or figures. Use plain prose.
+
+DOCUMENT:
+{text}
+
+SUMMARY:"""
+
+MAP_PROMPT = """Summarize pages {first_page}-{last_page} of a longer document in at most {words} words. Keep key facts, figures and named entities.
+
+PAGES:
+{text}
+
+SUMMARY:"""
+
+REDUCE_PROMPT = """The following are summaries of consecutive sections of one document. Combine them into a single summary of at most {words} words covering the document's purpose, main topics and key facts or figures.
+
+SECTION SUMMARIES:
+{text}
+
+SUMMARY:"""
+
+
+def approximate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) when no tokenizer is available."""
+    return len(text) // 4 + 1
+
+
+def split_page_markers(text: str) -> List[Tuple[int, str]]:
+    """Split text produced with '--- Page N ---' markers back into (page, text) pairs."""
+    parts = _PAGE_MARKER.split(text)
+    # parts = [preamble, page, text, page, text, ...]
+    return [(int(parts[i]), parts[i + 1].strip()) for i in range(1, len(parts) - 1, 2) if parts[i + 1].strip()]
+
+
+def join_page_markers(pages: Dict[int, str]) -> str:
+    """Inverse of split_page_markers: join page texts in page order with '--- Page N ---' markers."""
+    return "".join(f"\n--- Page {page} ---\n{pages[page]}" for page in sorted(pages))
+
+
+class DocumentSummarizer:
+    """Map-reduce summarizer with bounded parallelism."""
+    
+    def __init__(
+        self,
+        generate: Callable[[str], Awaitable[str]],
+        count_tokens: Callable[[str], int] = approximate_tokens,
+        group_max_tokens: int = 6000,
+        max_concurrency: int = 4,
+        summary_words: int = 200
+    ):
+        self.generate = generate
+        self.count_tokens = count_tokens
+        self.group_max_tokens = group_max_tokens
+        self.summary_words = summary_words
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def summarize(self, pages: List[Tuple[int, str]]) -> Dict[str, Any]:
+        """
+        Summarize a document.
+        
+        Args:
+            pages: (page number, text) pairs in page order
+        
+        Returns:
+            Dictionary with the summary, the method used and the number of page groups
+        """
+        groups = self._group_pages(pages)
+        if not groups:
+            raise ValueError("Document has no text to summarize")
+        
+        if len(groups) == 1:
+            with DOCUMENT_SUMMARY_SECONDS.time(method="single"):
+                summary = await self._call("single", SINGLE_PROMPT.format(
+                    words=self.summary_words,
+                    text=self._join(groups[0])
+                ))
+            return {"summary": summary, "method": "single", "page_groups": 1}
+        
+        with DOCUMENT_SUMMARY_SECONDS.time(method="map_reduce"):
+            partials = await asyncio.gather(*[
+                self._call("map", MAP_PROMPT.format(
+                    first_page=group[0][0],
+                    last_page=group[-1][0],
+                    words=self.summary_words,
+                    text=self._join(group)
+                ))
+                for group in groups
+            ])
+            summary = await self._reduce(list(partials))
+        
+        return {"summary": summary, "method": "map_reduce", "page_groups": len(groups)}
+    
+    async def _reduce(self, partials: List[str]) -> str:
+        """
+        Combine partial summaries, reducing in batches while they exceed the group budget.
+        
+        Every round must leave fewer partials; when batching would not (each
+        partial fills a batch on its own), the partials are cut to an equal
+        share of one budget and combined in a final call.
+        """
+        while True:
+            partials = [partial for partial in partials if partial.strip()]
+            if len(partials) < 2:
+                return partials[0] if partials else ""
+            
+            batches = self._group_pages(list(enumerate(partials, 1)))
+            if len(batches) >= len(partials):
+                share = max(1, self.group_max_tokens // len(partials))
+                batches = [[(index, self._truncate(partial, share)) for index, partial in enumerate(partials, 1)]]
+            
+            if len(batches) == 1:
+                return await self._call("reduce", REDUCE_PROMPT.format(
+                    words=self.summary_words,
+                    text="\n\n".join(text for _, text in batches[0])
+                ))
+            
+            partials = list(await asyncio.gather(*[
+                self._call("reduce", REDUCE_PROMPT.format(
+                    words=self.summary_words,
+                    text="\n\n".join(text for _, text in batch)
+                ))
+                for batch in batches
+            ]))
+    
+    async def _call(self, stage: str, prompt: str) -> str:
+        async with self._semaphore:
+            SUMMARY_LLM_CALLS_TOTAL.inc(stage=stage)
+            return (await self.generate(prompt)).strip()
+    
+    def _join(self, group: List[Tuple[int, str]]) -> str:
+        return "\n\n".join(f"[Page {page}]\n{text}" for page, text in group)
+    
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text proportionally so it counts about `max_tokens` tokens."""
+        tokens = self.count_tokens(text)
+        if tokens <= max_tokens:
+            return text
+        return text[:int(len(text) * max_tokens / tokens)]
+    
+    def _group_pages(self, pages: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        """Group consecutive pages so each group stays within the token budget."""
+        groups = []
+        current: List[Tuple[int, str]] = []
+        used = 0
+        
+        for page, text in pages:
+            if not text.strip():
+                continue
+            
+            tokens = self.count_tokens(text)
+            if tokens > self.group_max_tokens:
+                # Keep a single oversized page within budget
+                text = self._truncate(text, self.group_max_tokens)
+                tokens = self.group_max_tokens
+            
+            if current and used + tokens > self.group_max_tokens:
+                groups.append(current)
+                current, used = [], 0
+            
+            current.append((page, text))
+            used += tokens
+        
+        if current:
+            groups.append(current)
+        return groups
@@ -0,0 +1,111 @@
+"""
+Page-level diffing for incremental re-ingest of revised documents.
+
+Every ingested page is stored with a fingerprint of its normalized text and
+the IDs of the chunks cut from it. When a new version is uploaded, each new
+page is matched against the stored fingerprints: matched pages keep their
+chunks and embeddings (only the page number is rewritten if the page moved),
+unmatched pages are re-chunked and re-embedded, and the chunks of stored pages
+left without a match are deleted. Ingest cost is therefore proportional to
+the number of pages that actually changed.
+"""
+
+import hashlib
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import DocumentChunk
+
+
+def page_fingerprint(text: str) -> str:
+    """Hash of a page's text, insensitive to whitespace; case changes are real edits."""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class PageDiff:
+    """Result of matching a new version's pages against the stored ones."""
+    
+    def __init__(self, matches: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]], removed: List[Dict[str, Any]]):
+        # (new page, stored page it matched or None) in new page order
+        self.matches = matches
+        self.removed = removed
+    
+    @property
+    def changed(self) -> List[Dict[str, Any]]:
+        """New pages with no stored match; these must be chunked and embedded."""
+        return [page for page, stored in self.matches if stored is None]
+    
+    @property
+    def moved(self) -> Dict[str, int]:
+        """Kept chunk IDs whose page number changed, mapped to their new page."""
+        return {
+            chunk_id: page["page"]
+            for page, stored in self.matches
+            if stored is not None and stored["page"] != page["page"]
+            for chunk_id in stored["chunk_ids"]
+        }
+    
+    @property
+    def stale_chunk_ids(self) -> List[str]:
+        return [chunk_id for stored in self.removed for chunk_id in stored["chunk_ids"]]
+    
+    @property
+    def content_changed(self) -> bool:
+        return bool(self.removed) or any(stored is None for _, stored in self.matches)
+    
+    def counts(self) -> Dict[str, int]:
+        moved_pages = sum(1 for page, stored in self.matches if stored is not None and stored["page"] != page["page"])
+        changed_pages = len(self.changed)
+        return {
+            "unchanged": len(self.matches) - changed_pages - moved_pages,
+            "moved": moved_pages,
+            "changed": changed_pages,
+            "removed": len(self.removed)
+        }
+    
+    def page_records(self, chunks: List[DocumentChunk]) -> List[Dict[str, Any]]:
+        """
+        Page rows to store for the new version.
+        
+        Args:
+            chunks: Chunks created from the changed pages
+        """
+        new_ids: Dict[int, List[str]] = {}
+        for chunk in chunks:
+            new_ids.setdefault(chunk.page, []).append(chunk.id)
+        
+        records = []
+        for page, stored in self.matches:
+            records.append({
+                "page": page["page"],
+                "fingerprint": page["fingerprint"],
+                "chunk_ids": stored["chunk_ids"] if stored is not None else new_ids.get(page["page"], [])
+            })
+        return records
+
+
+def diff_pages(stored_pages: List[Dict[str, Any]], pages: List[Dict[str, Any]]) -> PageDiff:
+    """
+    Match extracted pages against the stored version by fingerprint.
+    
+    Args:
+        stored_pages: Rows from DatabaseManager.get_document_pages, in page order
+        pages: Pages from PDFProcessor.extract_pages; a "fingerprint" key is added to each
+    
+    Returns:
+        PageDiff; repeated identical pages are matched in order
+    """
+    available: Dict[str, deque] = {}
+    for stored in stored_pages:
+        available.setdefault(stored["fingerprint"], deque()).append(stored)
+    
+    matches = []
+    for page in pages:
+        page["fingerprint"] = page_fingerprint(page["text"])
+        candidates = available.get(page["fingerprint"])
+        matches.append((page, candidates.popleft() if candidates else None))
+    
+    removed = [stored for candidates in available.values() for stored in candidates]
+    removed.sort(key=lambda stored: stored["page"])
+    return PageDiff(matches, removed)
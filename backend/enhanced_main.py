@@ -4,11 +4,9 @@ Enhanced FastAPI application for PDF-QA with LangChain and Vector Database integ
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import uvicorn
 import os
-import json
 import asyncio
 from datetime import datetime
 from typing import List, Optional, Dict, Any, AsyncGenerator
@@ -17,6 +15,8 @@ import io
 import logging
 from dotenv import load_dotenv
 
+from sse import sse_response
+
 # Load environment variables
 load_dotenv()
 
@@ -25,6 +25,7 @@ try:
     from langchain_openai import ChatOpenAI, OpenAIEmbeddings
     from langchain_community.vectorstores import Chroma
     from langchain.schema import Document
+    from chroma_client import create_chroma_client
     from langchain.text_splitter import RecursiveCharacterTextSplitter
     from langchain.callbacks.base import AsyncCallbackHandler
     LANGCHAIN_AVAILABLE = True
@@ -61,7 +62,19 @@ security = HTTPBearer()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 VECTOR_DB_DIR = os.getenv("VECTOR_DB_PERSIST_DIR", "./chroma_db")
+VECTOR_DB_MODE = os.getenv("VECTOR_DB_MODE", "embedded")  # embedded or http (shared Chroma server)
+VECTOR_DB_HOST = os.getenv("VECTOR_DB_HOST", "localhost")
+VECTOR_DB_PORT = int(os.getenv("VECTOR_DB_PORT", "8000"))
+VECTOR_DB_SSL = os.getenv("VECTOR_DB_SSL", "false").lower() == "true"
+VECTOR_DB_AUTH_TOKEN = os.getenv("VECTOR_DB_AUTH_TOKEN", "")
+VECTOR_DB_POOL_SIZE = int(os.getenv("VECTOR_DB_POOL_SIZE", "32"))
+VECTOR_DB_CONNECT_TIMEOUT_SECONDS = float(os.getenv("VECTOR_DB_CONNECT_TIMEOUT_SECONDS", "3"))
+VECTOR_DB_TIMEOUT_SECONDS = float(os.getenv("VECTOR_DB_TIMEOUT_SECONDS", "30"))
+VECTOR_DB_RETRIES = int(os.getenv("VECTOR_DB_RETRIES", "2"))
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "20"))
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "256"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
 
 # Create directories
 os.makedirs(VECTOR_DB_DIR, exist_ok=True)
@@ -114,7 +127,18 @@ async def initialize_langchain():
         
         # Initialize vector store
         vector_store = Chroma(
-            persist_directory=VECTOR_DB_DIR,
+            client=create_chroma_client(
+                mode=VECTOR_DB_MODE,
+                persist_directory=VECTOR_DB_DIR,
+                host=VECTOR_DB_HOST,
+                port=VECTOR_DB_PORT,
+                ssl=VECTOR_DB_SSL,
+                auth_token=VECTOR_DB_AUTH_TOKEN,
+                pool_size=VECTOR_DB_POOL_SIZE,
+                connect_timeout=VECTOR_DB_CONNECT_TIMEOUT_SECONDS,
+                timeout=VECTOR_DB_TIMEOUT_SECONDS,
+                retries=VECTOR_DB_RETRIES
+            ),
             embedding_function=embeddings
         )
         
@@ -135,7 +159,7 @@ async def initialize_langchain():
         
         logger.info("LangChain components initialized successfully")
         return True
-        
+    
     except Exception as e:
         logger.error(f"Error initializing LangChain: {e}")
         return False
@@ -215,12 +239,12 @@ async def process_document_with_langchain(doc_id: str, text: str, filename: str)
             documents.append(doc)
         
         # Add to vector store
+        # Chroma writes through to disk (or the server) on add; no persist() needed
         vector_store.add_documents(documents)
-        vector_store.persist()
         
         logger.info(f"Added {len(documents)} chunks to vector store for document {doc_id}")
         return True
-        
+    
     except Exception as e:
         logger.error(f"Error processing document with LangChain: {e}")
         return False
@@ -277,7 +301,7 @@ async def upload_document(file: UploadFile = File(...)):
             "langchain_processed": langchain_success,
             "message": f"Document processed successfully! Extracted text from {page_count} pages."
         }
-        
+    
     except Exception as e:
         return {
             "doc_id": doc_id,
@@ -353,16 +377,16 @@ async def search_vector_store(question: str, doc_ids: List[str] = None) -> List[
             })
         
         return formatted_results
-        
+    
     except Exception as e:
         logger.error(f"Error searching vector store: {e}")
         return []
 
 
-async def generate_langchain_response(question: str, context_docs: List[Dict]) -> AsyncGenerator[str, None]:
+async def generate_langchain_response(question: str, context_docs: List[Dict]) -> AsyncGenerator[Dict[str, Any], None]:
     """Generate response using LangChain."""
     if not llm:
-        yield f"data: {json.dumps({'type': 'error', 'error': 'LLM not available'})}\n\n"
+        yield {"type": "error", "error": "LLM not available"}
         return
     
     try:
@@ -382,7 +406,7 @@ DOCUMENT CONTENT:
 USER QUESTION: {question}
 
 Please provide a helpful and accurate answer based only on the information in the documents above."""
-
+        
         # Generate streaming response
         callback_handler = StreamingCallbackHandler()
         
@@ -396,7 +420,7 @@ Please provide a helpful and accurate answer based only on the information in th
         chunk_size = 50
         for i in range(0, len(full_text), chunk_size):
             chunk = full_text[i:i + chunk_size]
-            yield f"data: {json.dumps({'type': 'token', 'content': chunk})}\n\n"
+            yield {"type": "token", "content": chunk}
             await asyncio.sleep(0.01)  # Small delay for streaming effect
         
         # Send final response
@@ -419,14 +443,14 @@ Please provide a helpful and accurate answer based only on the information in th
             }
         }
         
-        yield f"data: {json.dumps(final_response)}\n\n"
-        
+        yield final_response
+    
     except Exception as e:
         error_response = {"type": "error", "error": str(e)}
-        yield f"data: {json.dumps(error_response)}\n\n"
+        yield error_response
 
 
-async def generate_fallback_response(question: str, doc_ids: List[str] = None) -> AsyncGenerator[str, None]:
+async def generate_fallback_response(question: str, doc_ids: List[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
     """Generate fallback response when LangChain is not available."""
     # Prepare context from documents
     context = ""
@@ -442,7 +466,7 @@ async def generate_fallback_response(question: str, doc_ids: List[str] = None) -
     
     if not context:
         response = "I don't have any documents to search through. Please upload some PDF documents first."
-        yield f"data: {json.dumps({'type': 'token', 'content': response})}\n\n"
+        yield {"type": "token", "content": response}
         return
     
     # Create simple response
@@ -454,7 +478,7 @@ async def generate_fallback_response(question: str, doc_ids: List[str] = None) -
     chunk_size = 100
     for i in range(0, len(response), chunk_size):
         chunk = response[i:i + chunk_size]
-        yield f"data: {json.dumps({'type': 'token', 'content': chunk})}\n\n"
+        yield {"type": "token", "content": chunk}
         await asyncio.sleep(0.05)
     
     # Send final response
@@ -468,7 +492,7 @@ async def generate_fallback_response(question: str, doc_ids: List[str] = None) -
         }
     }
     
-    yield f"data: {json.dumps(final_response)}\n\n"
+    yield final_response
 
 
 @app.post("/ask")
@@ -488,35 +512,21 @@ async def ask_question(question_data: dict):
             
             if context_docs:
                 # Generate response with LangChain
-                async def generate():
-                    async for chunk in generate_langchain_response(question, context_docs):
-                        yield chunk
-                
-                return StreamingResponse(
-                    generate(),
-                    media_type="text/stream-server-sent-events",
-                    headers={
-                        "Cache-Control": "no-cache",
-                        "Connection": "keep-alive",
-                        "Access-Control-Allow-Origin": "*",
-                    }
+                return sse_response(
+                    generate_langchain_response(question, context_docs),
+                    coalesce_ms=SSE_COALESCE_MS,
+                    coalesce_bytes=SSE_COALESCE_BYTES,
+                    heartbeat_seconds=SSE_HEARTBEAT_SECONDS
                 )
         except Exception as e:
             logger.error(f"LangChain error: {e}")
     
     # Fallback to simple approach
-    async def generate():
-        async for chunk in generate_fallback_response(question, doc_ids):
-            yield chunk
-    
-    return StreamingResponse(
-        generate(),
-        media_type="text/stream-server-sent-events",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "*",
-        }
+    return sse_response(
+        generate_fallback_response(question, doc_ids),
+        coalesce_ms=SSE_COALESCE_MS,
+        coalesce_bytes=SSE_COALESCE_BYTES,
+        heartbeat_seconds=SSE_HEARTBEAT_SECONDS
     )
 
 
@@ -25,6 +25,29 @@ class GeminiConfig:
         self.MAX_FILE_SIZE_MB = 100
         self.UPLOAD_DIR = "./uploads"
         
+        # Document summary settings
+        self.SUMMARY_ENABLED = True
+        self.SUMMARY_MAX_CONCURRENCY = 4
+        self.SUMMARY_GROUP_MAX_TOKENS = 6000
+        
+        # SSE framing settings
+        self.SSE_COALESCE_MS = 20
+        self.SSE_COALESCE_BYTES = 256
+        self.SSE_HEARTBEAT_SECONDS = 15
+        
+        # Passage search settings
+        self.SEARCH_MAX_RESULTS = 100
+        self.SEARCH_CONTEXT_CHARS = 160
+        
+        # Scanned page OCR settings
+        self.PDF_MIN_TEXT_CHARS = 50
+        self.OCR_ENABLED = True
+        self.OCR_MAX_WORKERS = 2
+        self.OCR_MAX_PENDING_PAGES = 32
+        self.OCR_LANGUAGE = "eng"
+        self.OCR_DPI = 300
+        self.OCR_PAGE_TIMEOUT_SECONDS = 120
+        
         # Security
         self.SECRET_KEY = "your_super_secret_jwt_key_here_minimum_32_characters_gemini"
     
@@ -0,0 +1,51 @@
+"""
+Gemini streaming that stops when the reader does.
+
+google-generativeai streams a response over a gRPC call, and the call is
+only cancelled when a read from it is cancelled. Closing the response
+iterator between chunks leaves the call, and the provider's generation,
+running until the iterator is garbage collected. stream_text keeps the next
+read in its own task, and a caller that stops reading has that read
+cancelled while it waits on the call, which cancels the call.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator
+
+
+async def stream_text(model: Any, prompt: str) -> AsyncIterator[str]:
+    """
+    Stream the text of a Gemini response.
+    
+    Args:
+        model: google.generativeai GenerativeModel
+        prompt: Prompt to generate from
+    
+    Yields:
+        Non-empty text chunks; closing the iterator early cancels the call
+    """
+    response = await model.generate_content_async(prompt, stream=True)
+    chunks = response.__aiter__()
+    pending = asyncio.ensure_future(chunks.__anext__())
+    try:
+        while True:
+            try:
+                chunk = await pending
+            except StopAsyncIteration:
+                return
+            pending = asyncio.ensure_future(chunks.__anext__())
+            if chunk.text:
+                yield chunk.text
+    finally:
+        # Only a read that is waiting on the call cancels it when cancelled, so
+        # let the pending read start (skipping chunks that were already
+        # buffered) before cancelling it
+        while True:
+            await asyncio.sleep(0)
+            if not pending.done():
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+                break
+            if pending.cancelled() or pending.exception() is not None:
+                break
+            pending = asyncio.ensure_future(chunks.__anext__())
@@ -0,0 +1,187 @@
+"""
+Tiered health checks.
+
+- Liveness only says the process is serving requests and does no I/O.
+- Readiness reads component status cached by a background prober, so
+  orchestrators polling it never trigger database, vector store or model
+  calls themselves.
+- A deep check runs every component's live probe (including a real
+  embedding and LLM call) on demand; callers are expected to restrict and
+  rate-limit it.
+
+Each component records the latency and error of its last cheap and last deep
+probe.
+"""
+
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from metrics import HEALTH_CHECK_SECONDS, HEALTH_CHECK_FAILURES_TOTAL
+
+
+logger = logging.getLogger(__name__)
+
+
+Probe = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class ProbeResult:
+    """Outcome of one probe of one component."""
+    
+    __slots__ = ("healthy", "latency_ms", "error", "checked_at", "details")
+    
+    def __init__(
+        self,
+        healthy: bool,
+        latency_ms: float,
+        error: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None
+    ):
+        self.healthy = healthy
+        self.latency_ms = latency_ms
+        self.error = error
+        self.checked_at = time.time()
+        self.details = details or {}
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "status": "healthy" if self.healthy else "unhealthy",
+            "latency_ms": round(self.latency_ms, 2),
+            "error": self.error,
+            "checked_at": datetime.utcfromtimestamp(self.checked_at).isoformat(),
+            "details": self.details
+        }
+
+
+class Component:
+    """A dependency with a cheap probe for readiness and a live probe for deep checks."""
+    
+    def __init__(self, name: str, probe: Probe, deep_probe: Optional[Probe] = None, required: bool = True):
+        self.name = name
+        self.probe = probe
+        self.deep_probe = deep_probe or probe
+        self.required = required
+        self.last: Optional[ProbeResult] = None
+        self.last_deep: Optional[ProbeResult] = None
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            **(self.last.as_dict() if self.last else {"status": "unknown"}),
+            "required": self.required,
+            "last_deep": self.last_deep.as_dict() if self.last_deep else None
+        }
+
+
+class HealthMonitor:
+    """Probes registered components in the background and serves cached readiness."""
+    
+    def __init__(self, interval: float = 15.0, timeout: float = 5.0, stale_after: Optional[float] = None):
+        """
+        Args:
+            interval: Seconds between background probes
+            timeout: Per-probe timeout in seconds
+            stale_after: Age in seconds after which a cached result no longer counts
+                as ready; defaults to three intervals
+        """
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after or interval * 3
+        self.components: Dict[str, Component] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._deep_lock = asyncio.Lock()
+    
+    def register(self, name: str, probe: Probe, deep_probe: Optional[Probe] = None, required: bool = True):
+        self.components[name] = Component(name, probe, deep_probe, required)
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self.running:
+            return
+        self._task = loop.create_task(self._run())
+        logger.info(f"Health prober started (every {self.interval}s)")
+    
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.error(f"Health probe round failed: {e}")
+            await asyncio.sleep(self.interval)
+    
+    async def _probe(self, component: Component, deep: bool) -> ProbeResult:
+        depth = "deep" if deep else "ready"
+        start = time.perf_counter()
+        try:
+            details = await asyncio.wait_for((component.deep_probe if deep else component.probe)(), self.timeout)
+            result = ProbeResult(True, (time.perf_counter() - start) * 1000, details=details)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            result = ProbeResult(False, (time.perf_counter() - start) * 1000, f"Timed out after {self.timeout}s")
+        except Exception as e:
+            result = ProbeResult(False, (time.perf_counter() - start) * 1000, str(e) or type(e).__name__)
+        
+        HEALTH_CHECK_SECONDS.observe(result.latency_ms / 1000, component=component.name, depth=depth)
+        if not result.healthy:
+            HEALTH_CHECK_FAILURES_TOTAL.inc(component=component.name, depth=depth)
+            logger.warning(f"Health probe {component.name} ({depth}) failed: {result.error}")
+        
+        if deep:
+            component.last_deep = result
+        else:
+            component.last = result
+        return result
+    
+    async def probe_all(self):
+        """Run every cheap probe concurrently and cache the results."""
+        await asyncio.gather(*[self._probe(component, deep=False) for component in self.components.values()])
+    
+    async def deep_check(self) -> Dict[str, Any]:
+        """Run every live probe now. Concurrent callers share one run rather than stacking model calls."""
+        if self._deep_lock.locked():
+            # A deep check is already running: wait for it and report its results
+            async with self._deep_lock:
+                pass
+        else:
+            async with self._deep_lock:
+                await asyncio.gather(*[self._probe(component, deep=True) for component in self.components.values()])
+        
+        healthy = all(
+            component.last_deep is not None and component.last_deep.healthy
+            for component in self.components.values()
+            if component.required
+        )
+        return {"status": "healthy" if healthy else "unhealthy", **self._report(deep=True)}
+    
+    def readiness(self) -> Dict[str, Any]:
+        """Cached readiness; never probes. Not ready until every required component has a fresh healthy result."""
+        now = time.time()
+        ready = all(
+            component.last is not None
+            and component.last.healthy
+            and now - component.last.checked_at <= self.stale_after
+            for component in self.components.values()
+            if component.required
+        )
+        return {"status": "ready" if ready else "not_ready", **self._report(deep=False)}
+    
+    def _report(self, deep: bool) -> Dict[str, Any]:
+        if deep:
+            components = {
+                name: component.last_deep.as_dict() if component.last_deep else {"status": "unknown"}
+                for name, component in self.components.items()
+            }
+        else:
+            components = {name: component.as_dict() for name, component in self.components.items()}
+        return {"components": components, "timestamp": datetime.utcnow().isoformat()}
@@ -2,25 +2,39 @@
 FastAPI main application for PDF-QA with RAG system.
 """
 
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, BackgroundTasks, Header, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse, JSONResponse
 import uvicorn
 import os
 from dotenv import load_dotenv
 import asyncio
-from typing import List, Optional
-import json
+from typing import AsyncIterator, List, Optional, Tuple
 import logging
+import time
+import threading
 from datetime import datetime
 
 from config import Settings
-from models import User, Document, QuestionRequest, ChatResponse
-from auth import AuthManager, get_current_user
+from models import User, UserRole, Document, QuestionRequest, BatchQuestionRequest, ChatResponse
+from auth import init_auth_manager, get_current_user, get_current_admin_user, create_default_admin, authenticate_token
 from pdf_processor import PDFProcessor
 from rag_chain import RAGChain
 from database import DatabaseManager
+from metrics import REGISTRY, REINGEST_PAGES_TOTAL, ANSWER_STREAM_RESUMES_TOTAL, SEARCH_SECONDS
+from tracing import tracer, configure_tracing, new_trace_id, TraceContext
+from profiling import LoopLagMonitor, SamplingProfiler, MemoryProfiler
+from rate_limiting import RateLimiter, FairShareAdmission, create_rate_limit_backend
+from coalescing import SingleFlight, question_key
+from conversation_memory import ConversationMemory
+from document_jobs import DocumentJobs
+from document_versions import diff_pages
+from health import HealthMonitor
+from sse import sse_response, encode_json
+from answer_streams import AnswerStreams
+from passage_search import paginate
+from ws_chat import serve_chat
 
 # Load environment variables
 load_dotenv()
@@ -47,16 +61,72 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "X-Stream-Id"],
 )
 
 # Security
 security = HTTPBearer()
 
 # Initialize components
-auth_manager = AuthManager(settings.SECRET_KEY)
 pdf_processor = PDFProcessor(settings)
 rag_chain = RAGChain(settings)
 db_manager = DatabaseManager(settings.DATABASE_URL)
+auth_manager = init_auth_manager(
+    settings.SECRET_KEY,
+    db_manager,
+    cache_ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+    cache_max_size=settings.AUTH_CACHE_MAX_SIZE,
+    bcrypt_rounds=settings.BCRYPT_ROUNDS,
+    hash_workers=settings.AUTH_HASH_WORKERS,
+    hash_max_pending=settings.AUTH_HASH_MAX_PENDING
+)
+loop_monitor = LoopLagMonitor(
+    interval_ms=settings.LOOP_LAG_INTERVAL_MS,
+    stall_threshold_ms=settings.LOOP_STALL_THRESHOLD_MS
+)
+rate_limiter = RateLimiter(
+    create_rate_limit_backend(settings),
+    {
+        "ask": settings.RATE_LIMIT_PER_MINUTE,
+        "upload": settings.UPLOAD_RATE_LIMIT_PER_MINUTE,
+        "ask_batch": settings.ASK_BATCH_RATE_LIMIT_PER_MINUTE,
+        "search": settings.SEARCH_RATE_LIMIT_PER_MINUTE,
+        "health_deep": settings.HEALTH_DEEP_RATE_LIMIT_PER_MINUTE
+    }
+)
+llm_admission = FairShareAdmission(
+    max_concurrent=settings.LLM_MAX_CONCURRENT_STREAMS,
+    max_queue=settings.LLM_QUEUE_MAX,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS
+)
+ask_coalescer = SingleFlight()
+answer_streams = AnswerStreams(
+    buffer_events=settings.ANSWER_STREAM_BUFFER_EVENTS,
+    grace_seconds=settings.ANSWER_STREAM_GRACE_SECONDS,
+    retention_seconds=settings.ANSWER_STREAM_RETENTION_SECONDS,
+    max_streams=settings.ANSWER_STREAM_MAX
+)
+conversation_memory = ConversationMemory(
+    db_manager,
+    summarizer=rag_chain.summarize_history,
+    count_tokens=rag_chain.count_tokens,
+    window_turns=settings.CONVERSATION_WINDOW_TURNS,
+    history_max_tokens=settings.CONVERSATION_HISTORY_MAX_TOKENS,
+    summary_max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+    max_conversations=settings.CONVERSATION_CACHE_SIZE
+)
+summary_jobs = DocumentJobs()
+ocr_jobs = DocumentJobs()
+health_monitor = HealthMonitor(
+    interval=settings.HEALTH_PROBE_INTERVAL_SECONDS,
+    timeout=settings.HEALTH_PROBE_TIMEOUT_SECONDS
+)
+health_monitor.register("database", db_manager.ping)
+health_monitor.register("vector_store", rag_chain.check_vector_store, lambda: rag_chain.check_vector_store(live=True))
+health_monitor.register("embeddings", rag_chain.check_embeddings, lambda: rag_chain.check_embeddings(live=True))
+health_monitor.register("llm", rag_chain.check_llm, lambda: rag_chain.check_llm(live=True))
+cpu_profiler = SamplingProfiler(max_seconds=settings.PROFILER_MAX_SECONDS)
+memory_profiler = MemoryProfiler()
 
 # Logging setup
 logging.basicConfig(level=logging.INFO)
@@ -72,15 +142,39 @@ async def startup_event():
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
     os.makedirs(settings.VECTOR_DB_PERSIST_DIR, exist_ok=True)
     
+    # Enable request tracing
+    configure_tracing(settings)
+    
     # Initialize database
     await db_manager.init_db()
+    await create_default_admin()
     
     # Initialize RAG chain
     await rag_chain.initialize()
     
+    # Watch for callbacks that block the event loop
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start(asyncio.get_running_loop())
+    
+    # Readiness is served from this prober's cache
+    health_monitor.start(asyncio.get_running_loop())
+    
     logger.info("Application started successfully!")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background monitors and worker pools."""
+    loop_monitor.stop()
+    health_monitor.stop()
+    summary_jobs.cancel_all()
+    ocr_jobs.cancel_all()
+    answer_streams.cancel_all()
+    pdf_processor.shutdown()
+    await conversation_memory.drain()
+    auth_manager.hasher.shutdown()
+
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -100,9 +194,22 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Liveness: the process is serving requests. Does no I/O."""
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness from cached component status; 503 until every required component is healthy."""
+    report = health_monitor.readiness()
+    return JSONResponse(report, status_code=200 if report["status"] == "ready" else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return Response(content=REGISTRY.render(), media_type=REGISTRY.CONTENT_TYPE)
+
+
 @app.get("/test-cors")
 async def test_cors():
     """Test CORS endpoint."""
@@ -120,6 +227,8 @@ async def register(user_data: dict):
         )
         token = auth_manager.create_access_token({"sub": user.email})
         return {"access_token": token, "token_type": "bearer", "user": user.dict()}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -137,22 +246,11 @@ async def login(user_data: dict):
         
         token = auth_manager.create_access_token({"sub": user.email})
         return {"access_token": token, "token_type": "bearer", "user": user.dict()}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
-@app.post("/auth/register")
-async def register(user_data: dict):
-    """Register a new user."""
-    try:
-        user = await auth_manager.create_user(
-            email=user_data["email"],
-            password=user_data["password"]
-        )
-        token = auth_manager.create_access_token({"sub": user.email})
-        return {"access_token": token, "token_type": "bearer", "user": user.dict()}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
 
 # Document management endpoints
 @app.post("/upload")
@@ -170,61 +268,338 @@ async def upload_document(
         if file.size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
             raise HTTPException(status_code=413, detail=f"File too large. Max size: {settings.MAX_FILE_SIZE_MB}MB")
         
-        # Save document metadata
-        document = await db_manager.create_document(
-            name=file.filename,
-            user_id=current_user.id,
-            size=file.size,
-            mime_type=file.content_type
-        )
+        await rate_limiter.check(current_user.id, "upload")
         
-        # Save uploaded file
-        file_path = os.path.join(settings.UPLOAD_DIR, f"{document.id}_{file.filename}")
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        if await db_manager.count_user_documents(current_user.id) >= settings.MAX_FILES_PER_USER:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Document limit reached. Max documents per user: {settings.MAX_FILES_PER_USER}"
+            )
         
-        # Process document in background
+        with tracer.span("upload", filename=file.filename, size=file.size) as upload_span:
+            # Save document metadata
+            document = await db_manager.create_document(
+                name=file.filename,
+                user_id=current_user.id,
+                size=file.size,
+                mime_type=file.content_type
+            )
+            upload_span.set_attribute("doc_id", document.id)
+            
+            # Save uploaded file
+            file_path = os.path.join(settings.UPLOAD_DIR, f"{document.id}_{file.filename}")
+            with open(file_path, "wb") as buffer:
+                content = await file.read()
+                buffer.write(content)
+        
+        # Process document in background, continuing the upload trace
         background_tasks.add_task(
             process_document_background, 
             document.id, 
             file_path, 
-            current_user.id
+            current_user.id,
+            upload_span.context()
         )
         
         return {
             "doc_id": document.id,
             "status": "processing",
-            "message": "Document uploaded successfully and is being processed"
+            "message": "Document uploaded successfully and is being processed",
+            "trace_id": upload_span.trace_id
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def process_document_background(doc_id: str, file_path: str, user_id: str):
+async def process_document_background(
+    doc_id: str,
+    file_path: str,
+    user_id: str,
+    trace_context: Optional[TraceContext] = None
+):
     """Background task to process uploaded document."""
+    with tracer.span("process_document", parent=trace_context, doc_id=doc_id):
+        try:
+            logger.info(f"Processing document {doc_id}...")
+            
+            # Update status to processing
+            await db_manager.update_document_status(doc_id, "processing")
+            
+            # Any previous summary or OCR run describes the old content
+            summary_jobs.cancel(doc_id)
+            ocr_jobs.cancel(doc_id)
+            await db_manager.update_document_summary(doc_id, "pending" if settings.SUMMARY_ENABLED else "disabled")
+            
+            # Process PDF
+            pages = await pdf_processor.extract_pages(file_path)
+            scanned = await pdf_processor.scanned_pages(file_path)
+            # Pages in the PDF, not only those with text (the analysis is cached)
+            page_count = (await pdf_processor.get_pdf_info(file_path))["pages"] or len(pages)
+            chunks = await pdf_processor.chunk_pages(pages, doc_id)
+            
+            # Store in vector database
+            if chunks:
+                await rag_chain.add_document_chunks(chunks, doc_id, user_id)
+            
+            # Page fingerprints let a later version re-ingest only what changed
+            page_records = diff_pages([], pages).page_records(chunks)
+            await db_manager.replace_document_pages(doc_id, page_records)
+            
+            # Update status to ready
+            await db_manager.update_document_status(doc_id, "ready", len(chunks), page_count)
+            
+            logger.info(f"Document {doc_id} processed successfully with {len(chunks)} chunks")
+            
+            if scanned:
+                # Text pages are searchable now; scanned pages are added as OCR finishes them
+                ocr_jobs.schedule(
+                    doc_id,
+                    ocr_document_background(
+                        doc_id, file_path, user_id, scanned, pages, page_records, doc_id, page_count
+                    )
+                )
+            elif settings.SUMMARY_ENABLED:
+                summary_jobs.schedule(doc_id, summarize_document_background(doc_id, pages))
+        
+        except Exception as e:
+            logger.error(f"Error processing document {doc_id}: {str(e)}")
+            await db_manager.update_document_status(doc_id, "failed", error=str(e))
+
+
+async def ocr_document_background(
+    doc_id: str,
+    file_path: str,
+    user_id: str,
+    page_numbers: List[int],
+    pages: List[dict],
+    page_records: List[dict],
+    id_prefix: str,
+    page_count: int
+):
+    """
+    OCR a document's scanned pages and index them in batches as they finish.
+    
+    `pages` and `page_records` hold the text pages already indexed; OCRed
+    pages are appended to both so the stored page fingerprints and the
+    summary cover the whole document.
+    """
+    with tracer.span("ocr_document", doc_id=doc_id, pages=len(page_numbers)) as span:
+        recognized = 0
+        batch = []
+        try:
+            async for page in pdf_processor.ocr_pages(file_path, page_numbers):
+                batch.append(page)
+                if len(batch) >= settings.OCR_BATCH_PAGES:
+                    await index_ocr_pages(doc_id, user_id, batch, pages, page_records, id_prefix, page_count)
+                    recognized += len(batch)
+                    batch = []
+            
+            if batch:
+                await index_ocr_pages(doc_id, user_id, batch, pages, page_records, id_prefix, page_count)
+                recognized += len(batch)
+            
+            span.set_attribute("pages_recognized", recognized)
+            logger.info(f"OCR of document {doc_id} finished: {recognized} of {len(page_numbers)} scanned pages had text")
+            
+            if not pages:
+                await db_manager.update_document_status(doc_id, "failed", error="No text could be extracted from the PDF")
+                return
+            
+            if settings.SUMMARY_ENABLED:
+                pages.sort(key=lambda page: page["page"])
+                summary_jobs.schedule(doc_id, summarize_document_background(doc_id, pages))
+        
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Text pages stay searchable; only the scanned ones are missing
+            logger.error(f"Error running OCR for document {doc_id}: {str(e)}")
+
+
+async def index_ocr_pages(
+    doc_id: str,
+    user_id: str,
+    batch: List[dict],
+    pages: List[dict],
+    page_records: List[dict],
+    id_prefix: str,
+    page_count: int
+):
+    """Chunk, embed and record a batch of OCRed pages."""
+    chunks = []
+    for page in batch:
+        # OCR batches finish in any order, so chunk IDs are scoped to their page
+        chunks.extend(await pdf_processor.chunk_pages([page], doc_id, id_prefix=f"{id_prefix}_ocr_p{page['page']}"))
+    
+    async def write():
+        await rag_chain.apply_document_revision(doc_id, user_id, chunks, {}, [])
+        
+        records = sorted(
+            page_records + diff_pages([], batch).page_records(chunks),
+            key=lambda record: record["page"]
+        )
+        await db_manager.replace_document_pages(doc_id, records)
+        pages.extend(batch)
+        page_records[:] = records
+        
+        chunk_count = sum(len(record["chunk_ids"]) for record in records)
+        await db_manager.update_document_status(doc_id, "ready", chunk_count, page_count)
+    
+    # Vectors and the page records that point at them are written as one step.
+    # A cancelled job lets it finish: vectors upserted but never recorded would
+    # be invisible to a later re-ingest diff or delete.
+    writing = asyncio.ensure_future(write())
     try:
-        logger.info(f"Processing document {doc_id}...")
+        await asyncio.shield(writing)
+    except asyncio.CancelledError:
+        await writing
+        raise
+
+
+async def summarize_document_background(doc_id: str, pages: List[dict]):
+    """Generate and store a document's summary once, after ingest."""
+    with tracer.span("summarize_document", doc_id=doc_id):
+        try:
+            result = await rag_chain.summarize_document(pages)
+            await db_manager.update_document_summary(doc_id, "ready", result["summary"])
+            logger.info(
+                f"Summarized document {doc_id} ({result['method']}, {result['page_groups']} page groups)"
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error summarizing document {doc_id}: {str(e)}")
+            await db_manager.update_document_summary(doc_id, "failed")
+
+
+@app.put("/documents/{doc_id}")
+async def upload_document_version(
+    doc_id: str,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """Upload a revised version of a document; only changed pages are re-processed."""
+    try:
+        document = await db_manager.get_document(doc_id)
+        if not document or document.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        if document.status == "processing":
+            raise HTTPException(status_code=409, detail="Document is still being processed")
         
-        # Update status to processing
-        await db_manager.update_document_status(doc_id, "processing")
+        if not file.filename.lower().endswith('.pdf'):
+            raise HTTPException(status_code=400, detail="Only PDF files are supported")
         
-        # Process PDF
-        chunks = await pdf_processor.process_pdf(file_path, doc_id)
+        if file.size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
+            raise HTTPException(status_code=413, detail=f"File too large. Max size: {settings.MAX_FILE_SIZE_MB}MB")
         
-        # Store in vector database
-        await rag_chain.add_document_chunks(chunks, doc_id, user_id)
+        await rate_limiter.check(current_user.id, "upload")
         
-        # Update status to ready
-        await db_manager.update_document_status(doc_id, "ready", len(chunks))
+        with tracer.span("upload_version", doc_id=doc_id, filename=file.filename, size=file.size) as upload_span:
+            version = await db_manager.start_document_version(doc_id, file.filename, file.size)
+            upload_span.set_attribute("version", version)
+            
+            # Replace the stored file
+            old_path = os.path.join(settings.UPLOAD_DIR, f"{doc_id}_{document.name}")
+            file_path = os.path.join(settings.UPLOAD_DIR, f"{doc_id}_{file.filename}")
+            with open(file_path, "wb") as buffer:
+                content = await file.read()
+                buffer.write(content)
+            if old_path != file_path and os.path.exists(old_path):
+                os.remove(old_path)
         
-        logger.info(f"Document {doc_id} processed successfully with {len(chunks)} chunks")
+        background_tasks.add_task(
+            reingest_document_background,
+            doc_id,
+            file_path,
+            current_user.id,
+            version,
+            upload_span.context()
+        )
         
+        return {
+            "doc_id": doc_id,
+            "version": version,
+            "status": "processing",
+            "message": "New version uploaded and is being processed",
+            "trace_id": upload_span.trace_id
+        }
+    
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing document {doc_id}: {str(e)}")
-        await db_manager.update_document_status(doc_id, "failed", error=str(e))
+        logger.error(f"Version upload error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def reingest_document_background(
+    doc_id: str,
+    file_path: str,
+    user_id: str,
+    version: int,
+    trace_context: Optional[TraceContext] = None
+):
+    """Background task to apply a new document version by diffing page fingerprints."""
+    with tracer.span("reingest_document", parent=trace_context, doc_id=doc_id, version=version) as span:
+        try:
+            logger.info(f"Re-ingesting document {doc_id} as version {version}...")
+            
+            # A previous OCR run would write page records for the old version
+            ocr_jobs.cancel(doc_id)
+            
+            pages = await pdf_processor.extract_pages(file_path)
+            scanned = await pdf_processor.scanned_pages(file_path)
+            stored_pages = await db_manager.get_document_pages(doc_id)
+            diff = diff_pages(stored_pages, pages)
+            
+            counts = diff.counts()
+            for result, count in counts.items():
+                REINGEST_PAGES_TOTAL.inc(count, result=result)
+                span.set_attribute(f"pages_{result}", count)
+            
+            if diff.content_changed:
+                summary_jobs.cancel(doc_id)
+                await db_manager.update_document_summary(doc_id, "pending" if settings.SUMMARY_ENABLED else "disabled")
+            
+            if not stored_pages:
+                # Ingested before page fingerprints were recorded: replace everything
+                await rag_chain.delete_document(doc_id, user_id)
+            
+            # Version-scoped IDs keep new chunks distinct from the ones being kept
+            chunks = await pdf_processor.chunk_pages(diff.changed, doc_id, id_prefix=f"{doc_id}_v{version}")
+            await rag_chain.apply_document_revision(doc_id, user_id, chunks, diff.moved, diff.stale_chunk_ids)
+            
+            page_records = diff.page_records(chunks)
+            await db_manager.replace_document_pages(doc_id, page_records)
+            
+            page_count = (await pdf_processor.get_pdf_info(file_path))["pages"] or len(pages)
+            chunk_count = sum(len(record["chunk_ids"]) for record in page_records)
+            await db_manager.update_document_status(doc_id, "ready", chunk_count, page_count)
+            
+            logger.info(
+                f"Document {doc_id} version {version} ready: {counts['changed']} pages re-embedded, "
+                f"{counts['removed']} removed, {counts['unchanged'] + counts['moved']} kept"
+            )
+            
+            if scanned:
+                # Scanned pages have no text to fingerprint until OCRed, so they are always redone
+                ocr_jobs.schedule(
+                    doc_id,
+                    ocr_document_background(
+                        doc_id, file_path, user_id, scanned, pages, page_records, f"{doc_id}_v{version}", page_count
+                    )
+                )
+            elif diff.content_changed and settings.SUMMARY_ENABLED:
+                summary_jobs.schedule(doc_id, summarize_document_background(doc_id, pages))
+        
+        except Exception as e:
+            logger.error(f"Error re-ingesting document {doc_id}: {str(e)}")
+            await db_manager.update_document_status(doc_id, "failed", error=str(e))
 
 
 @app.get("/documents")
@@ -237,6 +612,22 @@ async def list_documents(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/documents/{doc_id}/summary")
+async def get_document_summary(doc_id: str, current_user: User = Depends(get_current_user)):
+    """Get the summary generated for a document after ingest."""
+    document = await db_manager.get_document(doc_id)
+    if not document or document.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    summary = await db_manager.get_document_summary(doc_id)
+    return {
+        "doc_id": doc_id,
+        "status": summary["status"] or "unavailable",
+        "summary": summary["summary"],
+        "updated_at": summary["updated_at"]
+    }
+
+
 @app.delete("/documents/{doc_id}")
 async def delete_document(
     doc_id: str,
@@ -251,6 +642,8 @@ async def delete_document(
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Delete in background
+        summary_jobs.cancel(doc_id)
+        ocr_jobs.cancel(doc_id)
         background_tasks.add_task(delete_document_background, doc_id, current_user.id)
         
         return {"message": "Document deletion initiated"}
@@ -276,11 +669,138 @@ async def delete_document_background(doc_id: str, user_id: str):
         await db_manager.delete_document(doc_id)
         
         logger.info(f"Document {doc_id} deleted successfully")
-        
+    
     except Exception as e:
         logger.error(f"Error deleting document {doc_id}: {str(e)}")
 
 
+async def open_answer(
+    question_data: QuestionRequest,
+    current_user: User,
+    coalesce: bool = True
+) -> Tuple[str, AsyncIterator[dict]]:
+    """
+    Validate, rate-limit and admit a question, shared by /ask and the chat socket.
+    
+    Returns the trace ID and the answer's event stream, which must be iterated
+    (or closed) so its generation slot is released. Raises HTTPException.
+    
+    With `coalesce` False the stream is never shared and is pulled straight
+    from the LLM: generation only advances as the caller reads, so a caller
+    that stops reading pauses it. A coalesced flight is drained by its own
+    task into a buffer for all of its subscribers.
+    """
+    if not question_data.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    
+    await rate_limiter.check(current_user.id, "ask")
+    
+    # Prior turns come from the cached window, not a full table read
+    history = ""
+    if question_data.conversation_id:
+        history = await conversation_memory.get_history(question_data.conversation_id, current_user.id)
+        if history is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    trace_id = new_trace_id()
+    
+    # Identical questions already streaming are joined instead of regenerated
+    coalesce = coalesce and settings.ASK_COALESCING_ENABLED
+    if coalesce:
+        flight_key = question_key(
+            current_user.id,
+            question_data.question,
+            question_data.doc_ids,
+            question_data.k,
+            settings.LLM_MODEL,
+            question_data.conversation_id
+        )
+    else:
+        flight_key = trace_id
+    
+    # Only a request that will start a new flight needs a generation slot;
+    # raises 503 when the queue is full or the wait times out
+    lease = None
+    if not coalesce or not ask_coalescer.in_flight(flight_key):
+        lease = await llm_admission.acquire(current_user.id)
+    
+    async def answer_stream():
+        nonlocal lease
+        if lease is None:
+            # The flight this request meant to join finished before it subscribed
+            lease = await llm_admission.acquire(current_user.id)
+        try:
+            async for chunk in rag_chain.ask_question(
+                question=question_data.question,
+                user_id=current_user.id,
+                doc_ids=question_data.doc_ids,
+                k=question_data.k,
+                history=history
+            ):
+                # Recorded by the flight, so a coalesced double-submit records the
+                # turn once even when the request that started it has gone away
+                if chunk.get("type") == "complete":
+                    conversation_id = question_data.conversation_id
+                    if not conversation_id:
+                        # Every finished answer is kept: one asked outside a conversation
+                        # gets its own, returned so the client can continue it
+                        try:
+                            conversation_id = await db_manager.create_conversation(
+                                current_user.id,
+                                question_data.question.strip()[:200]
+                            )
+                            chunk = {**chunk, "conversation_id": conversation_id}
+                        except Exception as e:
+                            logger.error(f"Error creating conversation for answer {trace_id}: {e}")
+                    if conversation_id:
+                        conversation_memory.record_exchange(
+                            conversation_id,
+                            question_data.question,
+                            chunk["final_response"]
+                        )
+                yield chunk
+        finally:
+            lease.release()
+    
+    def release_unused_lease():
+        if lease is not None:
+            lease.release()
+    
+    async def generate_response():
+        subscription = None
+        try:
+            with tracer.span("ask", trace_id=trace_id, user_id=current_user.id) as ask_span:
+                if not coalesce:
+                    ask_span.set_attribute("coalesced", False)
+                    stream = answer_stream()
+                    try:
+                        async for chunk in stream:
+                            yield chunk
+                    finally:
+                        # Closes the LLM stream now, not when the generator is collected
+                        await stream.aclose()
+                    return
+                
+                subscription = ask_coalescer.subscribe(flight_key, answer_stream)
+                ask_span.set_attribute("coalesced", not subscription.leader)
+                if not subscription.leader:
+                    release_unused_lease()
+                
+                async for chunk in subscription:
+                    yield chunk
+        
+        except Exception as e:
+            yield {"error": str(e), "type": "error"}
+        
+        finally:
+            # A leader's slot belongs to its flight, which may still be generating
+            # for followers; answer_stream releases it when generation ends
+            if subscription is None or not subscription.leader:
+                release_unused_lease()
+    
+    return trace_id, generate_response()
+
+
 @app.post("/ask")
 async def ask_question(
     question_data: QuestionRequest,
@@ -288,39 +808,338 @@ async def ask_question(
 ):
     """Ask a question and get streaming response."""
     try:
-        # Validate question
-        if not question_data.question.strip():
-            raise HTTPException(status_code=400, detail="Question cannot be empty")
-        
-        # Generate streaming response
-        async def generate_response():
-            try:
-                async for chunk in rag_chain.ask_question(
-                    question=question_data.question,
-                    user_id=current_user.id,
-                    doc_ids=question_data.doc_ids,
-                    k=question_data.k
-                ):
-                    yield f"data: {json.dumps(chunk)}\n\n"
-                
-            except Exception as e:
-                error_chunk = {"error": str(e), "type": "error"}
-                yield f"data: {json.dumps(error_chunk)}\n\n"
+        trace_id, answer = await open_answer(question_data, current_user)
         
-        return StreamingResponse(
-            generate_response(),
-            media_type="text/stream-server-sent-events",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Access-Control-Allow-Origin": "*",
-            }
+        # Generated detached from this response so a dropped client can resume it
+        stream = answer_streams.start(current_user.id, answer)
+        return sse_response(
+            answer_streams.attach(stream),
+            coalesce_ms=settings.SSE_COALESCE_MS,
+            coalesce_bytes=settings.SSE_COALESCE_BYTES,
+            heartbeat_seconds=settings.SSE_HEARTBEAT_SECONDS,
+            headers={"X-Trace-Id": trace_id, "X-Stream-Id": stream.stream_id}
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """Many concurrent question streams over one socket, authenticated once; see ws_chat.py for the protocol."""
+    async def start_answer(user: User, message: dict) -> AsyncIterator[dict]:
+        # Same validation, rate limit and admission as /ask. Not coalesced: the
+        # socket's backpressure has to reach the LLM stream, which a shared
+        # flight would keep draining into its buffer
+        _, answer = await open_answer(QuestionRequest(**message), user, coalesce=False)
+        return answer
+    
+    await serve_chat(
+        websocket,
+        authenticate_token,
+        start_answer,
+        auth_timeout=settings.WS_AUTH_TIMEOUT_SECONDS,
+        max_streams=settings.WS_MAX_STREAMS_PER_CONNECTION,
+        window_frames=settings.WS_STREAM_WINDOW_FRAMES,
+        buffer_bytes=settings.WS_STREAM_BUFFER_BYTES,
+        stall_seconds=settings.WS_STREAM_STALL_SECONDS
+    )
+
+
+@app.post("/ask/batch")
+async def ask_batch(
+    batch: BatchQuestionRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Answer many questions about the same documents, streamed as NDJSON in completion order."""
+    questions = [question.strip() for question in batch.questions]
+    if len(questions) > settings.ASK_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.ASK_BATCH_MAX_QUESTIONS} questions per batch"
+        )
+    if any(not question or len(question) > 1000 for question in questions):
+        raise HTTPException(status_code=400, detail="Questions must be 1 to 1000 characters")
+    
+    await rate_limiter.check(current_user.id, "ask_batch")
+    trace_id = new_trace_id()
+    
+    async def generate_results():
+        with tracer.span("ask_batch", trace_id=trace_id, user_id=current_user.id, questions=len(questions)):
+            # Each generation takes a slot like a single /ask, so a batch cannot starve chat users
+            async for result in rag_chain.ask_batch(
+                questions,
+                user_id=current_user.id,
+                doc_ids=batch.doc_ids,
+                k=batch.k,
+                max_concurrency=settings.ASK_BATCH_MAX_CONCURRENCY,
+                acquire_slot=lambda: llm_admission.acquire(current_user.id)
+            ):
+                yield encode_json(result) + b"\n"
+    
+    return StreamingResponse(
+        generate_results(),
+        media_type="application/x-ndjson",
+        headers={"X-Trace-Id": trace_id}
+    )
+
+
+@app.get("/search")
+async def search_passages(
+    q: str,
+    doc_ids: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 10,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ranked passages for a query, without generating an answer.
+    
+    `doc_ids` is a comma-separated list. Each result carries the document
+    name, page, character offsets within the page and highlight spans of the
+    query terms within the passage text.
+    """
+    query = q.strip()
+    if not query or len(query) > 1000:
+        raise HTTPException(status_code=400, detail="Query must be 1 to 1000 characters")
+    if offset < 0 or not 1 <= limit <= 50:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 50")
+    if offset + limit > settings.SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"Results are available up to position {settings.SEARCH_MAX_RESULTS}")
+    
+    await rate_limiter.check(current_user.id, "search")
+    scope = [doc_id.strip() for doc_id in (doc_ids or "").split(",") if doc_id.strip()]
+    start = time.perf_counter()
+    
+    with tracer.span("search", user_id=current_user.id, offset=offset, limit=limit), \
+            SEARCH_SECONDS.time(backend="vector"):
+        documents = await db_manager.get_user_documents(current_user.id)
+        doc_names = {document.id: document.name for document in documents}
+        # One extra result tells whether another page exists
+        passages = await rag_chain.search_passages(
+            query,
+            current_user.id,
+            doc_names,
+            doc_ids=scope or None,
+            limit=offset + limit + 1
+        )
+    
+    return {
+        "query": query,
+        **paginate(passages, offset, limit),
+        "took_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+@app.get("/ask/streams/{stream_id}")
+async def resume_answer_stream(
+    stream_id: str,
+    last_event_id: int = Header(0),
+    current_user: User = Depends(get_current_user)
+):
+    """Replay an answer stream from after Last-Event-ID, then follow it live."""
+    stream = answer_streams.get(stream_id, current_user.id)
+    if stream is None:
+        ANSWER_STREAM_RESUMES_TOTAL.inc(result="unknown")
+        raise HTTPException(status_code=404, detail="Answer stream not found or expired")
+    
+    if not stream.can_resume(last_event_id):
+        ANSWER_STREAM_RESUMES_TOTAL.inc(result="expired")
+        raise HTTPException(status_code=410, detail="Events after Last-Event-ID are no longer buffered")
+    
+    ANSWER_STREAM_RESUMES_TOTAL.inc(result="resumed")
+    return sse_response(
+        answer_streams.attach(stream, after=last_event_id),
+        coalesce_ms=settings.SSE_COALESCE_MS,
+        coalesce_bytes=settings.SSE_COALESCE_BYTES,
+        heartbeat_seconds=settings.SSE_HEARTBEAT_SECONDS,
+        headers={"X-Stream-Id": stream_id},
+        last_event_id=last_event_id
+    )
+
+
+@app.delete("/ask/streams/{stream_id}")
+async def cancel_answer_stream(stream_id: str, current_user: User = Depends(get_current_user)):
+    """Stop generating an answer, e.g. when the user presses stop."""
+    stream = answer_streams.get(stream_id, current_user.id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Answer stream not found or expired")
+    
+    answer_streams.cancel(stream)
+    return {"message": "Answer stream cancelled"}
+
+
+@app.post("/conversations")
+async def create_conversation(
+    conversation_data: dict,
+    current_user: User = Depends(get_current_user)
+):
+    """Start a conversation; pass its id as conversation_id to /ask for multi-turn chat."""
+    title = (conversation_data.get("title") or "New conversation")[:200]
+    conversation_id = await db_manager.create_conversation(current_user.id, title)
+    return {"conversation_id": conversation_id, "title": title}
+
+
+@app.get("/conversations/{conversation_id}/messages")
+async def get_conversation_messages(
+    conversation_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Get the persisted messages of a conversation."""
+    conversation = await db_manager.get_conversation(conversation_id)
+    if not conversation or conversation["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    messages = await db_manager.get_conversation_messages(conversation_id)
+    return {"conversation_id": conversation_id, "messages": messages}
+
+
+@app.patch("/admin/users/{user_id}")
+async def update_user(
+    user_id: str,
+    user_data: dict,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Change a user's role or active flag; cached tokens for the user are dropped."""
+    try:
+        role = UserRole(user_data["role"]) if "role" in user_data else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid role")
+    
+    user = await auth_manager.update_user(
+        user_id,
+        role=role,
+        is_active=user_data.get("is_active")
+    )
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return {"user": user.dict()}
+
+
+@app.get("/admin/traces")
+async def slowest_traces(
+    limit: int = 10,
+    window_minutes: float = 60,
+    name: Optional[str] = None,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Show the slowest recent traces broken down by span."""
+    if not tracer.enabled:
+        raise HTTPException(status_code=404, detail="Tracing is disabled")
+    
+    traces = await asyncio.get_event_loop().run_in_executor(
+        None,
+        lambda: tracer.exporter.slowest_traces(limit=limit, window_minutes=window_minutes, name=name)
+    )
+    return {"traces": traces}
+
+
+@app.get("/admin/traces/{trace_id}")
+async def get_trace(trace_id: str, current_user: User = Depends(get_current_admin_user)):
+    """Get every span recorded for a trace."""
+    if not tracer.enabled:
+        raise HTTPException(status_code=404, detail="Tracing is disabled")
+    
+    spans = await asyncio.get_event_loop().run_in_executor(
+        None,
+        lambda: tracer.exporter.get_trace(trace_id)
+    )
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return {"trace_id": trace_id, "spans": spans}
+
+
+@app.get("/admin/health/deep")
+async def deep_health_check(current_user: User = Depends(get_current_admin_user)):
+    """Run live probes of every component, including real embedding and LLM calls."""
+    await rate_limiter.check(current_user.id, "health_deep")
+    report = await health_monitor.deep_check()
+    return JSONResponse(report, status_code=200 if report["status"] == "healthy" else 503)
+
+
+@app.get("/admin/profiling/loop")
+async def event_loop_stats(current_user: User = Depends(get_current_admin_user)):
+    """Event loop lag percentiles and stacks of recent blocking callbacks."""
+    return loop_monitor.stats()
+
+
+@app.post("/admin/profiling/cpu")
+async def capture_cpu_profile(
+    seconds: float = Query(10, gt=0, le=settings.PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    loop_thread_only: bool = False,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Capture a sampling CPU profile as collapsed stacks for flamegraph tools."""
+    if cpu_profiler.busy:
+        raise HTTPException(status_code=409, detail="A CPU profile is already being captured")
+    
+    thread_id = threading.get_ident() if loop_thread_only else None
+    try:
+        result = await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: cpu_profiler.capture(seconds, interval_ms, thread_id)
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return PlainTextResponse(
+        result["collapsed"],
+        headers={"X-Profile-Samples": str(result["samples"]), "X-Profile-Seconds": str(result["seconds"])}
+    )
+
+
+@app.post("/admin/profiling/memory/start")
+async def start_memory_tracing(frames: int = Query(10, ge=1, le=100), current_user: User = Depends(get_current_admin_user)):
+    """Start tracemalloc and take a baseline snapshot."""
+    memory_profiler.start(frames)
+    return await asyncio.get_event_loop().run_in_executor(
+        None,
+        lambda: memory_profiler.take_snapshot("baseline")
+    )
+
+
+@app.post("/admin/profiling/memory/snapshots")
+async def take_memory_snapshot(label: Optional[str] = None, current_user: User = Depends(get_current_admin_user)):
+    """Take a labelled tracemalloc snapshot."""
+    try:
+        return await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: memory_profiler.take_snapshot(label)
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/admin/profiling/memory/diff")
+async def diff_memory_snapshots(
+    older: str = "baseline",
+    newer: str = None,
+    limit: int = Query(25, ge=1, le=500),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Top allocation changes between two snapshots."""
+    newer = newer or memory_profiler.latest_label
+    try:
+        stats = await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: memory_profiler.diff(older, newer, limit)
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"older": older, "newer": newer, "stats": stats}
+
+
+@app.post("/admin/profiling/memory/stop")
+async def stop_memory_tracing(current_user: User = Depends(get_current_admin_user)):
+    """Stop tracemalloc and discard snapshots."""
+    memory_profiler.stop()
+    return {"tracing": False}
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -0,0 +1,377 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Recording is a lock-protected bucket increment so it is cheap enough for the
+token-level hot path. The registry renders the Prometheus text format for the
+/metrics endpoint without requiring prometheus_client.
+"""
+
+import time
+import bisect
+import threading
+import functools
+from typing import Dict, List, Tuple, Optional
+
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing counter with optional labels."""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0.0)
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram; buckets are stored non-cumulatively and summed on render."""
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., +Inf count], sum, count
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def time(self, **labels) -> "_Timer":
+        """Context manager observing the elapsed seconds of its block."""
+        return _Timer(self, labels)
+    
+    def snapshot(self, **labels) -> Optional[Dict[str, float]]:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                return None
+            return {"sum": series[1], "count": series[2]}
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    """Times a block and records it into a histogram."""
+    
+    __slots__ = ("histogram", "labels", "start", "elapsed")
+    
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.elapsed = 0.0
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Holds all metrics and renders them in Prometheus text format."""
+    
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(name, lambda: Counter(name, documentation, labelnames))
+    
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(name, lambda: Histogram(name, documentation, labelnames, buckets))
+    
+    def _register(self, name: str, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+    
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Ingest pipeline
+PDF_PAGE_EXTRACT_SECONDS = REGISTRY.histogram(
+    "pdfqa_pdf_page_extract_seconds", "Time to extract text from a single PDF page", ("backend",))
+PDF_PAGES_TOTAL = REGISTRY.counter(
+    "pdfqa_pdf_pages_total", "PDF pages processed", ("result",))
+PDF_EXTRACTED_CHARS_TOTAL = REGISTRY.counter(
+    "pdfqa_pdf_extracted_chars_total", "Non-whitespace characters extracted from PDF pages", ("backend",))
+PDF_ANALYSIS_CACHE_TOTAL = REGISTRY.counter(
+    "pdfqa_pdf_analysis_cache_total", "PDF analysis lookups by cache result", ("result",))
+PDF_PAGE_FALLBACKS_TOTAL = REGISTRY.counter(
+    "pdfqa_pdf_page_fallbacks_total", "Pages extracted by a fallback backend after the chosen one failed", ("backend",))
+OCR_PAGE_SECONDS = REGISTRY.histogram(
+    "pdfqa_ocr_page_seconds", "Time to render and OCR one scanned page, including queueing",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120))
+OCR_PAGES_TOTAL = REGISTRY.counter(
+    "pdfqa_ocr_pages_total", "Scanned pages sent to OCR", ("result",))
+CHUNKING_SECONDS = REGISTRY.histogram(
+    "pdfqa_chunking_seconds", "Time to split a document into chunks")
+EMBEDDING_BATCH_SECONDS = REGISTRY.histogram(
+    "pdfqa_embedding_batch_seconds", "Time per embedding call", ("operation",))
+EMBEDDING_INPUTS_TOTAL = REGISTRY.counter(
+    "pdfqa_embedding_inputs_total", "Texts sent to the embedding model", ("operation",))
+VECTOR_UPSERT_SECONDS = REGISTRY.histogram(
+    "pdfqa_vector_upsert_seconds", "Time to write chunk vectors to the vector store")
+REINGEST_PAGES_TOTAL = REGISTRY.counter(
+    "pdfqa_reingest_pages_total", "Pages of revised documents by diff result", ("result",))
+DOCUMENT_SUMMARY_SECONDS = REGISTRY.histogram(
+    "pdfqa_document_summary_seconds", "Time to generate a document summary after ingest", ("method",),
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600))
+SUMMARY_LLM_CALLS_TOTAL = REGISTRY.counter(
+    "pdfqa_summary_llm_calls_total", "LLM calls made while summarizing documents", ("stage",))
+
+# Question answering
+RETRIEVAL_SECONDS = REGISTRY.histogram(
+    "pdfqa_retrieval_seconds", "Time spent in vector search", ("stage",))
+PROMPT_BUILD_SECONDS = REGISTRY.histogram(
+    "pdfqa_prompt_build_seconds", "Time to format context, citations and prompt")
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "pdfqa_context_tokens", "Tokens of retrieved context packed into the prompt",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000))
+CONTEXT_PASSAGES_DROPPED_TOTAL = REGISTRY.counter(
+    "pdfqa_context_passages_dropped_total", "Retrieved chunks merged, deduplicated or cut by the token budget", ("reason",))
+CONVERSATION_HISTORY_TOKENS = REGISTRY.histogram(
+    "pdfqa_conversation_history_tokens", "Tokens of conversation history added to the prompt",
+    buckets=(0, 100, 250, 500, 750, 1000, 1500, 2000, 3000))
+CONVERSATION_SUMMARY_SECONDS = REGISTRY.histogram(
+    "pdfqa_conversation_summary_seconds", "Time to fold older turns into a conversation summary")
+LLM_TTFT_SECONDS = REGISTRY.histogram(
+    "pdfqa_llm_time_to_first_token_seconds", "Time from LLM call to first streamed token", ("provider",))
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "pdfqa_llm_tokens_per_second", "Streaming generation rate per answer", ("provider",), RATE_BUCKETS)
+LLM_TOKENS_TOTAL = REGISTRY.counter(
+    "pdfqa_llm_tokens_total", "Streamed LLM token chunks", ("provider",))
+LLM_STREAMS_CANCELLED_TOTAL = REGISTRY.counter(
+    "pdfqa_llm_streams_cancelled_total", "LLM generations stopped early because no client was reading", ("provider",))
+LLM_TOKENS_SAVED_TOTAL = REGISTRY.counter(
+    "pdfqa_llm_tokens_saved_total",
+    "Estimated token chunks not generated thanks to cancellation, from the mean completed answer length",
+    ("provider",))
+ASK_LATENCY_SECONDS = REGISTRY.histogram(
+    "pdfqa_ask_latency_seconds", "End-to-end question latency", ("status",))
+COALESCED_REQUESTS_TOTAL = REGISTRY.counter(
+    "pdfqa_ask_coalesced_total", "Questions that started (leader) or joined (follower) a shared stream", ("role",))
+ASK_BATCH_QUESTIONS_TOTAL = REGISTRY.counter(
+    "pdfqa_ask_batch_questions_total", "Questions answered through /ask/batch", ("result",))
+SSE_WRITE_SECONDS = REGISTRY.histogram(
+    "pdfqa_sse_write_seconds", "Time to encode and hand one SSE frame to the client",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1))
+SSE_FRAMES_TOTAL = REGISTRY.counter(
+    "pdfqa_sse_frames_total", "SSE frames written to clients", ("kind",))
+SSE_EVENTS_PER_FRAME = REGISTRY.histogram(
+    "pdfqa_sse_events_per_frame", "Stream events coalesced into one SSE data frame",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+ANSWER_STREAMS_TOTAL = REGISTRY.counter(
+    "pdfqa_answer_streams_total", "Answer streams by how generation ended", ("outcome",))
+ANSWER_STREAM_RESUMES_TOTAL = REGISTRY.counter(
+    "pdfqa_answer_stream_resumes_total", "Reconnects to an answer stream with Last-Event-ID", ("result",))
+WS_CONNECTIONS_TOTAL = REGISTRY.counter(
+    "pdfqa_ws_connections_total", "Chat socket connections by authentication result", ("result",))
+WS_STREAMS_TOTAL = REGISTRY.counter(
+    "pdfqa_ws_streams_total", "Question streams on chat sockets by how they ended", ("outcome",))
+WS_FRAMES_TOTAL = REGISTRY.counter(
+    "pdfqa_ws_frames_total", "Frames written to chat sockets", ("kind",))
+WS_BACKPRESSURE_SECONDS = REGISTRY.histogram(
+    "pdfqa_ws_backpressure_seconds", "Time a chat stream paused its answer waiting for the client",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+SEARCH_SECONDS = REGISTRY.histogram(
+    "pdfqa_search_seconds", "Passage search latency, no generation", ("backend",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+QUERY_EMBEDDING_CACHE_TOTAL = REGISTRY.counter(
+    "pdfqa_query_embedding_cache_total", "Query embedding lookups by cache result", ("result",))
+
+# Runtime
+EVENT_LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "pdfqa_event_loop_lag_seconds", "How late the event loop ran a scheduled wakeup")
+EVENT_LOOP_STALLS_TOTAL = REGISTRY.counter(
+    "pdfqa_event_loop_stalls_total", "Callbacks that blocked the event loop past the stall threshold")
+
+HEALTH_CHECK_SECONDS = REGISTRY.histogram(
+    "pdfqa_health_check_seconds", "Health probe latency by component and depth", ("component", "depth"))
+HEALTH_CHECK_FAILURES_TOTAL = REGISTRY.counter(
+    "pdfqa_health_check_failures_total", "Failed or timed-out health probes", ("component", "depth"))
+
+# Authentication
+AUTH_HASH_SECONDS = REGISTRY.histogram(
+    "pdfqa_auth_hash_seconds", "bcrypt hash/verify latency including executor queueing", ("operation",))
+AUTH_HASH_REJECTED_TOTAL = REGISTRY.counter(
+    "pdfqa_auth_hash_rejected_total", "Password operations shed because the hashing queue was full", ("operation",))
+
+# Rate limiting and admission
+RATE_LIMITED_TOTAL = REGISTRY.counter(
+    "pdfqa_rate_limited_total", "Requests rejected by per-user rate limits", ("action",))
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "pdfqa_admission_wait_seconds", "Time a question waited for an LLM generation slot")
+ADMISSION_REJECTED_TOTAL = REGISTRY.counter(
+    "pdfqa_admission_rejected_total", "Questions rejected by LLM admission control", ("reason",))
+
+# Storage
+DB_CALL_SECONDS = REGISTRY.histogram(
+    "pdfqa_db_call_seconds", "DatabaseManager call latency", ("operation",))
+DB_ERRORS_TOTAL = REGISTRY.counter(
+    "pdfqa_db_errors_total", "DatabaseManager calls that raised", ("operation",))
+
+
+def timed_db_call(operation: str):
+    """Decorator recording latency and failures of an async DatabaseManager method."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                DB_ERRORS_TOTAL.inc(operation=operation)
+                raise
+            finally:
+                DB_CALL_SECONDS.observe(time.perf_counter() - start, operation=operation)
+        return wrapper
+    return decorator
+
+
+class StageTimings:
+    """Collects per-stage durations for a single request in milliseconds."""
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+    
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = round(self.stages.get(stage, 0.0) + seconds * 1000, 2)
+    
+    def elapsed_ms(self) -> int:
+        return int((time.perf_counter() - self.start) * 1000)
+    
+    def as_dict(self) -> Dict[str, float]:
+        return dict(self.stages)
+
+
+class GenerationMeter:
+    """Tracks time-to-first-token and token rate for one streamed LLM answer."""
+    
+    # Per provider: [completed answers, their token chunks], to estimate what cancellation saved
+    _completed: Dict[str, List[int]] = {}
+    
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.tokens = 0
+    
+    def token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            LLM_TTFT_SECONDS.observe(self.first_token_at - self.start, provider=self.provider)
+        self.tokens += 1
+    
+    def finish(self) -> Dict[str, float]:
+        end = time.perf_counter()
+        LLM_TOKENS_TOTAL.inc(self.tokens, provider=self.provider)
+        completed = GenerationMeter._completed.setdefault(self.provider, [0, 0])
+        completed[0] += 1
+        completed[1] += self.tokens
+        
+        result = {"llm_total_ms": round((end - self.start) * 1000, 2)}
+        if self.first_token_at is not None:
+            result["llm_ttft_ms"] = round((self.first_token_at - self.start) * 1000, 2)
+            generation = end - self.first_token_at
+            if generation > 0 and self.tokens > 1:
+                tokens_per_second = (self.tokens - 1) / generation
+                LLM_TOKENS_PER_SECOND.observe(tokens_per_second, provider=self.provider)
+                result["tokens_per_second"] = round(tokens_per_second, 2)
+        return result
+    
+    def cancel(self):
+        """Record a generation abandoned before it finished."""
+        LLM_TOKENS_TOTAL.inc(self.tokens, provider=self.provider)
+        LLM_STREAMS_CANCELLED_TOTAL.inc(provider=self.provider)
+        answers, tokens = GenerationMeter._completed.get(self.provider, (0, 0))
+        if answers:
+            LLM_TOKENS_SAVED_TOTAL.inc(max(0.0, tokens / answers - self.tokens), provider=self.provider)
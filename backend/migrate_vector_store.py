@@ -0,0 +1,72 @@
+"""
+One-shot copy of an embedded Chroma index into a Chroma server.
+
+Deployments that ran with VECTOR_DB_MODE=embedded keep their index in
+VECTOR_DB_PERSIST_DIR. Switching to VECTOR_DB_MODE=http starts from the
+server's empty index, so run this once, with the http settings in the
+environment, before starting the API against the server:
+    
+    python migrate_vector_store.py
+
+With docker-compose (the old ./backend/chroma_db volume is still mounted):
+    
+    docker compose up -d chroma
+    docker compose run --rm backend python migrate_vector_store.py
+
+The copy keeps the stored embeddings, so nothing is re-embedded, and it can
+be re-run safely. Documents can instead be re-ingested from the UI.
+"""
+
+import argparse
+import logging
+import os
+
+import chromadb
+
+from chroma_client import copy_collections, create_chroma_client
+from config import Settings
+
+
+def main():
+    settings = Settings()
+    parser = argparse.ArgumentParser(description="Copy an embedded Chroma index into a Chroma server")
+    parser.add_argument(
+        "--source",
+        default=settings.VECTOR_DB_PERSIST_DIR,
+        help="Embedded index directory (default: VECTOR_DB_PERSIST_DIR)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=settings.VECTOR_DB_UPSERT_BATCH_SIZE,
+        help="Records read and written per request (default: VECTOR_DB_UPSERT_BATCH_SIZE)"
+    )
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    
+    if settings.VECTOR_DB_MODE != "http":
+        parser.error("set VECTOR_DB_MODE=http and the VECTOR_DB_HOST/PORT of the target server")
+    if not os.path.isdir(args.source):
+        parser.error(f"no embedded index at {args.source}")
+    
+    source = chromadb.PersistentClient(path=args.source)
+    target = create_chroma_client(
+        mode="http",
+        host=settings.VECTOR_DB_HOST,
+        port=settings.VECTOR_DB_PORT,
+        ssl=settings.VECTOR_DB_SSL,
+        auth_token=settings.VECTOR_DB_AUTH_TOKEN,
+        pool_size=1,
+        connect_timeout=settings.VECTOR_DB_CONNECT_TIMEOUT_SECONDS,
+        timeout=settings.VECTOR_DB_TIMEOUT_SECONDS,
+        retries=settings.VECTOR_DB_RETRIES
+    )
+    
+    copied = copy_collections(source, target, batch_size=args.batch_size)
+    for name, count in copied.items():
+        print(f"{name}: {count} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -62,6 +62,7 @@ class Document(DocumentBase):
     status: DocumentStatus = DocumentStatus.PROCESSING
     page_count: Optional[int] = None
     chunk_count: Optional[int] = None
+    version: int = 1
     error: Optional[str] = None
     created_at: datetime
     updated_at: datetime
@@ -87,7 +88,7 @@ class DocumentChunk(BaseModel):
     page: int
     text: str
     metadata: ChunkMetadata
-    
+
 
 class Citation(BaseModel):
     """Citation model for answers."""
@@ -108,12 +109,20 @@ class QuestionRequest(BaseModel):
     conversation_id: Optional[str] = None
 
 
+class BatchQuestionRequest(BaseModel):
+    """Request model for answering many questions about the same documents."""
+    questions: List[str] = Field(..., min_length=1)
+    doc_ids: Optional[List[str]] = None
+    k: int = Field(default=6, ge=1, le=20)
+
+
 class ChatResponse(BaseModel):
     """Response model for chat."""
     answer: str
     citations: List[Citation]
     usage: Optional[Dict[str, Any]] = None
     latency_ms: Optional[int] = None
+    timings: Optional[Dict[str, float]] = None
     conversation_id: Optional[str] = None
 
 
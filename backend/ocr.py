@@ -0,0 +1,147 @@
+"""
+OCR for scanned PDF pages.
+
+Image-only pages are rendered with PDFium and recognized with a local
+Tesseract install. Both steps are CPU-bound, so they run in a separate
+process pool rather than the event loop's thread pool. The pool is created
+on first use, has a fixed number of workers, and at most `max_pending` pages
+are queued on it at once across all documents, so a large scan cannot starve
+other uploads of memory or CPU. Results are yielded as each page finishes,
+in completion order, so callers can index them without waiting for the
+slowest page.
+"""
+
+import time
+import shutil
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional, Tuple
+
+from metrics import OCR_PAGE_SECONDS, OCR_PAGES_TOTAL
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def _ocr_page(file_path: str, page_num: int, dpi: int, language: str, timeout: float = 0) -> str:
+    """Render one page and OCR it. Runs in a worker process; Tesseract is killed after `timeout` seconds."""
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        page = pdf[page_num - 1]
+        try:
+            image = page.render(scale=dpi / 72).to_pil()
+        finally:
+            page.close()
+    finally:
+        pdf.close()
+    return pytesseract.image_to_string(image, lang=language, timeout=timeout)
+
+
+class OCRPool:
+    """Bounded process pool that OCRs scanned pages."""
+    
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_pending: int = 32,
+        language: str = "eng",
+        dpi: int = 300,
+        page_timeout: float = 120.0
+    ):
+        self.max_workers = max_workers
+        self.language = language
+        self.dpi = dpi
+        self.page_timeout = page_timeout
+        self._slots = asyncio.Semaphore(max(1, max_pending))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._available: Optional[bool] = None
+    
+    def is_available(self) -> bool:
+        """Whether pytesseract, pypdfium2 and the tesseract binary are all installed."""
+        if self._available is None:
+            self._available = (
+                pytesseract is not None
+                and pdfium is not None
+                and shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+            )
+            if not self._available:
+                logger.warning("OCR unavailable: install pytesseract, pypdfium2 and the tesseract binary")
+        return self._available
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            logger.info(f"Started OCR pool with {self.max_workers} workers")
+        return self._executor
+    
+    async def _recognize_page(self, file_path: str, page_num: int) -> Tuple[int, Optional[str]]:
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        
+        # Giving up on a page (timeout or cancellation) only removes it from the
+        # pool's queue; a worker already OCRing it carries on. The slot is held
+        # until the worker is done, so abandoned pages still count toward
+        # max_pending, and Tesseract itself is stopped at the page timeout.
+        try:
+            try:
+                work = self._get_executor().submit(
+                    _ocr_page, file_path, page_num, self.dpi, self.language, self.page_timeout
+                )
+            except BaseException:
+                self._slots.release()
+                raise
+            work.add_done_callback(lambda _: loop.call_soon_threadsafe(self._slots.release))
+            
+            text = await asyncio.wait_for(asyncio.wrap_future(work), timeout=self.page_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"OCR timed out on page {page_num} of {file_path}")
+            OCR_PAGES_TOTAL.inc(result="timeout")
+            return page_num, None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"OCR failed on page {page_num} of {file_path}: {e}")
+            OCR_PAGES_TOTAL.inc(result="error")
+            return page_num, None
+        finally:
+            OCR_PAGE_SECONDS.observe(time.perf_counter() - start)
+        
+        OCR_PAGES_TOTAL.inc(result="text" if text.strip() else "empty")
+        return page_num, text
+    
+    async def recognize(self, file_path: str, page_numbers: List[int]) -> AsyncIterator[Tuple[int, Optional[str]]]:
+        """
+        OCR pages of a PDF.
+        
+        Args:
+            file_path: Path to the PDF file
+            page_numbers: 1-based page numbers to OCR
+        
+        Yields:
+            (page number, text or None if OCR failed) as each page finishes
+        """
+        tasks = [asyncio.ensure_future(self._recognize_page(file_path, page_num)) for page_num in page_numbers]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Abandoned or cancelled: drop this document's queued pages
+            for task in tasks:
+                task.cancel()
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,207 @@
+"""
+Passage search without generation.
+
+Helpers shared by the /search endpoints: query terms and highlight spans for
+any passage, a lexical ranker over page text held in memory (used by the
+Gemini entry points, which have no vector store), and pagination.
+
+Lexical search finds every occurrence of a query term (word-prefix,
+case-insensitive), cuts a window of context around each hit, merges
+overlapping windows into passages and ranks them with BM25 weights computed
+across the pages searched. Offsets are exact character positions in the page
+text, so clients can jump to and highlight the passage.
+"""
+
+import re
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how i in is it of on or that the this to was what when where "
+    "which who why with".split()
+)
+
+_WORD = re.compile(r"\w+")
+
+# Suffixes dropped so a term matches its other word forms by prefix,
+# e.g. "calibrate" -> "calibrat" matches "calibrated" and "calibration"
+_SUFFIXES = ("ations", "ation", "ings", "ing", "ions", "ion", "ies", "es", "ed", "e", "s")
+
+# BM25 term-frequency saturation
+_K1 = 1.2
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def query_terms(query: str) -> List[str]:
+    """Lowercased, stemmed query words, longest first; stopwords are dropped unless nothing else is left."""
+    words = [word for word in _WORD.findall(query.lower()) if len(word) > 1]
+    terms = [_stem(word) for word in words if word not in STOPWORDS] or words
+    return sorted(set(terms), key=lambda term: (-len(term), term))
+
+
+def _terms_regex(terms: List[str]) -> str:
+    return r"(?:" + "|".join(re.escape(term) for term in terms) + r")\w*"
+
+
+def term_pattern(terms: List[str]) -> Optional["re.Pattern"]:
+    """Regex matching any term at the start of a word, e.g. 'calibrat' matches 'calibration'."""
+    if not terms:
+        return None
+    return re.compile(r"\b" + _terms_regex(terms), re.IGNORECASE)
+
+
+def highlight_spans(text: str, pattern: Optional["re.Pattern"]) -> List[Dict[str, int]]:
+    """Character spans of query-term matches in `text`."""
+    if pattern is None:
+        return []
+    return [{"start": match.start(), "end": match.end()} for match in pattern.finditer(text)]
+
+
+def make_passage(
+    doc_id: str,
+    doc_name: str,
+    page: int,
+    char_start: int,
+    text: str,
+    score: float,
+    pattern: Optional["re.Pattern"]
+) -> Dict[str, Any]:
+    """
+    Result entry for one passage.
+    
+    `char_start`/`char_end` locate the passage in its page text; highlight
+    spans are relative to the passage `text`.
+    """
+    return {
+        "doc_id": doc_id,
+        "doc_name": doc_name,
+        "page": page,
+        "char_start": char_start,
+        "char_end": char_start + len(text),
+        "text": text,
+        "score": round(score, 4),
+        "highlights": highlight_spans(text, pattern)
+    }
+
+
+def _snap(text: str, start: int, end: int, first_hit: int, last_hit: int) -> Tuple[int, int]:
+    """Move window edges to whitespace so passages do not start or end mid-word."""
+    if start > 0:
+        space = text.find(" ", start, first_hit)
+        if space != -1:
+            start = space + 1
+    if end < len(text):
+        space = text.rfind(" ", last_hit, end)
+        if space != -1:
+            end = space
+    return start, end
+
+
+def search_pages(
+    pages: Iterable[Tuple[str, str, int, str]],
+    query: str,
+    context_chars: int = 160,
+    max_results: int = 100
+) -> List[Dict[str, Any]]:
+    """
+    Rank passages of in-memory page text against a query.
+    
+    Args:
+        pages: (doc_id, doc_name, page number, page text) tuples
+        query: Search query
+        context_chars: Context kept on each side of a hit
+        max_results: Most passages returned
+    
+    Returns:
+        Passages (see make_passage), best first
+    """
+    terms = query_terms(query)
+    pattern = term_pattern(terms)
+    if pattern is None:
+        return []
+    # Scanning whole pages with a leading \b is several times slower than
+    # checking the word boundary of each match afterwards
+    scan = re.compile(_terms_regex(terms), re.IGNORECASE)
+    
+    # Which term a matched word belongs to; words repeat, so this is memoized
+    term_of: Dict[str, str] = {}
+    
+    def match_term(word: str) -> str:
+        term = term_of.get(word)
+        if term is None:
+            lowered = word.lower()
+            term = term_of[word] = next((term for term in terms if lowered.startswith(term)), lowered)
+        return term
+    
+    # One pass over the text to find hits and document frequencies
+    page_hits = []
+    document_frequency = {term: 0 for term in terms}
+    page_count = 0
+    for doc_id, doc_name, page, text in pages:
+        page_count += 1
+        # Most pages contain no term at all, which a substring test settles cheaply
+        lowered = text.lower()
+        if not any(term in lowered for term in terms):
+            continue
+        hits = [
+            (match.start(), match.end(), match_term(match.group()))
+            for match in scan.finditer(text)
+            if match.start() == 0 or not _WORD.match(text, match.start() - 1)
+        ]
+        if not hits:
+            continue
+        page_hits.append((doc_id, doc_name, page, text, hits))
+        for term in {term for _, _, term in hits}:
+            document_frequency[term] += 1
+    
+    idf = {
+        term: math.log(1 + (page_count - frequency + 0.5) / (frequency + 0.5))
+        for term, frequency in document_frequency.items()
+    }
+    
+    passages = []
+    for doc_id, doc_name, page, text, hits in page_hits:
+        # Merge overlapping context windows into passages
+        windows = []
+        for start, end, term in hits:
+            window_start = max(0, start - context_chars)
+            window_end = min(len(text), end + context_chars)
+            if windows and window_start <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], window_end)
+                windows[-1][2].append((start, end, term))
+            else:
+                windows.append([window_start, window_end, [(start, end, term)]])
+        
+        for window_start, window_end, window_hits in windows:
+            frequencies = {}
+            for _, _, term in window_hits:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            score = sum(
+                idf[term] * count * (_K1 + 1) / (count + _K1)
+                for term, count in frequencies.items()
+            )
+            start, end = _snap(text, window_start, window_end, window_hits[0][0], window_hits[-1][1])
+            passages.append((score, doc_id, doc_name, page, start, text[start:end]))
+    
+    passages.sort(key=lambda passage: -passage[0])
+    return [
+        make_passage(doc_id, doc_name, page, start, passage_text, score, pattern)
+        for score, doc_id, doc_name, page, start, passage_text in passages[:max_results]
+    ]
+
+
+def paginate(results: List[Dict[str, Any]], offset: int, limit: int) -> Dict[str, Any]:
+    """Slice ranked results; `has_more` tells clients whether another page exists."""
+    return {
+        "results": results[offset:offset + limit],
+        "offset": offset,
+        "limit": limit,
+        "has_more": len(results) > offset + limit
+    }
@@ -0,0 +1,124 @@
+"""
+Single-pass PDF analysis cached by file content.
+
+Validation, metadata, page count, encryption state and page text all come
+from one parse of the file. The file is hashed through a read-only memory
+map, and results are kept in a small LRU keyed by that hash, so asking again
+about the same bytes (a retried upload, a re-ingest of an unchanged file, or
+validate followed by extract) does not parse the PDF again.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from pdf_backends import PDFExtractor, map_file
+from metrics import PDF_ANALYSIS_CACHE_TOTAL
+
+
+logger = logging.getLogger(__name__)
+
+
+class PDFAnalysis:
+    """Everything known about one PDF's contents."""
+    
+    __slots__ = ("file_hash", "valid", "error", "page_count", "encrypted", "metadata", "pages", "backend")
+    
+    def __init__(
+        self,
+        file_hash: str,
+        valid: bool,
+        error: Optional[str] = None,
+        page_count: int = 0,
+        encrypted: bool = False,
+        metadata: Optional[Dict[str, str]] = None,
+        pages: Optional[List[Tuple[int, Optional[str], Optional[str], str]]] = None,
+        backend: Optional[str] = None
+    ):
+        self.file_hash = file_hash
+        self.valid = valid
+        self.error = error
+        self.page_count = page_count
+        self.encrypted = encrypted
+        self.metadata = metadata or {}
+        # (page number, raw text or None if extraction failed, backend used, page kind)
+        self.pages = pages or []
+        self.backend = backend
+    
+    def info(self) -> Dict[str, Any]:
+        """Basic information in the shape returned by PDFProcessor.get_pdf_info."""
+        return {"pages": self.page_count, "encrypted": self.encrypted, "metadata": self.metadata}
+    
+    def page_numbers(self, kind: str) -> List[int]:
+        """Numbers of the pages classified as `kind`."""
+        return [page_num for page_num, _, _, page_kind in self.pages if page_kind == kind]
+
+
+def hash_file(file_path: str) -> str:
+    """SHA-256 of a file's contents, read through a memory map."""
+    try:
+        mapped = map_file(file_path)
+    except ValueError:
+        # mmap refuses empty files
+        return hashlib.sha256(b"").hexdigest()
+    
+    try:
+        return hashlib.sha256(mapped).hexdigest()
+    finally:
+        mapped.close()
+
+
+class PDFAnalyzer:
+    """Runs the extractor once per distinct file content and caches the result."""
+    
+    def __init__(self, extractor: PDFExtractor, cache_size: int = 16):
+        self.extractor = extractor
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, PDFAnalysis]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def analyze(self, file_path: str) -> PDFAnalysis:
+        """
+        Analyze a PDF. Blocking; run it in an executor from async code.
+        
+        Returns:
+            PDFAnalysis; unreadable files give valid=False with the error instead of raising
+        """
+        file_hash = hash_file(file_path)
+        
+        with self._lock:
+            cached = self._cache.get(file_hash)
+            if cached is not None:
+                self._cache.move_to_end(file_hash)
+                PDF_ANALYSIS_CACHE_TOTAL.inc(result="hit")
+                return cached
+        
+        PDF_ANALYSIS_CACHE_TOTAL.inc(result="miss")
+        try:
+            extraction = self.extractor.extract(file_path)
+        except Exception as e:
+            logger.warning(f"Could not parse PDF {file_path}: {e}")
+            # Not cached: the failure may be transient, and invalid files are cheap to reject again
+            return PDFAnalysis(file_hash, valid=False, error=str(e))
+        
+        readable = any(text is not None for _, text, _, _ in extraction.pages)
+        analysis = PDFAnalysis(
+            file_hash,
+            valid=extraction.page_count > 0 and readable,
+            error=None if readable else "No page could be read",
+            page_count=extraction.page_count,
+            encrypted=extraction.encrypted,
+            metadata=extraction.metadata,
+            pages=extraction.pages,
+            backend=extraction.backend
+        )
+        
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[file_hash] = analysis
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        
+        return analysis
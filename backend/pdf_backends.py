@@ -0,0 +1,512 @@
+"""
+Pluggable PDF text extraction backends.
+
+Each backend wraps one parser library (pypdf/PyPDF2, pdfminer.six, pypdfium2)
+behind the same open/page_text interface and is only offered when its library
+is installed. In auto mode the extractor probes a few sample pages of each
+document with every available backend, then extracts with the one that has
+the lowest estimated cost for the whole document among those whose extracted
+character count reaches a quality floor relative to the best backend. Pages
+the chosen backend fails on are retried with the other backends.
+
+Every page is also classified as text, mixed (text plus images), image-only
+or empty from its visible character count and the image XObjects it draws,
+so scanned pages can be sent to OCR instead of being silently dropped.
+"""
+
+import mmap
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import PDF_PAGE_EXTRACT_SECONDS, PDF_EXTRACTED_CHARS_TOTAL, PDF_PAGE_FALLBACKS_TOTAL
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
+        PdfReader = None
+
+try:
+    from io import StringIO
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+except ImportError:
+    PDFPage = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# Normalized metadata key -> PDF document information entry
+METADATA_FIELDS = {
+    "title": "Title",
+    "author": "Author",
+    "subject": "Subject",
+    "creator": "Creator",
+    "producer": "Producer",
+    "creation_date": "CreationDate",
+    "modification_date": "ModDate",
+}
+
+
+def visible_chars(text: Optional[str]) -> int:
+    """Characters excluding whitespace, so backends that lay out text differently compare fairly."""
+    return len("".join(text.split())) if text else 0
+
+
+def classify_page(text: Optional[str], images: Optional[int], min_text_chars: int) -> str:
+    """
+    Classify a page by its text density and image XObjects.
+    
+    Returns:
+        "text", "mixed", "image" (a scan, or a page whose only text is a
+        stray page number), "empty", or "error" when no backend could read it
+    """
+    if text is None:
+        return "error"
+    
+    chars = visible_chars(text)
+    if chars >= min_text_chars:
+        return "mixed" if images else "text"
+    if images:
+        return "image"
+    return "text" if chars else "empty"
+
+
+def pypdf_page_images(page) -> int:
+    """Image XObjects in a pypdf or PyPDF2 page's resources."""
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if not xobjects:
+        return 0
+    return sum(
+        1 for xobject in xobjects.get_object().values()
+        if xobject.get_object().get("/Subtype") == "/Image"
+    )
+
+
+def map_file(file_path: str) -> mmap.mmap:
+    """Read-only memory map of a file; the OS page cache backs it, so nothing is copied."""
+    with open(file_path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _normalize_metadata(info: Dict[str, Any]) -> Dict[str, str]:
+    metadata = {}
+    for key, field in METADATA_FIELDS.items():
+        value = info.get(field, info.get("/" + field))
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", "replace")
+        metadata[key] = str(value) if value else ""
+    return metadata
+
+
+class OpenedPDF:
+    """A document opened by one backend."""
+    
+    page_count = 0
+    encrypted = False
+    
+    def page_text(self, index: int) -> str:
+        raise NotImplementedError
+    
+    def page_images(self, index: int) -> Optional[int]:
+        """Number of image XObjects the page draws, or None if the backend cannot tell."""
+        return None
+    
+    def metadata(self) -> Dict[str, str]:
+        return {}
+    
+    def close(self):
+        pass
+
+
+class PDFBackend:
+    """A text extraction library."""
+    
+    name = ""
+    
+    def is_available(self) -> bool:
+        raise NotImplementedError
+    
+    def open(self, file_path: str) -> OpenedPDF:
+        raise NotImplementedError
+
+
+class _PyPDFDocument(OpenedPDF):
+    def __init__(self, file_path: str):
+        self._map = map_file(file_path)
+        try:
+            self._reader = PdfReader(self._map)
+            self.encrypted = self._reader.is_encrypted
+            if self.encrypted:
+                # Owner-password-only PDFs open with an empty user password
+                self._reader.decrypt("")
+            self.page_count = len(self._reader.pages)
+        except Exception:
+            self._map.close()
+            raise
+    
+    def page_text(self, index: int) -> str:
+        return self._reader.pages[index].extract_text() or ""
+    
+    def page_images(self, index: int) -> Optional[int]:
+        return pypdf_page_images(self._reader.pages[index])
+    
+    def metadata(self) -> Dict[str, str]:
+        return _normalize_metadata(self._reader.metadata or {})
+    
+    def close(self):
+        self._map.close()
+
+
+class PyPDFBackend(PDFBackend):
+    """pypdf, or PyPDF2 where only the older package is installed. Pure Python."""
+    
+    name = "pypdf"
+    
+    def is_available(self) -> bool:
+        return PdfReader is not None
+    
+    def open(self, file_path: str) -> OpenedPDF:
+        return _PyPDFDocument(file_path)
+
+
+class _PdfMinerDocument(OpenedPDF):
+    def __init__(self, file_path: str):
+        self._map = map_file(file_path)
+        try:
+            self._document = PDFDocument(PDFParser(self._map))
+            self.encrypted = self._document.encryption is not None
+            self._pages = list(PDFPage.create_pages(self._document))
+            self.page_count = len(self._pages)
+        except Exception:
+            self._map.close()
+            raise
+        self._resources = PDFResourceManager(caching=True)
+        self._laparams = LAParams()
+    
+    def page_text(self, index: int) -> str:
+        output = StringIO()
+        converter = TextConverter(self._resources, output, laparams=self._laparams)
+        try:
+            PDFPageInterpreter(self._resources, converter).process_page(self._pages[index])
+        finally:
+            converter.close()
+        return output.getvalue()
+    
+    def page_images(self, index: int) -> Optional[int]:
+        resources = resolve1(self._pages[index].resources) or {}
+        xobjects = resolve1(resources.get("XObject")) or {}
+        return sum(
+            1 for xobject in xobjects.values()
+            if getattr(resolve1(xobject).get("Subtype"), "name", None) == "Image"
+        )
+    
+    def metadata(self) -> Dict[str, str]:
+        info = resolve1(self._document.info[0]) if self._document.info else {}
+        return _normalize_metadata({key: resolve1(value) for key, value in info.items()})
+    
+    def close(self):
+        self._map.close()
+
+
+class PdfMinerBackend(PDFBackend):
+    """pdfminer.six: slow, but its layout analysis copes well with unusual encodings."""
+    
+    name = "pdfminer"
+    
+    def is_available(self) -> bool:
+        return PDFPage is not None
+    
+    def open(self, file_path: str) -> OpenedPDF:
+        return _PdfMinerDocument(file_path)
+
+
+class _PdfiumDocument(OpenedPDF):
+    def __init__(self, file_path: str):
+        # PDFium reads the file natively; no Python-side buffer is needed
+        self._pdf = pdfium.PdfDocument(file_path)
+        self.page_count = len(self._pdf)
+        try:
+            self.encrypted = pdfium.raw.FPDF_GetSecurityHandlerRevision(self._pdf) != -1
+        except Exception:
+            pass
+    
+    def page_text(self, index: int) -> str:
+        page = self._pdf[index]
+        try:
+            textpage = page.get_textpage()
+            try:
+                return textpage.get_text_range()
+            finally:
+                textpage.close()
+        finally:
+            page.close()
+    
+    def page_images(self, index: int) -> Optional[int]:
+        page = self._pdf[index]
+        try:
+            return sum(1 for _ in page.get_objects(filter=[pdfium.raw.FPDF_PAGEOBJ_IMAGE]))
+        finally:
+            page.close()
+    
+    def metadata(self) -> Dict[str, str]:
+        return _normalize_metadata(self._pdf.get_metadata_dict())
+    
+    def close(self):
+        self._pdf.close()
+
+
+class PdfiumBackend(PDFBackend):
+    """pypdfium2: bindings to Chromium's PDFium, usually the fastest."""
+    
+    name = "pdfium"
+    
+    def is_available(self) -> bool:
+        return pdfium is not None
+    
+    def open(self, file_path: str) -> OpenedPDF:
+        return _PdfiumDocument(file_path)
+
+
+BACKENDS: Dict[str, PDFBackend] = {
+    backend.name: backend for backend in (PdfiumBackend(), PyPDFBackend(), PdfMinerBackend())
+}
+
+
+def available_backends() -> List[PDFBackend]:
+    return [backend for backend in BACKENDS.values() if backend.is_available()]
+
+
+class BackendStats:
+    """Running per-backend extraction totals."""
+    
+    def __init__(self):
+        self.pages = 0
+        self.seconds = 0.0
+        self.chars = 0
+        self.errors = 0
+        self.selected = 0
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "pages": self.pages,
+            "errors": self.errors,
+            "selected": self.selected,
+            "pages_per_second": round(self.pages / self.seconds, 2) if self.seconds > 0 else None,
+            "chars_per_page": round(self.chars / self.pages, 1) if self.pages else None
+        }
+
+
+class Extraction:
+    """Everything one pass over a document produced."""
+    
+    __slots__ = ("pages", "backend", "page_count", "encrypted", "metadata")
+    
+    def __init__(
+        self,
+        pages: List[Tuple[int, Optional[str], Optional[str], str]],
+        backend: str,
+        page_count: int,
+        encrypted: bool,
+        metadata: Dict[str, str]
+    ):
+        # (page number, text or None if every backend failed, backend used, page kind)
+        self.pages = pages
+        self.backend = backend
+        self.page_count = page_count
+        self.encrypted = encrypted
+        self.metadata = metadata
+
+
+class PDFExtractor:
+    """Extracts page text with the cheapest backend that meets the quality floor."""
+    
+    def __init__(
+        self,
+        backend: str = "auto",
+        quality_floor: float = 0.9,
+        probe_pages: int = 2,
+        min_text_chars: int = 50
+    ):
+        """
+        Args:
+            backend: "auto", or the name of a backend to always use first
+            quality_floor: Minimum share of the best backend's extracted characters
+            probe_pages: Sample pages per document used to compare backends
+            min_text_chars: Visible characters below which a page with images counts as image-only
+        """
+        available = available_backends()
+        if not available:
+            raise RuntimeError("No PDF parser is installed (install pypdf, pdfminer.six or pypdfium2)")
+        
+        if backend != "auto":
+            preferred = BACKENDS.get(backend)
+            if preferred is None or not preferred.is_available():
+                raise ValueError(f"PDF backend {backend!r} is not available")
+            available = [preferred] + [b for b in available if b is not preferred]
+        
+        self.mode = backend
+        self.backends = available
+        self.quality_floor = quality_floor
+        self.probe_pages = probe_pages
+        self.min_text_chars = min_text_chars
+        self.stats = {b.name: BackendStats() for b in self.backends}
+    
+    def extract(self, file_path: str) -> Extraction:
+        """Extract the raw text of every page, plus the document's metadata."""
+        opened: Dict[str, OpenedPDF] = {}
+        try:
+            ranked, probed = self._rank(file_path, opened)
+            primary = ranked[0]
+            self.stats[primary.name].selected += 1
+            document = self._open(primary, file_path, opened)
+            
+            pages = []
+            for index in range(document.page_count):
+                text = probed.get((primary.name, index))
+                used = primary.name
+                if text is None:
+                    text, used = self._extract_page(ranked, file_path, opened, index)
+                kind = classify_page(text, self._page_images(document, file_path, index), self.min_text_chars)
+                pages.append((index + 1, text, used, kind))
+            
+            try:
+                metadata = document.metadata()
+            except Exception as e:
+                logger.warning(f"Could not read metadata of {file_path}: {e}")
+                metadata = {}
+            
+            return Extraction(pages, primary.name, document.page_count, document.encrypted, metadata)
+        finally:
+            for document in opened.values():
+                try:
+                    document.close()
+                except Exception:
+                    pass
+    
+    def _open(self, backend: PDFBackend, file_path: str, opened: Dict[str, OpenedPDF]) -> OpenedPDF:
+        if backend.name not in opened:
+            opened[backend.name] = backend.open(file_path)
+        return opened[backend.name]
+    
+    def _page_images(self, document: OpenedPDF, file_path: str, index: int) -> Optional[int]:
+        try:
+            return document.page_images(index)
+        except Exception as e:
+            logger.warning(f"Could not list images on page {index + 1} of {file_path}: {e}")
+            return None
+    
+    def _timed_page(self, backend: PDFBackend, document: OpenedPDF, index: int) -> str:
+        stats = self.stats[backend.name]
+        start = time.perf_counter()
+        try:
+            text = document.page_text(index)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            PDF_PAGE_EXTRACT_SECONDS.observe(elapsed, backend=backend.name)
+        
+        chars = visible_chars(text)
+        stats.pages += 1
+        stats.seconds += elapsed
+        stats.chars += chars
+        PDF_EXTRACTED_CHARS_TOTAL.inc(chars, backend=backend.name)
+        return text
+    
+    def _extract_page(
+        self,
+        ranked: List[PDFBackend],
+        file_path: str,
+        opened: Dict[str, OpenedPDF],
+        index: int
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """Extract one page, falling back through the ranked backends on errors."""
+        for position, backend in enumerate(ranked):
+            try:
+                document = self._open(backend, file_path, opened)
+                text = self._timed_page(backend, document, index)
+            except Exception as e:
+                logger.warning(f"{backend.name} failed on page {index + 1} of {file_path}: {e}")
+                continue
+            
+            if position > 0:
+                PDF_PAGE_FALLBACKS_TOTAL.inc(backend=backend.name)
+            return text, backend.name
+        
+        return None, None
+    
+    def _rank(
+        self,
+        file_path: str,
+        opened: Dict[str, OpenedPDF]
+    ) -> Tuple[List[PDFBackend], Dict[Tuple[str, int], str]]:
+        """
+        Order backends by preference for this document.
+        
+        Returns:
+            The ranked backends and the probe texts, keyed by (backend, page index),
+            so the winner does not extract its sample pages twice
+        """
+        if self.mode != "auto" or len(self.backends) == 1:
+            return self.backends, {}
+        
+        probed: Dict[Tuple[str, int], str] = {}
+        costs: Dict[str, float] = {}
+        chars: Dict[str, int] = {}
+        
+        for backend in self.backends:
+            try:
+                start = time.perf_counter()
+                document = self._open(backend, file_path, opened)
+                open_seconds = time.perf_counter() - start
+                
+                count = document.page_count
+                sample = sorted({i * count // self.probe_pages for i in range(self.probe_pages)} & set(range(count)))
+                
+                start = time.perf_counter()
+                total = 0
+                for index in sample:
+                    text = self._timed_page(backend, document, index)
+                    probed[(backend.name, index)] = text
+                    total += visible_chars(text)
+                per_page = (time.perf_counter() - start) / max(1, len(sample))
+            except Exception as e:
+                logger.warning(f"{backend.name} failed to probe {file_path}: {e}")
+                continue
+            
+            # Opening parses the xref and object tables, so it counts once per document
+            costs[backend.name] = open_seconds + per_page * count
+            chars[backend.name] = total
+        
+        if not costs:
+            return self.backends, probed
+        
+        best_chars = max(chars.values())
+        
+        def rank_key(backend: PDFBackend):
+            if backend.name not in costs:
+                return (2, 0.0)
+            meets_floor = best_chars == 0 or chars[backend.name] >= self.quality_floor * best_chars
+            return (0 if meets_floor else 1, costs[backend.name])
+        
+        return sorted(self.backends, key=rank_key), probed
+    
+    def backend_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
@@ -3,20 +3,18 @@ PDF processing module for extracting and chunking text.
 """
 
 import os
-from typing import List, Dict, Any
+import asyncio
+from typing import AsyncIterator, List, Dict, Any, Optional
 from pathlib import Path
 import logging
 
-try:
-    from PyPDF2 import PdfReader
-except ImportError:
-    try:
-        from pypdf import PdfReader
-    except ImportError:
-        from pypdf2 import PdfFileReader as PdfReader
-
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from models import DocumentChunk, ChunkMetadata
+from metrics import PDF_PAGES_TOTAL, CHUNKING_SECONDS
+from pdf_backends import PDFExtractor
+from pdf_analysis import PDFAnalysis, PDFAnalyzer
+from ocr import OCRPool
+from tracing import tracer
 
 
 logger = logging.getLogger(__name__)
@@ -33,6 +31,20 @@ class PDFProcessor:
             length_function=len,
             separators=["\n\n", "\n", " ", ""]
         )
+        self.extractor = PDFExtractor(
+            backend=settings.PDF_PARSER_BACKEND,
+            quality_floor=settings.PDF_PARSER_QUALITY_FLOOR,
+            probe_pages=settings.PDF_PARSER_PROBE_PAGES,
+            min_text_chars=settings.PDF_MIN_TEXT_CHARS
+        )
+        self.analyzer = PDFAnalyzer(self.extractor, cache_size=settings.PDF_ANALYSIS_CACHE_SIZE)
+        self.ocr = OCRPool(
+            max_workers=settings.OCR_MAX_WORKERS,
+            max_pending=settings.OCR_MAX_PENDING_PAGES,
+            language=settings.OCR_LANGUAGE,
+            dpi=settings.OCR_DPI,
+            page_timeout=settings.OCR_PAGE_TIMEOUT_SECONDS
+        ) if settings.OCR_ENABLED else None
     
     async def process_pdf(self, file_path: str, doc_id: str) -> List[DocumentChunk]:
         """
@@ -41,33 +53,119 @@ class PDFProcessor:
         Args:
             file_path: Path to the PDF file
             doc_id: Document ID for tracking
-            
+        
         Returns:
             List of DocumentChunk objects
         """
         try:
             logger.info(f"Processing PDF: {file_path}")
+            pages_text = await self.extract_pages(file_path)
             
-            # Verify file exists
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"PDF file not found: {file_path}")
-            
-            # Extract text from PDF
-            pages_text = await self._extract_text_from_pdf(file_path)
-            
-            if not pages_text:
-                raise ValueError("No text could be extracted from the PDF")
-            
-            # Create chunks with metadata
-            chunks = await self._create_chunks_with_metadata(pages_text, doc_id)
+            # Callers wanting text pages before OCR finishes use extract_pages and ocr_pages directly
+            scanned = await self.scanned_pages(file_path)
+            if scanned:
+                pages_text += [page async for page in self.ocr_pages(file_path, scanned)]
+                pages_text.sort(key=lambda page: page['page'])
             
+            chunks = await self.chunk_pages(pages_text, doc_id)
             logger.info(f"Successfully processed PDF: {len(chunks)} chunks created")
             return chunks
-            
+        
         except Exception as e:
             logger.error(f"Error processing PDF {file_path}: {str(e)}")
             raise
     
+    async def extract_pages(self, file_path: str) -> List[Dict[str, Any]]:
+        """
+        Extract the cleaned text of every page that has any.
+        
+        When OCR is available, image-only pages are left out; list them with
+        scanned_pages and feed them through ocr_pages.
+        
+        Args:
+            file_path: Path to the PDF file
+        
+        Returns:
+            List of dictionaries with page number and text; empty for a fully
+            scanned document that OCR can handle
+        """
+        # Verify file exists
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"PDF file not found: {file_path}")
+        
+        # Extract text from PDF
+        with tracer.span("pdf.extract", file_size=os.path.getsize(file_path)) as span:
+            pages_text = await self._extract_text_from_pdf(file_path)
+            span.set_attribute("pages_with_text", len(pages_text))
+        
+        if not pages_text and not await self.scanned_pages(file_path):
+            raise ValueError("No text could be extracted from the PDF")
+        
+        return pages_text
+    
+    def ocr_available(self) -> bool:
+        return self.ocr is not None and self.ocr.is_available()
+    
+    async def scanned_pages(self, file_path: str) -> List[int]:
+        """Numbers of the image-only pages that should be OCRed; empty when OCR is unavailable."""
+        if not self.ocr_available():
+            return []
+        analysis = await self.analyze_pdf(file_path)
+        return analysis.page_numbers("image")
+    
+    async def ocr_pages(self, file_path: str, page_numbers: List[int]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        OCR scanned pages, yielding each as soon as it is recognized.
+        
+        Args:
+            file_path: Path to the PDF file
+            page_numbers: Pages from scanned_pages
+        
+        Yields:
+            Page dictionaries shaped like those from extract_pages, in
+            completion order; pages where OCR failed or found nothing are skipped
+        """
+        async for page_num, text in self.ocr.recognize(file_path, page_numbers):
+            text = self._clean_text(text or "")
+            if text:
+                yield {'page': page_num, 'text': text, 'char_count': len(text), 'backend': "ocr"}
+    
+    def shutdown(self):
+        if self.ocr is not None:
+            self.ocr.shutdown()
+    
+    async def chunk_pages(
+        self,
+        pages_text: List[Dict[str, Any]],
+        doc_id: str,
+        id_prefix: Optional[str] = None
+    ) -> List[DocumentChunk]:
+        """
+        Split extracted pages into chunks with metadata.
+        
+        Args:
+            pages_text: Pages as returned by extract_pages
+            doc_id: Document ID for tracking
+            id_prefix: Chunk ID prefix, defaults to doc_id; versions use their own
+                so new chunk IDs never collide with chunks kept from earlier versions
+        
+        Returns:
+            List of DocumentChunk objects
+        """
+        with tracer.span("pdf.chunk") as span, CHUNKING_SECONDS.time():
+            chunks = await self._create_chunks_with_metadata(pages_text, doc_id, id_prefix or doc_id)
+            span.set_attribute("chunks", len(chunks))
+        return chunks
+    
+    async def analyze_pdf(self, file_path: str) -> PDFAnalysis:
+        """
+        Parse a PDF once for validation, metadata and page text.
+        
+        Parsing runs in a worker thread, and results are cached by file
+        content so repeated calls for the same bytes are free.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.analyzer.analyze, file_path)
+    
     async def _extract_text_from_pdf(self, file_path: str) -> List[Dict[str, Any]]:
         """
         Extract text from PDF pages.
@@ -78,31 +176,39 @@ class PDFProcessor:
         pages_text = []
         
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
+            analysis = await self.analyze_pdf(file_path)
+            if analysis.error:
+                raise ValueError(analysis.error)
+            
+            # Without OCR, keep whatever stray text scanned pages have, as before
+            skip_scanned = self.ocr_available()
+            
+            for page_num, text, used, kind in analysis.pages:
+                if text is None:
+                    PDF_PAGES_TOTAL.inc(result="error")
+                    continue
                 
-                for page_num, page in enumerate(pdf_reader.pages, 1):
-                    try:
-                        # Extract text from page
-                        text = page.extract_text()
-                        
-                        # Clean up text
-                        text = self._clean_text(text)
-                        
-                        if text.strip():  # Only add pages with text
-                            pages_text.append({
-                                'page': page_num,
-                                'text': text,
-                                'char_count': len(text)
-                            })
-                        
-                    except Exception as e:
-                        logger.warning(f"Error extracting text from page {page_num}: {e}")
-                        continue
+                if kind == "image" and skip_scanned:
+                    PDF_PAGES_TOTAL.inc(result="scanned")
+                    continue
                 
-                logger.info(f"Extracted text from {len(pages_text)} pages")
-                return pages_text
+                # Clean up text
+                text = self._clean_text(text)
                 
+                if text.strip():  # Only add pages with text
+                    pages_text.append({
+                        'page': page_num,
+                        'text': text,
+                        'char_count': len(text),
+                        'backend': used
+                    })
+                    PDF_PAGES_TOTAL.inc(result="text")
+                else:
+                    PDF_PAGES_TOTAL.inc(result="empty")
+            
+            logger.info(f"Extracted text from {len(pages_text)} pages with {analysis.backend}")
+            return pages_text
+        
         except Exception as e:
             logger.error(f"Error reading PDF file {file_path}: {e}")
             raise
@@ -130,7 +236,8 @@ class PDFProcessor:
     async def _create_chunks_with_metadata(
         self, 
         pages_text: List[Dict[str, Any]], 
-        doc_id: str
+        doc_id: str,
+        id_prefix: str
     ) -> List[DocumentChunk]:
         """
         Create text chunks with metadata.
@@ -138,7 +245,8 @@ class PDFProcessor:
         Args:
             pages_text: List of page text dictionaries
             doc_id: Document ID
-            
+            id_prefix: Prefix for chunk IDs
+        
         Returns:
             List of DocumentChunk objects with metadata
         """
@@ -154,13 +262,20 @@ class PDFProcessor:
             
             # Split page text into chunks
             page_chunks = self.text_splitter.split_text(page_text)
+            # Chunks come back in page order and may overlap, so each one is
+            # searched for after the previous chunk's start
+            cursor = 0
             
             for chunk_text in page_chunks:
                 if not chunk_text.strip():
                     continue
                 
-                # Find character positions (approximate)
-                char_start = page_text.find(chunk_text[:50]) if len(chunk_text) >= 50 else 0
+                # Exact character positions in the page text
+                char_start = page_text.find(chunk_text, cursor)
+                if char_start == -1:
+                    char_start = max(page_text.find(chunk_text), 0)
+                else:
+                    cursor = char_start + 1
                 char_end = char_start + len(chunk_text)
                 
                 # Create chunk metadata
@@ -175,7 +290,7 @@ class PDFProcessor:
                 
                 # Create document chunk
                 chunk = DocumentChunk(
-                    id=f"{doc_id}_chunk_{chunk_id_counter}",
+                    id=f"{id_prefix}_chunk_{chunk_id_counter}",
                     doc_id=doc_id,
                     page=page_num,
                     text=chunk_text,
@@ -209,27 +324,14 @@ class PDFProcessor:
         
         Args:
             file_path: Path to the PDF file
-            
+        
         Returns:
             True if valid PDF, False otherwise
         """
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                
-                # Check if we can read at least one page
-                if len(pdf_reader.pages) == 0:
-                    return False
-                
-                # Try to extract text from first page
-                first_page = pdf_reader.pages[0]
-                text = first_page.extract_text()
-                
-                return True
-                
-        except Exception as e:
-            logger.warning(f"PDF validation failed for {file_path}: {e}")
-            return False
+        analysis = await self.analyze_pdf(file_path)
+        if not analysis.valid:
+            logger.warning(f"PDF validation failed for {file_path}: {analysis.error}")
+        return analysis.valid
     
     async def get_pdf_info(self, file_path: str) -> Dict[str, Any]:
         """
@@ -237,38 +339,14 @@ class PDFProcessor:
         
         Args:
             file_path: Path to the PDF file
-            
+        
         Returns:
             Dictionary with PDF information
         """
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                
-                info = {
-                    "pages": len(pdf_reader.pages),
-                    "encrypted": pdf_reader.is_encrypted,
-                    "metadata": {}
-                }
-                
-                # Try to get metadata
-                if hasattr(pdf_reader, 'metadata') and pdf_reader.metadata:
-                    metadata = pdf_reader.metadata
-                    info["metadata"] = {
-                        "title": metadata.get("/Title", ""),
-                        "author": metadata.get("/Author", ""),
-                        "subject": metadata.get("/Subject", ""),
-                        "creator": metadata.get("/Creator", ""),
-                        "producer": metadata.get("/Producer", ""),
-                        "creation_date": str(metadata.get("/CreationDate", "")),
-                        "modification_date": str(metadata.get("/ModDate", ""))
-                    }
-                
-                return info
-                
-        except Exception as e:
-            logger.error(f"Error getting PDF info for {file_path}: {e}")
-            return {"pages": 0, "encrypted": False, "metadata": {}}
+        analysis = await self.analyze_pdf(file_path)
+        if analysis.error:
+            logger.error(f"Error getting PDF info for {file_path}: {analysis.error}")
+        return analysis.info()
     
     def estimate_processing_time(self, file_size_mb: float) -> int:
         """
@@ -276,7 +354,7 @@ class PDFProcessor:
         
         Args:
             file_size_mb: File size in megabytes
-            
+        
         Returns:
             Estimated processing time in seconds
         """
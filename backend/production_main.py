@@ -4,18 +4,26 @@ Production FastAPI main application for PDF-QA with Gemini AI on Render.
 
 from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
 import google.generativeai as genai
 import uvicorn
 import os
-import json
 import asyncio
+import time
 from datetime import datetime
 from typing import List, Optional
 import PyPDF2
 import io
 
 from render_config import RenderConfig
+from metrics import REGISTRY, GenerationMeter, ASK_LATENCY_SECONDS, PROMPT_BUILD_SECONDS, SEARCH_SECONDS
+from document_summaries import DocumentSummarizer, split_page_markers, join_page_markers
+from document_jobs import DocumentJobs
+from pdf_backends import classify_page, pypdf_page_images
+from ocr import OCRPool
+from sse import sse_response
+from gemini_streaming import stream_text
+from passage_search import search_pages, paginate
 
 # Initialize configuration
 config = RenderConfig()
@@ -48,6 +56,65 @@ os.makedirs(config.UPLOAD_DIR, exist_ok=True)
 documents_store = {}
 document_texts = {}
 
+async def generate_text(prompt: str) -> str:
+    """Run a single non-streamed Gemini completion."""
+    response = await model.generate_content_async(prompt)
+    return response.text
+
+# Summaries are generated once per document in the background after upload
+summarizer = DocumentSummarizer(
+    generate_text,
+    group_max_tokens=config.SUMMARY_GROUP_MAX_TOKENS,
+    max_concurrency=config.SUMMARY_MAX_CONCURRENCY
+)
+summary_jobs = DocumentJobs()
+
+async def summarize_document_background(doc_id: str, pdf_text: str):
+    """Generate a document's summary and store it with the document record."""
+    try:
+        result = await summarizer.summarize(split_page_markers(pdf_text))
+        if doc_id in documents_store:
+            documents_store[doc_id]["summary"] = result["summary"]
+            documents_store[doc_id]["summary_status"] = "ready"
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Error summarizing document {doc_id}: {e}")
+        if doc_id in documents_store:
+            documents_store[doc_id]["summary_status"] = "failed"
+
+# Scanned pages are OCRed from the saved upload in a separate process pool
+ocr_pool = OCRPool(
+    max_workers=config.OCR_MAX_WORKERS,
+    max_pending=config.OCR_MAX_PENDING_PAGES,
+    language=config.OCR_LANGUAGE,
+    dpi=config.OCR_DPI,
+    page_timeout=config.OCR_PAGE_TIMEOUT_SECONDS
+) if config.OCR_ENABLED else None
+ocr_jobs = DocumentJobs()
+
+async def ocr_document_background(doc_id: str, file_path: str, page_numbers: List[int]):
+    """OCR scanned pages, merging each into the document's text as soon as it is recognized."""
+    pages = dict(split_page_markers(document_texts.get(doc_id, "")))
+    try:
+        async for page_num, text in ocr_pool.recognize(file_path, page_numbers):
+            if text and text.strip() and doc_id in documents_store:
+                pages[page_num] = text.strip()
+                document_texts[doc_id] = join_page_markers(pages)
+                documents_store[doc_id]["status"] = "ready"
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Error running OCR for document {doc_id}: {e}")
+    
+    if doc_id not in documents_store:
+        return
+    if not pages:
+        documents_store[doc_id]["status"] = "failed"
+        return
+    if documents_store[doc_id].get("summary_status") == "pending":
+        summary_jobs.schedule(doc_id, summarize_document_background(doc_id, document_texts[doc_id]))
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -69,6 +136,11 @@ async def health_check():
         "environment": "production"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return Response(content=REGISTRY.render(), media_type=REGISTRY.CONTENT_TYPE)
+
 # Authentication endpoints
 @app.post("/auth/login")
 async def login(user_data: dict):
@@ -126,20 +198,27 @@ async def list_documents():
         })
     return {"documents": docs}
 
-def extract_text_from_pdf(file_content: bytes) -> tuple[str, int]:
-    """Extract text from PDF bytes."""
+def extract_text_from_pdf(file_content: bytes) -> tuple[str, int, List[int]]:
+    """Extract text from PDF bytes, plus the numbers of scanned (image-only) pages."""
     try:
         pdf_file = io.BytesIO(file_content)
         pdf_reader = PyPDF2.PdfReader(pdf_file)
         
         text = ""
+        scanned_pages = []
         for page_num, page in enumerate(pdf_reader.pages):
             page_text = page.extract_text()
+            try:
+                images = pypdf_page_images(page)
+            except Exception:
+                images = None
+            if classify_page(page_text or "", images, config.PDF_MIN_TEXT_CHARS) == "image":
+                scanned_pages.append(page_num + 1)
             if page_text:
                 text += f"\n--- Page {page_num + 1} ---\n"
                 text += page_text
         
-        return text, len(pdf_reader.pages)
+        return text, len(pdf_reader.pages), scanned_pages
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
 
@@ -160,13 +239,17 @@ async def upload_document(file: UploadFile = File(...)):
     
     # Extract text from PDF
     try:
-        pdf_text, page_count = extract_text_from_pdf(file_content)
+        pdf_text, page_count, scanned_pages = extract_text_from_pdf(file_content)
+        
+        # Scanned pages are OCRed from the saved file when a local OCR engine is installed
+        if ocr_pool is None or not ocr_pool.is_available():
+            scanned_pages = []
         
         # Store document info
         documents_store[doc_id] = {
             "name": file.filename,
             "size": file.size,
-            "status": "ready",
+            "status": "ready" if pdf_text.strip() else "processing",
             "page_count": page_count,
             "chunk_count": len(pdf_text.split('\n')) // 20,
             "created_at": datetime.utcnow().isoformat(),
@@ -176,6 +259,15 @@ async def upload_document(file: UploadFile = File(...)):
         # Store extracted text
         document_texts[doc_id] = pdf_text
         
+        # Summarize in the background; a re-upload under the same ID replaces the old job
+        if config.SUMMARY_ENABLED:
+            documents_store[doc_id]["summary_status"] = "pending"
+            # With scanned pages, the summary waits for their OCR text
+            if not scanned_pages:
+                summary_jobs.schedule(doc_id, summarize_document_background(doc_id, pdf_text))
+        else:
+            documents_store[doc_id]["summary_status"] = "disabled"
+        
         # Save file to disk (if needed)
         try:
             file_path = os.path.join(config.UPLOAD_DIR, f"{doc_id}_{file.filename}")
@@ -184,12 +276,19 @@ async def upload_document(file: UploadFile = File(...)):
         except Exception as e:
             print(f"Warning: Could not save file to disk: {e}")
         
+        if scanned_pages:
+            ocr_jobs.schedule(doc_id, ocr_document_background(doc_id, file_path, scanned_pages))
+        
+        message = f"Document processed successfully! Extracted text from {page_count} pages."
+        if scanned_pages:
+            message += f" {len(scanned_pages)} scanned pages are being OCRed and will be added as they finish."
+        
         return {
             "doc_id": doc_id,
-            "status": "ready",
-            "message": f"Document processed successfully! Extracted text from {page_count} pages."
+            "status": documents_store[doc_id]["status"],
+            "message": message
         }
-        
+    
     except Exception as e:
         return {
             "doc_id": doc_id,
@@ -197,6 +296,19 @@ async def upload_document(file: UploadFile = File(...)):
             "message": f"Error processing PDF: {str(e)}"
         }
 
+@app.get("/documents/{doc_id}/summary")
+async def get_document_summary(doc_id: str):
+    """Get the summary generated for a document after upload."""
+    if doc_id not in documents_store:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    doc_info = documents_store[doc_id]
+    return {
+        "doc_id": doc_id,
+        "status": doc_info.get("summary_status", "unavailable"),
+        "summary": doc_info.get("summary")
+    }
+
 @app.delete("/documents/{doc_id}")
 async def delete_document(doc_id: str):
     """Delete a document."""
@@ -204,19 +316,34 @@ async def delete_document(doc_id: str):
         del documents_store[doc_id]
     if doc_id in document_texts:
         del document_texts[doc_id]
+    summary_jobs.cancel(doc_id)
+    ocr_jobs.cancel(doc_id)
     
     return {"message": "Document deleted successfully"}
 
-async def generate_streaming_response(prompt: str):
+async def generate_streaming_response(prompt: str, start_time: Optional[float] = None):
     """Generate streaming response from Gemini."""
+    start_time = start_time or time.perf_counter()
     try:
-        response = model.generate_content(prompt, stream=True)
+        meter = GenerationMeter(provider="gemini")
+        tokens = stream_text(model, prompt)
         
         full_text = ""
-        for chunk in response:
-            if chunk.text:
-                full_text += chunk.text
-                yield f"data: {json.dumps({'type': 'token', 'content': chunk.text})}\n\n"
+        try:
+            async for text in tokens:
+                meter.token()
+                full_text += text
+                yield {"type": "token", "content": text}
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away; closing the token stream cancels the gRPC call to Gemini
+            meter.cancel()
+            raise
+        finally:
+            await tokens.aclose()
+        
+        timings = meter.finish()
+        latency_ms = int((time.perf_counter() - start_time) * 1000)
+        ASK_LATENCY_SECONDS.observe(latency_ms / 1000, status="ok")
         
         # Send final response with citations
         final_response = {
@@ -232,20 +359,57 @@ async def generate_streaming_response(prompt: str):
                         "excerpt": full_text[:200] + "..." if len(full_text) > 200 else full_text
                     }
                 ],
-                "latency_ms": 1500,
+                "latency_ms": latency_ms,
+                "timings": timings,
                 "usage": {"retrieved_docs": 1, "total_tokens": len(full_text.split())}
             }
         }
         
-        yield f"data: {json.dumps(final_response)}\n\n"
-        
+        yield final_response
+    
     except Exception as e:
+        ASK_LATENCY_SECONDS.observe(time.perf_counter() - start_time, status="error")
         error_response = {"type": "error", "error": str(e)}
-        yield f"data: {json.dumps(error_response)}\n\n"
+        yield error_response
+
+@app.get("/search")
+async def search_passages(q: str, doc_ids: Optional[str] = None, offset: int = 0, limit: int = 10):
+    """
+    Ranked passages for a query, without generating an answer.
+    
+    `doc_ids` is a comma-separated list. Passages are found by matching the
+    query terms in the stored page text; offsets are character positions
+    within the page and highlights are relative to the passage text.
+    """
+    start_time = time.perf_counter()
+    query = q.strip()
+    if not query or len(query) > 1000:
+        raise HTTPException(status_code=400, detail="Query must be 1 to 1000 characters")
+    if offset < 0 or not 1 <= limit <= 50:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 50")
+    if offset + limit > config.SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"Results are available up to position {config.SEARCH_MAX_RESULTS}")
+    
+    scope = [doc_id.strip() for doc_id in (doc_ids or "").split(",") if doc_id.strip()] or list(document_texts)
+    pages = [
+        (doc_id, documents_store[doc_id]["name"], page, text)
+        for doc_id in scope
+        if doc_id in document_texts and doc_id in documents_store
+        for page, text in split_page_markers(document_texts[doc_id])
+    ]
+    with SEARCH_SECONDS.time(backend="lexical"):
+        passages = search_pages(pages, query, config.SEARCH_CONTEXT_CHARS, offset + limit + 1)
+    
+    return {
+        "query": query,
+        **paginate(passages, offset, limit),
+        "took_ms": round((time.perf_counter() - start_time) * 1000, 2)
+    }
 
 @app.post("/ask")
 async def ask_question(question_data: dict):
     """Ask a question about uploaded documents using Gemini AI."""
+    start_time = time.perf_counter()
     question = question_data.get("question", "")
     doc_ids = question_data.get("doc_ids", [])
     
@@ -268,13 +432,13 @@ async def ask_question(question_data: dict):
         return {
             "answer": "I don't have any documents to search through. Please upload some PDF documents first.",
             "citations": [],
-            "latency_ms": 50,
+            "latency_ms": int((time.perf_counter() - start_time) * 1000),
             "usage": {"retrieved_docs": 0, "total_tokens": 0}
         }
     
     # Create prompt for Gemini
     prompt = f"""Based on the following document content, please answer the user's question. 
-    
+
 If the answer is not found in the provided documents, say "I don't have enough information to answer that question based on the uploaded documents."
 
 Always provide specific references to the document content when possible.
@@ -285,20 +449,14 @@ DOCUMENT CONTENT:
 USER QUESTION: {question}
 
 Please provide a helpful and accurate answer based only on the information in the documents above."""
+    PROMPT_BUILD_SECONDS.observe(time.perf_counter() - start_time)
     
     # Return streaming response
-    async def generate():
-        async for chunk in generate_streaming_response(prompt):
-            yield chunk
-    
-    return StreamingResponse(
-        generate(),
-        media_type="text/stream-server-sent-events",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "*",
-        }
+    return sse_response(
+        generate_streaming_response(prompt, start_time),
+        coalesce_ms=config.SSE_COALESCE_MS,
+        coalesce_bytes=config.SSE_COALESCE_BYTES,
+        heartbeat_seconds=config.SSE_HEARTBEAT_SECONDS
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,252 @@
+"""
+On-demand profiling and event-loop lag monitoring.
+
+- LoopLagMonitor measures how late the event loop wakes up and, from a
+  watchdog thread, captures the loop thread's stack whenever a single
+  callback blocks for longer than the stall threshold.
+- SamplingProfiler samples thread stacks for a fixed duration and returns
+  them as collapsed stacks (flamegraph.pl / speedscope input).
+- MemoryProfiler wraps tracemalloc snapshots and diffs between them.
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+import tracemalloc
+from collections import deque, Counter as CollectionsCounter
+from typing import Optional, Dict, Any, List
+
+from metrics import EVENT_LOOP_LAG_SECONDS, EVENT_LOOP_STALLS_TOTAL
+
+
+logger = logging.getLogger(__name__)
+
+
+def _format_stack(frame, limit: int = 40) -> List[str]:
+    return [line.rstrip() for line in traceback.format_stack(frame, limit=limit)]
+
+
+class LoopLagMonitor:
+    """Tracks event-loop scheduling lag and captures stacks of blocking callbacks."""
+    
+    def __init__(self, interval_ms: float = 100, stall_threshold_ms: float = 250, history: int = 50):
+        self.interval = interval_ms / 1000
+        self.stall_threshold = stall_threshold_ms / 1000
+        self.stalls = deque(maxlen=history)
+        self.lag_samples = deque(maxlen=600)
+        self.max_lag_ms = 0.0
+        self._heartbeat = time.perf_counter()
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        # Each watchdog gets its own stop event, so one that outlives stop()
+        # cannot be revived by a restart and run alongside the new one
+        self._stopped = threading.Event()
+        self._heartbeat = time.perf_counter()
+        self._task = loop.create_task(self._measure())
+        self._watchdog = threading.Thread(
+            target=self._watch,
+            args=(self._stopped,),
+            name="loop-watchdog",
+            daemon=True
+        )
+        self._watchdog.start()
+        logger.info("Event loop lag monitor started")
+    
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog:
+            # Returns as soon as the watchdog sees the event
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+    
+    async def _measure(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._heartbeat = now
+            
+            lag = max(0.0, now - expected)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            self.lag_samples.append(lag * 1000)
+            self.max_lag_ms = max(self.max_lag_ms, lag * 1000)
+    
+    def _watch(self, stopped: threading.Event):
+        check_every = max(self.stall_threshold / 4, 0.01)
+        reported_heartbeat = None
+        
+        while not stopped.wait(check_every):
+            heartbeat = self._heartbeat
+            
+            # The loop recovered from the last reported stall; record its full length
+            if reported_heartbeat is not None and heartbeat != reported_heartbeat and self.stalls:
+                if "blocked_ms" not in self.stalls[-1]:
+                    self.stalls[-1]["blocked_ms"] = round((heartbeat - reported_heartbeat - self.interval) * 1000, 1)
+            
+            blocked_for = time.perf_counter() - heartbeat - self.interval
+            if blocked_for < self.stall_threshold or heartbeat == reported_heartbeat:
+                continue
+            
+            # Capture once per stall; the heartbeat moves on when the loop recovers
+            reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = _format_stack(frame) if frame is not None else []
+            
+            EVENT_LOOP_STALLS_TOTAL.inc()
+            self.stalls.append({
+                "detected_at": time.time(),
+                "blocked_ms_at_capture": round(blocked_for * 1000, 1),
+                "stack": stack
+            })
+            logger.warning(f"Event loop blocked for {blocked_for * 1000:.0f}ms: {stack[-1].strip() if stack else 'unknown'}")
+    
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self.lag_samples)
+        
+        def pick(fraction: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(fraction * (len(samples) - 1)))], 2)
+        
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "stall_threshold_ms": self.stall_threshold * 1000,
+            "lag_ms": {"p50": pick(0.5), "p99": pick(0.99), "max": round(self.max_lag_ms, 2)},
+            "stalls": list(self.stalls)
+        }
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling thread stacks from a background thread."""
+    
+    def __init__(self, max_seconds: float = 60):
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+    
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+    
+    def capture(self, seconds: float, interval_ms: float = 5, thread_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Sample stacks for a fixed duration. Blocking; run it in an executor.
+        
+        Args:
+            seconds: Capture duration (capped at max_seconds)
+            interval_ms: Time between samples
+            thread_id: Only sample this thread (default: all threads except the profiler)
+        
+        Returns:
+            Dictionary with sample count and collapsed stacks ("a;b;c count" lines)
+        """
+        if seconds <= 0 or interval_ms <= 0:
+            raise ValueError("seconds and interval_ms must be positive")
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A CPU profile is already being captured")
+        
+        try:
+            seconds = min(seconds, self.max_seconds)
+            interval = interval_ms / 1000
+            own_id = threading.get_ident()
+            stacks = CollectionsCounter()
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            
+            while time.perf_counter() < deadline:
+                for tid, frame in sys._current_frames().items():
+                    if tid == own_id or (thread_id is not None and tid != thread_id):
+                        continue
+                    stacks[self._collapse(frame)] += 1
+                samples += 1
+                time.sleep(interval)
+            
+            collapsed = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+            return {"seconds": seconds, "samples": samples, "collapsed": collapsed}
+        finally:
+            self._lock.release()
+    
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+
+class MemoryProfiler:
+    """tracemalloc snapshots with diffs between two points in time."""
+    
+    def __init__(self, max_snapshots: int = 10):
+        self.max_snapshots = max_snapshots
+        self.snapshots: Dict[str, Any] = {}
+        self._order = deque()
+    
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+    
+    @property
+    def latest_label(self) -> Optional[str]:
+        return self._order[-1] if self._order else None
+    
+    def start(self, frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+    
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.snapshots.clear()
+        self._order.clear()
+    
+    def take_snapshot(self, label: Optional[str] = None) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running; start it first")
+        
+        label = label or f"snap_{int(time.time() * 1000)}"
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        
+        if label not in self.snapshots:
+            self._order.append(label)
+        self.snapshots[label] = snapshot
+        while len(self._order) > self.max_snapshots:
+            self.snapshots.pop(self._order.popleft(), None)
+        
+        current, peak = tracemalloc.get_traced_memory()
+        return {"label": label, "traced_bytes": current, "peak_bytes": peak}
+    
+    def diff(self, older: str, newer: str, limit: int = 25, key_type: str = "lineno") -> List[Dict[str, Any]]:
+        if older not in self.snapshots or newer not in self.snapshots:
+            raise KeyError("Unknown snapshot label")
+        
+        stats = self.snapshots[newer].compare_to(self.snapshots[older], key_type)
+        return [{
+            "location": str(stat.traceback[0]) if stat.traceback else "unknown",
+            "size_diff_bytes": stat.size_diff,
+            "size_bytes": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count
+        } for stat in stats[:limit]]
@@ -6,35 +6,36 @@ import os
 import json
 import logging
 import time
-from typing import List, Dict, Any, Optional, AsyncGenerator
+from typing import List, Dict, Any, Optional, AsyncGenerator, Awaitable, Callable
 import asyncio
+import functools
+import numpy as np
+from collections import OrderedDict
 
 # LangChain imports
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 from langchain.schema import Document
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnablePassthrough, RunnableParallel
 from langchain.schema.output_parser import StrOutputParser
-from langchain.callbacks.base import AsyncCallbackHandler
 
 from models import DocumentChunk, Citation, StreamChunk, ChatResponse
+from routing_index import DocumentRoutingIndex
+from chroma_client import create_chroma_client, upsert_batched
+from context_builder import ContextBuilder, ContextPassage
+from document_summaries import DocumentSummarizer
+from passage_search import make_passage, query_terms, term_pattern
+from metrics import (
+    EMBEDDING_BATCH_SECONDS, EMBEDDING_INPUTS_TOTAL, VECTOR_UPSERT_SECONDS,
+    RETRIEVAL_SECONDS, PROMPT_BUILD_SECONDS, ASK_LATENCY_SECONDS, CONVERSATION_SUMMARY_SECONDS,
+    ASK_BATCH_QUESTIONS_TOTAL, QUERY_EMBEDDING_CACHE_TOTAL, StageTimings, GenerationMeter
+)
+from tracing import tracer
 
 
 logger = logging.getLogger(__name__)
 
-
-class StreamingCallbackHandler(AsyncCallbackHandler):
-    """Callback handler for streaming LLM responses."""
-    
-    def __init__(self):
-        self.tokens = []
-        self.current_token = ""
-    
-    async def on_llm_new_token(self, token: str, **kwargs) -> None:
-        """Handle new token from LLM."""
-        self.current_token = token
-        self.tokens.append(token)
+NO_DOCUMENTS_ANSWER = "I don't have any relevant documents to answer your question. Please upload some PDF documents first."
 
 
 class RAGChain:
@@ -45,8 +46,12 @@ class RAGChain:
         self.embeddings = None
         self.vector_store = None
         self.llm = None
-        self.retriever = None
         self.chain = None
+        self.routing_index = None
+        self.context_builder = None
+        self.document_summarizer = None
+        # Recent query vectors, so repeated searches and questions skip the embedding call
+        self._query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
         
         # System prompt for the LLM
         self.system_prompt = """You are a helpful AI assistant that answers questions based solely on the provided context from PDF documents.
@@ -62,9 +67,22 @@ IMPORTANT RULES:
 Context:
 {context}
 
-Question: {question}
+{history}Question: {question}
 
 Answer:"""
+        
+        # Used off the request path to fold older conversation turns into a summary
+        self.summary_prompt = """Update the running summary of a conversation about PDF documents.
+
+Keep the facts, named entities, document references and open questions a follow-up question might depend on. Write at most {max_tokens} tokens of plain prose.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
     
     async def initialize(self):
         """Initialize the RAG chain components."""
@@ -78,66 +96,93 @@ Answer:"""
             # Initialize embeddings
             self.embeddings = OpenAIEmbeddings(
                 model=self.settings.EMBEDDING_MODEL,
-                openai_api_key=self.settings.OPENAI_API_KEY
+                openai_api_key=self.settings.OPENAI_API_KEY,
+                openai_api_base=self.settings.OPENAI_API_BASE or None
+            )
+            
+            # One client, and in http mode one connection pool, for the chunk
+            # and routing collections
+            self.chroma_client = create_chroma_client(
+                mode=self.settings.VECTOR_DB_MODE,
+                persist_directory=self.settings.VECTOR_DB_PERSIST_DIR,
+                host=self.settings.VECTOR_DB_HOST,
+                port=self.settings.VECTOR_DB_PORT,
+                ssl=self.settings.VECTOR_DB_SSL,
+                auth_token=self.settings.VECTOR_DB_AUTH_TOKEN,
+                pool_size=self.settings.VECTOR_DB_POOL_SIZE,
+                connect_timeout=self.settings.VECTOR_DB_CONNECT_TIMEOUT_SECONDS,
+                timeout=self.settings.VECTOR_DB_TIMEOUT_SECONDS,
+                retries=self.settings.VECTOR_DB_RETRIES
             )
             
             # Initialize vector store
             self.vector_store = Chroma(
-                persist_directory=self.settings.VECTOR_DB_PERSIST_DIR,
+                client=self.chroma_client,
                 embedding_function=self.embeddings
             )
             
+            # Initialize document routing index
+            if self.settings.ROUTING_ENABLED:
+                self.routing_index = DocumentRoutingIndex(self.settings, self.embeddings, self.chroma_client)
+            
             # Initialize LLM
             self.llm = ChatOpenAI(
                 model=self.settings.LLM_MODEL,
                 openai_api_key=self.settings.OPENAI_API_KEY,
+                openai_api_base=self.settings.OPENAI_API_BASE or None,
                 temperature=0.1,
                 streaming=True
             )
             
-            # Initialize retriever
-            self.retriever = self.vector_store.as_retriever(
-                search_type="mmr",
-                search_kwargs={
-                    "k": self.settings.RETRIEVAL_K,
-                    "fetch_k": 20
-                }
+            # Token-budgeted context packing
+            self.context_builder = ContextBuilder(
+                self.settings.LLM_MODEL,
+                max_tokens=self.settings.CONTEXT_MAX_TOKENS,
+                dedup_threshold=self.settings.CONTEXT_DEDUP_THRESHOLD
+            )
+            
+            # Map-reduce document summaries, shared across documents so the concurrency cap is global
+            self.document_summarizer = DocumentSummarizer(
+                self.generate_text,
+                count_tokens=self.count_tokens,
+                group_max_tokens=self.settings.SUMMARY_GROUP_MAX_TOKENS,
+                max_concurrency=self.settings.SUMMARY_MAX_CONCURRENCY
             )
             
-            # Create the RAG chain
+            # Create the generation chain shared by every request
             self._create_chain()
             
-            logger.info("RAG chain initialized successfully")
+            # Route documents that were ingested before the routing index existed
+            if self.routing_index and await self.routing_index.is_empty():
+                chunk_count = await asyncio.get_event_loop().run_in_executor(
+                    None, self.vector_store._collection.count
+                )
+                if chunk_count > 0:
+                    await self.routing_index.backfill_from_chunks(
+                        self.vector_store._collection,
+                        page_size=self.settings.VECTOR_DB_UPSERT_BATCH_SIZE
+                    )
             
+            logger.info("RAG chain initialized successfully")
+        
         except Exception as e:
             logger.error(f"Error initializing RAG chain: {e}")
             raise
     
     def _create_chain(self):
-        """Create the RAG chain using LangChain LCEL."""
-        prompt = ChatPromptTemplate.from_template(self.system_prompt)
-        
-        # Create the chain
-        self.chain = (
-            RunnableParallel({
-                "context": self.retriever | self._format_docs,
-                "question": RunnablePassthrough()
-            })
-            | prompt
-            | self.llm
-            | StrOutputParser()
-        )
-    
-    def _format_docs(self, docs: List[Document]) -> str:
-        """Format retrieved documents for the prompt."""
-        formatted_docs = []
-        for i, doc in enumerate(docs, 1):
-            metadata = doc.metadata
-            page = metadata.get('page', 'Unknown')
-            source = f"[S{i}] (Page {page})"
-            formatted_docs.append(f"{source}: {doc.page_content}")
-        
-        return "\n\n".join(formatted_docs)
+        """
+        Create the generation chain once, at startup.
+        
+        Retrieval takes its filter and k per call (see _retrieve), and each
+        request formats system_prompt itself because the formatted prompt is
+        also what gets token-counted. The chain therefore takes that prompt
+        string as input: the chat model wraps it in a single human message,
+        as ChatPromptTemplate.from_template(system_prompt) would.
+        
+        Streaming answers skip the output parser and read chunks from the
+        LLM directly, which avoids a second runnable run per token.
+        """
+        self.chain = self.llm | StrOutputParser()
     
     async def add_document_chunks(
         self, 
@@ -149,68 +194,167 @@ Answer:"""
         try:
             logger.info(f"Adding {len(chunks)} chunks to vector store for doc {doc_id}")
             
-            documents = []
-            metadatas = []
-            ids = []
-            
-            for chunk in chunks:
-                # Create LangChain Document
-                doc = Document(
-                    page_content=chunk.text,
-                    metadata={
-                        "doc_id": doc_id,
-                        "user_id": user_id,
-                        "page": chunk.page,
-                        "char_start": chunk.metadata.char_start,
-                        "char_end": chunk.metadata.char_end,
-                        "source": chunk.metadata.source,
-                        "chunk_id": chunk.id
-                    }
-                )
-                
-                documents.append(doc)
-                metadatas.append(doc.metadata)
-                ids.append(chunk.id)
+            texts, chunk_embeddings = await self._upsert_chunks(chunks, doc_id, user_id)
             
-            # Add to vector store
-            await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.vector_store.add_documents(
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-            )
+            # Update document-level routing entry
+            if self.routing_index:
+                with tracer.span("routing.update"):
+                    await self.routing_index.add_document(
+                        doc_id,
+                        user_id,
+                        chunk_embeddings,
+                        summary_text=texts[0] if texts else ""
+                    )
             
             logger.info(f"Successfully added {len(chunks)} chunks to vector store")
-            
+        
         except Exception as e:
             logger.error(f"Error adding chunks to vector store: {e}")
             raise
     
-    async def delete_document(self, doc_id: str, user_id: str):
-        """Delete all chunks for a document from vector store."""
+    async def apply_document_revision(
+        self,
+        doc_id: str,
+        user_id: str,
+        chunks: List[DocumentChunk],
+        moved: Dict[str, int],
+        stale_chunk_ids: List[str]
+    ):
+        """
+        Bring a document's vectors in line with a new version.
+        
+        New chunks are written first and stale ones removed last, in a single
+        delete, so a query never sees the document with pages missing.
+        
+        Args:
+            doc_id: Document ID
+            user_id: Owner of the document
+            chunks: Chunks of new or changed pages
+            moved: Kept chunk IDs whose page number changed, mapped to the new page
+            stale_chunk_ids: Chunks of pages that no longer exist in the new version
+        """
         try:
-            logger.info(f"Deleting document {doc_id} from vector store")
-            
-            # Get all chunk IDs for this document
-            # Note: Chroma doesn't have a direct way to delete by metadata filter
-            # So we need to query first, then delete by IDs
-            results = self.vector_store.similarity_search(
-                query="",  # Empty query to get all
-                k=10000,  # Large number to get all chunks
-                filter={"doc_id": doc_id, "user_id": user_id}
+            logger.info(
+                f"Revising doc {doc_id}: {len(chunks)} new chunks, "
+                f"{len(moved)} moved, {len(stale_chunk_ids)} removed"
             )
+            collection = self.vector_store._collection
+            loop = asyncio.get_event_loop()
+            
+            if chunks:
+                await self._upsert_chunks(chunks, doc_id, user_id)
             
-            if results:
-                chunk_ids = [doc.metadata["chunk_id"] for doc in results]
-                await asyncio.get_event_loop().run_in_executor(
+            if moved:
+                ids = list(moved)
+                stored = await loop.run_in_executor(
                     None,
-                    lambda: self.vector_store.delete(ids=chunk_ids)
+                    lambda: collection.get(ids=ids, include=["metadatas"])
                 )
-                
-                logger.info(f"Deleted {len(chunk_ids)} chunks for document {doc_id}")
+                metadatas = []
+                for metadata in stored["metadatas"]:
+                    page = moved[metadata["chunk_id"]]
+                    metadatas.append({**metadata, "page": page, "source": f"page_{page}"})
+                await loop.run_in_executor(
+                    None,
+                    lambda: collection.update(ids=stored["ids"], metadatas=metadatas)
+                )
+            
+            if stale_chunk_ids:
+                with tracer.span("vector.delete", vectors=len(stale_chunk_ids)):
+                    await loop.run_in_executor(
+                        None,
+                        lambda: collection.delete(ids=stale_chunk_ids)
+                    )
+            
+            # The routing centroid covers every chunk, kept ones included
+            if self.routing_index and (chunks or stale_chunk_ids):
+                with tracer.span("routing.update"):
+                    stored = await loop.run_in_executor(
+                        None,
+                        lambda: collection.get(where={"doc_id": doc_id}, include=["embeddings", "documents"])
+                    )
+                    documents = stored.get("documents") or []
+                    await self.routing_index.add_document(
+                        doc_id,
+                        user_id,
+                        stored.get("embeddings") or [],
+                        summary_text=documents[0] if documents else ""
+                    )
+        
+        except Exception as e:
+            logger.error(f"Error revising document {doc_id} in vector store: {e}")
+            raise
+    
+    async def _upsert_chunks(self, chunks: List[DocumentChunk], doc_id: str, user_id: str):
+        """Embed chunks and write them to the vector store. Returns the texts and their embeddings."""
+        texts = []
+        metadatas = []
+        ids = []
+        
+        for chunk in chunks:
+            texts.append(chunk.text)
+            metadatas.append({
+                "doc_id": doc_id,
+                "user_id": user_id,
+                "page": chunk.page,
+                "char_start": chunk.metadata.char_start,
+                "char_end": chunk.metadata.char_end,
+                "source": chunk.metadata.source,
+                "chunk_id": chunk.id
+            })
+            ids.append(chunk.id)
+        
+        loop = asyncio.get_event_loop()
+        
+        # Embed once so the same vectors feed both the chunk and routing indexes
+        EMBEDDING_INPUTS_TOTAL.inc(len(texts), operation="documents")
+        with tracer.span("embed.documents", inputs=len(texts)), \
+                EMBEDDING_BATCH_SECONDS.time(operation="documents"):
+            chunk_embeddings = await loop.run_in_executor(
+                None,
+                lambda: self.embeddings.embed_documents(texts)
+            )
+        
+        # Add to vector store
+        with tracer.span("vector.upsert", vectors=len(ids)), VECTOR_UPSERT_SECONDS.time():
+            await loop.run_in_executor(
+                None,
+                lambda: upsert_batched(
+                    self.vector_store._collection,
+                    ids=ids,
+                    embeddings=chunk_embeddings,
+                    metadatas=metadatas,
+                    documents=texts,
+                    batch_size=self.settings.VECTOR_DB_UPSERT_BATCH_SIZE
+                )
+            )
+        
+        return texts, chunk_embeddings
+    
+    async def delete_document(self, doc_id: str, user_id: str):
+        """Delete all chunks for a document from vector store."""
+        try:
+            logger.info(f"Deleting document {doc_id} from vector store")
             
+            # Look the chunk IDs up by metadata (no query embedding, no k cap),
+            # then delete them, in one round trip each
+            def delete_chunks() -> int:
+                collection = self.vector_store._collection
+                chunk_ids = collection.get(
+                    where={"$and": [{"doc_id": doc_id}, {"user_id": user_id}]},
+                    include=[]
+                )["ids"]
+                if chunk_ids:
+                    collection.delete(ids=chunk_ids)
+                return len(chunk_ids)
+            
+            deleted = await asyncio.get_event_loop().run_in_executor(None, delete_chunks)
+            if deleted:
+                logger.info(f"Deleted {deleted} chunks for document {doc_id}")
+            
+            if self.routing_index:
+                await self.routing_index.delete_document(doc_id)
+        
         except Exception as e:
             logger.error(f"Error deleting document from vector store: {e}")
             raise
@@ -220,7 +364,8 @@ Answer:"""
         question: str,
         user_id: str,
         doc_ids: Optional[List[str]] = None,
-        k: int = None
+        k: int = None,
+        history: str = ""
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Ask a question and stream the response with citations.
@@ -230,59 +375,46 @@ Answer:"""
             user_id: User ID for access control
             doc_ids: Optional list of document IDs to restrict search
             k: Number of documents to retrieve (default from settings)
-            
+            history: Prior conversation turns (and summary) to include in the prompt
+        
         Yields:
             Stream chunks with tokens and final response with citations
         """
-        start_time = time.time()
+        timings = StageTimings()
         
         try:
             # Set up retrieval parameters
             if k is None:
                 k = self.settings.RETRIEVAL_K
             
-            # Create retriever with user-specific filter
-            retriever_kwargs = {
-                "k": k,
-                "fetch_k": k * 3
-            }
-            
-            # Add document filters if specified
-            if doc_ids:
-                retriever_kwargs["filter"] = {
-                    "user_id": user_id,
-                    "doc_id": {"$in": doc_ids}
-                }
-            else:
-                retriever_kwargs["filter"] = {"user_id": user_id}
-            
-            # Update retriever
-            retriever = self.vector_store.as_retriever(
-                search_type="mmr",
-                search_kwargs=retriever_kwargs
-            )
-            
             # Retrieve relevant documents
             logger.info(f"Retrieving documents for question: {question[:50]}...")
-            relevant_docs = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: retriever.get_relevant_documents(question)
-            )
+            relevant_docs = await self._retrieve(question, user_id, doc_ids, k, timings)
             
             if not relevant_docs:
+                latency_ms = timings.elapsed_ms()
+                ASK_LATENCY_SECONDS.observe(latency_ms / 1000, status="no_documents")
                 yield {
                     "type": "complete",
                     "final_response": {
-                        "answer": "I don't have any relevant documents to answer your question. Please upload some PDF documents first.",
+                        "answer": NO_DOCUMENTS_ANSWER,
                         "citations": [],
-                        "latency_ms": int((time.time() - start_time) * 1000)
+                        "latency_ms": latency_ms,
+                        "timings": timings.as_dict()
                     }
                 }
                 return
             
-            # Format context and create citations
-            context = self._format_docs(relevant_docs)
-            citations = self._create_citations(relevant_docs)
+            # Merge, deduplicate and pack context, then cite the packed passages
+            with tracer.span("prompt.build") as prompt_span, PROMPT_BUILD_SECONDS.time() as prompt_timer:
+                context, passages = self.context_builder.build(relevant_docs)
+                citations = self._create_citations(passages)
+                history_section = f"Conversation so far:\n{history}\n\n" if history else ""
+                prompt = self.system_prompt.format(context=context, history=history_section, question=question)
+                prompt_tokens = self.context_builder.count_tokens(prompt)
+                prompt_span.set_attribute("passages", len(passages))
+                prompt_span.set_attribute("prompt_tokens", prompt_tokens)
+            timings.record("prompt_build", prompt_timer.elapsed)
             
             # Yield citations first
             for citation in citations:
@@ -292,72 +424,446 @@ Answer:"""
                 }
             
             # Stream LLM response
-            streaming_handler = StreamingCallbackHandler()
-            
-            # Create temporary chain for this request
-            prompt = ChatPromptTemplate.from_template(self.system_prompt)
-            llm_with_callbacks = self.llm.with_config(
-                {"callbacks": [streaming_handler]}
-            )
-            
-            temp_chain = (
-                RunnableParallel({
-                    "context": lambda x: context,
-                    "question": RunnablePassthrough()
-                })
-                | prompt
-                | llm_with_callbacks
-                | StrOutputParser()
-            )
-            
-            # Generate response
-            full_response = ""
-            async for chunk in temp_chain.astream(question):
-                if chunk:
-                    full_response += chunk
-                    yield {
-                        "type": "token",
-                        "content": chunk
-                    }
+            answer_parts = []
+            meter = GenerationMeter(provider="openai")
+            token_stream = self.llm.astream(prompt)
+            with tracer.span("llm.stream", model=self.settings.LLM_MODEL) as llm_span:
+                try:
+                    async for chunk in token_stream:
+                        if chunk.content:
+                            meter.token()
+                            answer_parts.append(chunk.content)
+                            yield {
+                                "type": "token",
+                                "content": chunk.content
+                            }
+                except (asyncio.CancelledError, GeneratorExit):
+                    # Nobody is reading: stop paying for tokens
+                    meter.cancel()
+                    llm_span.set_attribute("cancelled", True)
+                    raise
+                finally:
+                    # Unwinds the LangChain stream down to the provider's HTTP response
+                    await token_stream.aclose()
+                
+                generation = meter.finish()
+                for key, value in generation.items():
+                    llm_span.set_attribute(key, value)
             
             # Final response
-            latency_ms = int((time.time() - start_time) * 1000)
+            for stage, value in generation.items():
+                timings.stages[stage] = value
+            latency_ms = timings.elapsed_ms()
+            ASK_LATENCY_SECONDS.observe(latency_ms / 1000, status="ok")
             
             yield {
                 "type": "complete",
                 "final_response": {
-                    "answer": full_response,
+                    "answer": "".join(answer_parts),
                     "citations": [c.dict() for c in citations],
                     "latency_ms": latency_ms,
+                    "timings": timings.as_dict(),
                     "usage": {
                         "retrieved_docs": len(relevant_docs),
-                        "total_tokens": len(full_response.split())  # Rough estimate
+                        "context_passages": len(passages),
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": meter.tokens,
+                        "total_tokens": prompt_tokens + meter.tokens
                     }
                 }
             }
             
             logger.info(f"Question answered in {latency_ms}ms with {len(citations)} citations")
-            
+        
         except Exception as e:
+            ASK_LATENCY_SECONDS.observe(timings.elapsed_ms() / 1000, status="error")
             logger.error(f"Error in ask_question: {e}")
             yield {
                 "type": "error",
                 "error": str(e)
             }
     
-    def _create_citations(self, docs: List[Document]) -> List[Citation]:
-        """Create citation objects from retrieved documents."""
+    async def ask_batch(
+        self,
+        questions: List[str],
+        user_id: str,
+        doc_ids: Optional[List[str]] = None,
+        k: int = None,
+        max_concurrency: int = 4,
+        acquire_slot: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Answer many questions against the same documents.
+        
+        Retrieval is done for the whole batch at once (see _retrieve_many) and
+        the shared generation chain serves every question. Answers are generated without
+        streaming, at most `max_concurrency` at a time.
+        
+        Args:
+            questions: Questions to answer
+            user_id: User ID for access control
+            doc_ids: Optional list of document IDs to restrict search
+            k: Number of documents to retrieve per question (default from settings)
+            max_concurrency: Most LLM calls in flight for this batch
+            acquire_slot: Awaited before each LLM call and must return a lease with
+                release(), so batch generations count against the same cap as /ask
+        
+        Yields:
+            One result per question, tagged with its index, in completion order
+        """
+        if k is None:
+            k = self.settings.RETRIEVAL_K
+        
+        with tracer.span("ask.batch", questions=len(questions)) as batch_span:
+            timings = StageTimings()
+            retrieved = await self._retrieve_many(questions, user_id, doc_ids, k, timings)
+            retrieval_timings = timings.as_dict()
+            for stage, value in retrieval_timings.items():
+                batch_span.set_attribute(stage, value)
+            
+            slots = asyncio.Semaphore(max(1, max_concurrency))
+            
+            async def answer(index: int, question: str, docs: List[Document]) -> Dict[str, Any]:
+                start = time.perf_counter()
+                result = {"index": index, "question": question}
+                try:
+                    if not docs:
+                        ASK_BATCH_QUESTIONS_TOTAL.inc(result="no_documents")
+                        return {**result, "answer": NO_DOCUMENTS_ANSWER, "citations": [], "latency_ms": 0}
+                    
+                    context, passages = self.context_builder.build(docs)
+                    citations = self._create_citations(passages)
+                    
+                    async with slots:
+                        lease = await acquire_slot() if acquire_slot else None
+                        try:
+                            llm_start = time.perf_counter()
+                            with tracer.span("llm.generate", passages=len(passages)):
+                                text = await self.chain.ainvoke(
+                                    self.system_prompt.format(context=context, history="", question=question)
+                                )
+                            llm_ms = round((time.perf_counter() - llm_start) * 1000, 2)
+                        finally:
+                            if lease is not None:
+                                lease.release()
+                    
+                    ASK_BATCH_QUESTIONS_TOTAL.inc(result="ok")
+                    return {
+                        **result,
+                        "answer": text,
+                        "citations": [c.dict() for c in citations],
+                        "latency_ms": int((time.perf_counter() - start) * 1000),
+                        "timings": {**retrieval_timings, "llm_total_ms": llm_ms},
+                        "usage": {"retrieved_docs": len(docs), "context_passages": len(passages)}
+                    }
+                
+                except Exception as e:
+                    ASK_BATCH_QUESTIONS_TOTAL.inc(result="error")
+                    logger.error(f"Error answering batch question {index}: {e}")
+                    return {**result, "error": str(e)}
+            
+            tasks = [
+                asyncio.ensure_future(answer(index, question, docs))
+                for index, (question, docs) in enumerate(zip(questions, retrieved))
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                # Abandoned by the client: stop the remaining generations
+                for task in tasks:
+                    task.cancel()
+    
+    def _build_filter(self, user_id: str, doc_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Build a Chroma metadata filter scoped to the user and optional documents."""
+        if doc_ids:
+            return {
+                "$and": [
+                    {"user_id": user_id},
+                    {"doc_id": {"$in": doc_ids}}
+                ]
+            }
+        return {"user_id": user_id}
+    
+    async def _retrieve(
+        self,
+        question: str,
+        user_id: str,
+        doc_ids: Optional[List[str]],
+        k: int,
+        timings: Optional[StageTimings] = None
+    ) -> List[Document]:
+        """
+        Retrieve chunks for a question, routing through the document index when
+        no explicit documents were requested.
+        
+        The question is embedded once and the vector is reused for both the
+        routing lookup and the chunk-level MMR search.
+        """
+        loop = asyncio.get_event_loop()
+        timings = timings or StageTimings()
+        
+        embed_start = time.perf_counter()
+        query_embedding = await self._embed_query(question)
+        timings.record("embed_query", time.perf_counter() - embed_start)
+        
+        if not doc_ids and self.routing_index:
+            top_n = self.settings.ROUTING_TOP_DOCS
+            with tracer.span("retrieval.route") as route_span, \
+                    RETRIEVAL_SECONDS.time(stage="routing") as route_timer:
+                routed_ids = await self.routing_index.route(query_embedding, user_id, top_n)
+                route_span.set_attribute("routed_documents", len(routed_ids))
+            timings.record("routing", route_timer.elapsed)
+            
+            # Fewer hits than requested means the whole library fits in the
+            # shortlist, so the plain user filter is equivalent and cheaper
+            if len(routed_ids) >= top_n:
+                logger.info(f"Routed question to {len(routed_ids)} documents")
+                doc_ids = routed_ids
+        
+        search_filter = self._build_filter(user_id, doc_ids)
+        
+        with tracer.span("retrieval.search", k=k, scoped_documents=len(doc_ids or [])), \
+                RETRIEVAL_SECONDS.time(stage="chunks") as search_timer:
+            docs = await loop.run_in_executor(
+                None,
+                lambda: self._mmr_search_with_scores(query_embedding, k, k * 3, search_filter)
+            )
+        timings.record("retrieval", search_timer.elapsed)
+        
+        return docs
+    
+    async def _embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the vector of a recent identical query."""
+        query_embedding = self._query_embeddings.get(query)
+        if query_embedding is not None:
+            self._query_embeddings.move_to_end(query)
+            QUERY_EMBEDDING_CACHE_TOTAL.inc(result="hit")
+            return query_embedding
+        QUERY_EMBEDDING_CACHE_TOTAL.inc(result="miss")
+        
+        loop = asyncio.get_event_loop()
+        EMBEDDING_INPUTS_TOTAL.inc(operation="query")
+        with tracer.span("retrieval.embed_query"), \
+                EMBEDDING_BATCH_SECONDS.time(operation="query"):
+            query_embedding = await loop.run_in_executor(
+                None,
+                lambda: self.embeddings.embed_query(query)
+            )
+        
+        self._query_embeddings[query] = query_embedding
+        while len(self._query_embeddings) > self.settings.QUERY_EMBEDDING_CACHE_SIZE:
+            self._query_embeddings.popitem(last=False)
+        return query_embedding
+    
+    async def search_passages(
+        self,
+        query: str,
+        user_id: str,
+        doc_names: Dict[str, str],
+        doc_ids: Optional[List[str]] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """
+        Rank chunks by similarity to a query, with no MMR and no generation.
+        
+        Args:
+            query: Search query
+            user_id: Owner of the documents searched
+            doc_names: Document names by doc_id, for the results
+            doc_ids: Restrict the search to these documents
+            limit: Most passages returned
+        
+        Returns:
+            Passages with page, character offsets in the page, relevance score
+            and query-term highlights (see passage_search.make_passage), best first
+        """
+        loop = asyncio.get_event_loop()
+        query_embedding = await self._embed_query(query)
+        search_filter = self._build_filter(user_id, doc_ids)
+        
+        with tracer.span("search.vector", limit=limit), RETRIEVAL_SECONDS.time(stage="search"):
+            results = await loop.run_in_executor(
+                None,
+                lambda: self.vector_store._collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=limit,
+                    where=search_filter,
+                    include=["metadatas", "documents", "distances"]
+                )
+            )
+        
+        relevance = self.vector_store._select_relevance_score_fn()
+        pattern = term_pattern(query_terms(query))
+        passages = []
+        for text, metadata, distance in zip(results["documents"][0], results["metadatas"][0], results["distances"][0]):
+            metadata = metadata or {}
+            doc_id = metadata.get("doc_id", "")
+            passages.append(make_passage(
+                doc_id,
+                doc_names.get(doc_id, doc_id),
+                metadata.get("page", 0),
+                metadata.get("char_start", 0),
+                text,
+                float(relevance(distance)),
+                pattern
+            ))
+        return passages
+    
+    async def _retrieve_many(
+        self,
+        questions: List[str],
+        user_id: str,
+        doc_ids: Optional[List[str]],
+        k: int,
+        timings: Optional[StageTimings] = None
+    ) -> List[List[Document]]:
+        """
+        Retrieve chunks for many questions at once, in question order.
+        
+        Distinct questions are embedded in a single call and routed with a
+        single lookup. Questions that end up with the same document scope are
+        searched with one multi-vector query, and chunks returned for several
+        questions are decoded once.
+        """
+        loop = asyncio.get_event_loop()
+        timings = timings or StageTimings()
+        distinct = list(dict.fromkeys(questions))
+        
+        EMBEDDING_INPUTS_TOTAL.inc(len(distinct), operation="query")
+        with tracer.span("retrieval.embed_queries", inputs=len(distinct)), \
+                EMBEDDING_BATCH_SECONDS.time(operation="query_batch") as embed_timer:
+            vectors = await loop.run_in_executor(
+                None,
+                lambda: self.embeddings.embed_documents(distinct)
+            )
+        timings.record("embed_query", embed_timer.elapsed)
+        embeddings = dict(zip(distinct, vectors))
+        
+        scopes = {question: doc_ids for question in distinct}
+        if not doc_ids and self.routing_index:
+            top_n = self.settings.ROUTING_TOP_DOCS
+            with tracer.span("retrieval.route", questions=len(distinct)), \
+                    RETRIEVAL_SECONDS.time(stage="batch_routing") as route_timer:
+                routed = await self.routing_index.route_many(vectors, user_id, top_n)
+            timings.record("routing", route_timer.elapsed)
+            
+            # Same rule as _retrieve: a short list means the whole library fits
+            for question, routed_ids in zip(distinct, routed):
+                if len(routed_ids) >= top_n:
+                    scopes[question] = routed_ids
+        
+        groups: Dict[Any, List[str]] = {}
+        for question in distinct:
+            scope = tuple(sorted(scopes[question])) if scopes[question] else None
+            groups.setdefault(scope, []).append(question)
+        
+        shared: Dict[str, Any] = {}
+        searches = [
+            loop.run_in_executor(
+                None,
+                functools.partial(
+                    self._mmr_search_many,
+                    [embeddings[question] for question in group],
+                    k,
+                    k * 3,
+                    self._build_filter(user_id, list(scope) if scope else None),
+                    shared
+                )
+            )
+            for scope, group in groups.items()
+        ]
+        with tracer.span("retrieval.search", k=k, searches=len(searches)), \
+                RETRIEVAL_SECONDS.time(stage="batch_chunks") as search_timer:
+            results = await asyncio.gather(*searches)
+        timings.record("retrieval", search_timer.elapsed)
+        
+        docs_by_question = {}
+        for group, group_docs in zip(groups.values(), results):
+            docs_by_question.update(zip(group, group_docs))
+        return [docs_by_question[question] for question in questions]
+    
+    def _mmr_search_with_scores(
+        self,
+        query_embedding: List[float],
+        k: int,
+        fetch_k: int,
+        search_filter: Dict[str, Any]
+    ) -> List[Document]:
+        """MMR search for one query vector; see _mmr_search_many."""
+        return self._mmr_search_many([query_embedding], k, fetch_k, search_filter)[0]
+    
+    def _mmr_search_many(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        fetch_k: int,
+        search_filter: Dict[str, Any],
+        shared: Optional[Dict[str, Any]] = None
+    ) -> List[List[Document]]:
+        """
+        MMR search for several query vectors in one vector store query, keeping
+        each chunk's relevance score in `metadata["score"]`.
+        
+        Mirrors Chroma.max_marginal_relevance_search_by_vector, which discards
+        distances, so the context builder can pack passages by relevance.
+        Chunks already decoded into `shared` by an earlier search are reused.
+        """
+        results = self.vector_store._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=fetch_k,
+            where=search_filter,
+            include=["metadatas", "documents", "distances", "embeddings"]
+        )
+        relevance = self.vector_store._select_relevance_score_fn()
+        shared = {} if shared is None else shared
+        
+        batches = []
+        for position, query_embedding in enumerate(query_embeddings):
+            ids = results["ids"][position] if position < len(results["ids"]) else []
+            if not ids:
+                batches.append([])
+                continue
+            
+            candidates = []
+            for index, chunk_id in enumerate(ids):
+                chunk = shared.get(chunk_id)
+                if chunk is None:
+                    chunk = shared[chunk_id] = (
+                        results["documents"][position][index],
+                        results["metadatas"][position][index] or {},
+                        np.asarray(results["embeddings"][position][index], dtype=np.float32)
+                    )
+                candidates.append(chunk)
+            
+            selected = maximal_marginal_relevance(
+                np.array(query_embedding, dtype=np.float32),
+                [embedding for _, _, embedding in candidates],
+                k=k
+            )
+            
+            docs = []
+            for index in selected:
+                text, metadata, _ = candidates[index]
+                metadata = dict(metadata)
+                metadata["score"] = round(float(relevance(results["distances"][position][index])), 4)
+                docs.append(Document(page_content=text, metadata=metadata))
+            batches.append(docs)
+        return batches
+    
+    def _create_citations(self, passages: List[ContextPassage]) -> List[Citation]:
+        """Create citation objects for packed passages, in the same [S#] order as the context."""
         citations = []
         
-        for i, doc in enumerate(docs, 1):
-            metadata = doc.metadata
+        for passage in passages:
+            metadata = passage.metadata
             
             citation = Citation(
                 doc_id=metadata.get("doc_id", ""),
                 doc_name=f"Document {metadata.get('doc_id', 'Unknown')[:8]}",  # Truncated doc ID
                 page=metadata.get("page", 0),
-                score=0.85,  # Placeholder - Chroma doesn't return scores directly
-                excerpt=doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+                score=passage.score,
+                excerpt=passage.text[:200] + "..." if len(passage.text) > 200 else passage.text,
                 char_start=metadata.get("char_start"),
                 char_end=metadata.get("char_end")
             )
@@ -366,57 +872,97 @@ Answer:"""
         
         return citations
     
-    async def get_document_summary(self, doc_id: str, user_id: str) -> str:
-        """Get a summary of a document by asking about its main topics."""
-        try:
-            summary_question = "What are the main topics and key points covered in this document?"
-            
-            full_response = ""
-            async for chunk in self.ask_question(
-                question=summary_question,
-                user_id=user_id,
-                doc_ids=[doc_id],
-                k=10
-            ):
-                if chunk.get("type") == "token":
-                    full_response += chunk.get("content", "")
-                elif chunk.get("type") == "complete":
-                    return chunk.get("final_response", {}).get("answer", "")
-            
-            return full_response
-            
-        except Exception as e:
-            logger.error(f"Error generating document summary: {e}")
-            return "Unable to generate summary"
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the LLM's encoding."""
+        return self.context_builder.count_tokens(text)
     
-    async def health_check(self) -> Dict[str, Any]:
-        """Check the health of RAG components."""
-        try:
-            # Test embeddings
-            test_embed = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.embeddings.embed_query("test query")
-            )
-            
-            # Test vector store
-            collection_count = self.vector_store._collection.count()
-            
-            # Test LLM
-            test_response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.llm.predict("Hello")
-            )
-            
-            return {
-                "status": "healthy",
-                "embeddings": "working",
-                "vector_store": f"working ({collection_count} documents)",
-                "llm": "working"
-            }
-            
-        except Exception as e:
-            logger.error(f"RAG health check failed: {e}")
-            return {
-                "status": "unhealthy",
-                "error": str(e)
-            }
+    async def summarize_history(
+        self,
+        previous_summary: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int
+    ) -> str:
+        """Fold conversation messages into a running summary of at most `max_tokens` tokens."""
+        transcript = "\n".join(
+            f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages
+        )
+        prompt = self.summary_prompt.format(
+            max_tokens=max_tokens,
+            summary=previous_summary or "(none)",
+            messages=transcript
+        )
+        
+        with tracer.span("conversation.summarize", messages=len(messages)), \
+                CONVERSATION_SUMMARY_SECONDS.time():
+            response = await self.llm.ainvoke(prompt)
+        
+        summary = response.content.strip()
+        
+        # Enforce the budget even if the model overshoots
+        encoding = self.context_builder.encoding
+        tokens = encoding.encode(summary, disallowed_special=())
+        if len(tokens) > max_tokens:
+            summary = encoding.decode(tokens[:max_tokens])
+        return summary
+    
+    async def generate_text(self, prompt: str) -> str:
+        """Run a single non-streamed completion."""
+        with tracer.span("llm.generate", prompt_chars=len(prompt)):
+            response = await self.llm.ainvoke(prompt)
+        return response.content
+    
+    async def summarize_document(self, pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Summarize a document from its extracted pages.
+        
+        Args:
+            pages: Pages as returned by PDFProcessor.extract_pages
+        
+        Returns:
+            Dictionary with the summary, the method used and the number of page groups
+        """
+        with tracer.span("document.summarize", pages=len(pages)) as span:
+            result = await self.document_summarizer.summarize([(p["page"], p["text"]) for p in pages])
+            span.set_attribute("method", result["method"])
+            span.set_attribute("page_groups", result["page_groups"])
+        return result
+    
+    async def check_vector_store(self, live: bool = False) -> Dict[str, Any]:
+        """
+        Health probe for the vector store. The cheap probe is a heartbeat;
+        the live probe also counts stored chunks.
+        """
+        if self.vector_store is None:
+            raise RuntimeError("Vector store is not initialized")
+        
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.vector_store._client.heartbeat)
+        if not live:
+            return {}
+        
+        count = await loop.run_in_executor(None, self.vector_store._collection.count)
+        return {"chunks": count}
+    
+    async def check_embeddings(self, live: bool = False) -> Dict[str, Any]:
+        """Health probe for the embedding model; only the live probe calls the API."""
+        if self.embeddings is None:
+            raise RuntimeError("Embeddings are not initialized")
+        if not live:
+            return {"model": self.settings.EMBEDDING_MODEL}
+        
+        vector = await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: self.embeddings.embed_query("health check")
+        )
+        return {"model": self.settings.EMBEDDING_MODEL, "dimensions": len(vector)}
+    
+    async def check_llm(self, live: bool = False) -> Dict[str, Any]:
+        """Health probe for the LLM; only the live probe calls the API."""
+        if self.llm is None:
+            raise RuntimeError("LLM is not initialized")
+        if not live:
+            return {"model": self.settings.LLM_MODEL}
+        
+        # One output token is enough to prove the API key, model and network path
+        await self.llm.bind(max_tokens=1).ainvoke("Reply with OK.")
+        return {"model": self.settings.LLM_MODEL}
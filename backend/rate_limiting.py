@@ -0,0 +1,289 @@
+"""
+Per-user rate limiting and LLM admission control.
+
+Token buckets throttle how often each user may call /ask and /upload. Bucket
+state lives in a pluggable backend: in-process by default, or a shared SQLite
+file so every worker on the host draws from the same buckets. Admission
+control caps the number of in-flight LLM streams and hands freed slots to
+waiting users round-robin so one heavy user cannot starve the rest.
+"""
+
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Tuple
+
+from fastapi import HTTPException, status
+
+from metrics import RATE_LIMITED_TOTAL, ADMISSION_WAIT_SECONDS, ADMISSION_REJECTED_TOTAL
+
+
+class RateLimitBackend:
+    """Stores token bucket state. Subclasses must make `take` atomic per key."""
+    
+    async def take(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> float:
+        """
+        Try to remove `cost` tokens from the bucket for `key`.
+        
+        Returns:
+            0 when the tokens were taken, otherwise seconds until they will be available
+        """
+        raise NotImplementedError
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: float, refill_per_second: float) -> float:
+    return min(capacity, tokens + (now - updated) * refill_per_second)
+
+
+def _wait_time(tokens: float, cost: float, refill_per_second: float) -> float:
+    if refill_per_second <= 0:
+        return float("inf")
+    return (cost - tokens) / refill_per_second
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Buckets held in this process; limits apply per worker."""
+    
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    async def take(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, capacity, refill_per_second)
+            
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = _wait_time(tokens, cost, refill_per_second)
+            
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # Idle buckets are full, so forgetting the least recently used is safe
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        
+        return wait
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    Buckets in a SQLite file shared by every worker on the host.
+    
+    Each take runs in a BEGIN IMMEDIATE transaction, which serializes
+    concurrent workers on the write lock and keeps the refill-and-take atomic.
+    """
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+    
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+    
+    def _take(self, key: str, capacity: float, refill_per_second: float, cost: float) -> float:
+        # Wall clock, since monotonic clocks are not comparable across processes
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = _refill(tokens, updated, now, capacity, refill_per_second)
+            
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = _wait_time(tokens, cost, refill_per_second)
+            
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+    
+    async def take(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> float:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._take, key, capacity, refill_per_second, cost
+        )
+
+
+def create_rate_limit_backend(settings) -> RateLimitBackend:
+    """Build the backend selected by RATE_LIMIT_BACKEND."""
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteRateLimitBackend(settings.RATE_LIMIT_DB_PATH)
+    if settings.RATE_LIMIT_BACKEND != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {settings.RATE_LIMIT_BACKEND}")
+    return InMemoryRateLimitBackend()
+
+
+class RateLimiter:
+    """Per-user token buckets keyed by action."""
+    
+    def __init__(self, backend: RateLimitBackend, limits_per_minute: Dict[str, int]):
+        self.backend = backend
+        self.limits_per_minute = limits_per_minute
+    
+    async def check(self, user_id: str, action: str):
+        """Consume one request for the user or raise 429 with Retry-After."""
+        per_minute = self.limits_per_minute.get(action, 0)
+        if per_minute <= 0:
+            return
+        
+        wait = await self.backend.take(
+            f"{action}:{user_id}",
+            capacity=per_minute,
+            refill_per_second=per_minute / 60.0
+        )
+        if wait > 0:
+            RATE_LIMITED_TOTAL.inc(action=action)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Rate limit exceeded: {per_minute} {action} requests per minute",
+                headers={"Retry-After": str(max(1, int(wait + 0.999)))},
+            )
+
+
+class AdmissionLease:
+    """A held LLM slot; release is idempotent so it can be called from several cleanup paths."""
+    
+    __slots__ = ("_admission", "_released")
+    
+    def __init__(self, admission: "FairShareAdmission"):
+        self._admission = admission
+        self._released = False
+    
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._admission._release()
+
+
+class FairShareAdmission:
+    """
+    Caps concurrent LLM streams with a fair-share wait queue.
+    
+    Waiters are queued per user and freed slots are granted round-robin across
+    users, so a user with many queued questions gets one slot per turn. The
+    cap is per process; size it as the provider's concurrency divided by the
+    number of workers.
+    """
+    
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._waiting = 0
+    
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+    
+    async def acquire(self, user_id: str) -> AdmissionLease:
+        """Wait for a slot or raise 503 when the queue is full or the wait times out."""
+        unlimited = self.max_concurrent <= 0
+        if unlimited or (self.active < self.max_concurrent and not self._waiting):
+            self.active += 1
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+            return AdmissionLease(self)
+        
+        if self._waiting >= self.max_queue:
+            ADMISSION_REJECTED_TOTAL.inc(reason="queue_full")
+            raise self._unavailable("Too many questions in progress, please retry")
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(future)
+        self._waiting += 1
+        start = time.perf_counter()
+        
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._cancel_waiter(user_id, future):
+                # Granted between the timeout firing and now; keep the slot
+                ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start)
+                return AdmissionLease(self)
+            ADMISSION_REJECTED_TOTAL.inc(reason="timeout")
+            raise self._unavailable("Timed out waiting for a generation slot")
+        except asyncio.CancelledError:
+            if not self._cancel_waiter(user_id, future):
+                self._release()
+            raise
+        
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start)
+        return AdmissionLease(self)
+    
+    def _cancel_waiter(self, user_id: str, future: asyncio.Future) -> bool:
+        """Remove a waiter that has not been granted. Returns False if it already holds a slot."""
+        if future.done():
+            return False
+        
+        future.cancel()
+        queue = self._queues.get(user_id)
+        if queue is not None:
+            queue.remove(future)
+            if not queue:
+                del self._queues[user_id]
+        self._waiting -= 1
+        return True
+    
+    def _release(self):
+        # Hand the slot straight to the next user in round-robin order
+        while self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            self._waiting -= 1
+            
+            if not future.done():
+                future.set_result(None)
+                return
+        
+        self.active -= 1
+    
+    def _unavailable(self, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(max(1, int(self.queue_timeout)))},
+        )
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "waiting": self._waiting,
+            "waiting_users": len(self._queues)
+        }
+
@@ -21,6 +21,29 @@ class RenderConfig:
         self.CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
         self.RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "6"))
         
+        # Document summary settings
+        self.SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+        self.SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+        self.SUMMARY_GROUP_MAX_TOKENS = int(os.getenv("SUMMARY_GROUP_MAX_TOKENS", "6000"))
+        
+        # SSE framing settings
+        self.SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "20"))
+        self.SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "256"))
+        self.SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+        
+        # Passage search settings
+        self.SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "100"))
+        self.SEARCH_CONTEXT_CHARS = int(os.getenv("SEARCH_CONTEXT_CHARS", "160"))
+        
+        # Scanned page OCR settings
+        self.PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "50"))
+        self.OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() == "true"
+        self.OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", "2"))
+        self.OCR_MAX_PENDING_PAGES = int(os.getenv("OCR_MAX_PENDING_PAGES", "32"))
+        self.OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+        self.OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+        self.OCR_PAGE_TIMEOUT_SECONDS = float(os.getenv("OCR_PAGE_TIMEOUT_SECONDS", "120"))
+        
         # File settings
         self.MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "50"))
         self.UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/opt/render/project/src/uploads")
@@ -0,0 +1,204 @@
+"""
+Document-level routing index for two-stage retrieval.
+
+Each document is represented by a single centroid of its chunk embeddings.
+At query time the top documents are picked from this small index first, so
+chunk-level search only has to look inside those documents.
+"""
+
+import logging
+import asyncio
+from typing import List, Optional
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentRoutingIndex:
+    """Stores one centroid embedding per document in a dedicated collection."""
+    
+    COLLECTION_NAME = "document_routing"
+    
+    def __init__(self, settings, embeddings, client):
+        self.settings = settings
+        self.store = Chroma(
+            collection_name=self.COLLECTION_NAME,
+            client=client,
+            embedding_function=embeddings,
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+    
+    @staticmethod
+    def compute_centroid(embeddings: List[List[float]]) -> List[float]:
+        """Average the normalized chunk embeddings into a unit-length centroid."""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroid = (matrix / norms).mean(axis=0)
+        
+        length = np.linalg.norm(centroid)
+        if length > 0:
+            centroid = centroid / length
+        
+        return centroid.tolist()
+    
+    async def add_document(
+        self,
+        doc_id: str,
+        user_id: str,
+        chunk_embeddings: List[List[float]],
+        summary_text: str = ""
+    ):
+        """Insert or replace the routing entry for a document."""
+        if not chunk_embeddings:
+            return
+        
+        centroid = self.compute_centroid(chunk_embeddings)
+        await self._write_entry(doc_id, user_id, centroid, len(chunk_embeddings), summary_text)
+        
+        logger.info(f"Updated routing entry for document {doc_id}")
+    
+    async def _write_entry(
+        self,
+        doc_id: str,
+        user_id: str,
+        centroid: List[float],
+        chunk_count: int,
+        summary_text: str = ""
+    ):
+        await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: self.store._collection.upsert(
+                ids=[doc_id],
+                embeddings=[centroid],
+                metadatas=[{
+                    "doc_id": doc_id,
+                    "user_id": user_id,
+                    "chunk_count": chunk_count
+                }],
+                documents=[summary_text[:1000]]
+            )
+        )
+    
+    async def delete_document(self, doc_id: str):
+        """Remove the routing entry for a document."""
+        await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: self.store._collection.delete(ids=[doc_id])
+        )
+    
+    async def route(
+        self,
+        query_embedding: List[float],
+        user_id: str,
+        top_n: int
+    ) -> List[str]:
+        """
+        Pick the documents whose centroids are closest to the query.
+        
+        Args:
+            query_embedding: Embedded question
+            user_id: Only the user's own documents are considered
+            top_n: Number of documents to return
+        
+        Returns:
+            Document IDs ordered by similarity
+        """
+        return (await self.route_many([query_embedding], user_id, top_n))[0]
+    
+    async def route_many(
+        self,
+        query_embeddings: List[List[float]],
+        user_id: str,
+        top_n: int
+    ) -> List[List[str]]:
+        """Route several questions with one lookup; returns one document list per embedding."""
+        try:
+            results = await asyncio.get_event_loop().run_in_executor(
+                None,
+                lambda: self.store._collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=top_n,
+                    where={"user_id": user_id},
+                    include=["metadatas"]
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Routing lookup failed, searching all documents: {e}")
+            return [[] for _ in query_embeddings]
+        
+        routed = [
+            [metadata["doc_id"] for metadata in metadatas if metadata]
+            for metadatas in results.get("metadatas") or []
+        ]
+        return routed + [[] for _ in range(len(query_embeddings) - len(routed))]
+    
+    async def is_empty(self) -> bool:
+        """Check whether any documents have been routed yet."""
+        count = await asyncio.get_event_loop().run_in_executor(None, self.store._collection.count)
+        return count == 0
+    
+    async def backfill_from_chunks(
+        self,
+        chunk_collection,
+        user_id: Optional[str] = None,
+        page_size: int = 1000
+    ) -> int:
+        """
+        Build routing entries from embeddings already stored in the chunk collection.
+        
+        Used for documents ingested before the routing index existed. Chunks
+        are read `page_size` at a time and only a running sum per document is
+        kept, so memory does not grow with the size of the library.
+        
+        Returns:
+            Number of documents written to the routing index
+        """
+        where = {"user_id": user_id} if user_id else None
+        loop = asyncio.get_event_loop()
+        page_size = max(1, page_size)
+        
+        sums = {}
+        counts = {}
+        offset = 0
+        while True:
+            stored = await loop.run_in_executor(
+                None,
+                lambda: chunk_collection.get(
+                    where=where,
+                    include=["embeddings", "metadatas"],
+                    limit=page_size,
+                    offset=offset
+                )
+            )
+            ids = stored.get("ids") or []
+            if not ids:
+                break
+            offset += len(ids)
+            
+            for embedding, metadata in zip(stored.get("embeddings") or [], stored.get("metadatas") or []):
+                if not metadata or "doc_id" not in metadata:
+                    continue
+                key = (metadata["doc_id"], metadata.get("user_id", ""))
+                vector = np.asarray(embedding, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                if norm > 0:
+                    vector = vector / norm
+                sums[key] = sums[key] + vector if key in sums else vector
+                counts[key] = counts.get(key, 0) + 1
+            
+            if len(ids) < page_size:
+                break
+        
+        for (doc_id, owner_id), total in sums.items():
+            # Same direction as compute_centroid: the mean and the sum of the
+            # normalized embeddings only differ in length
+            length = np.linalg.norm(total)
+            centroid = total / length if length > 0 else total
+            await self._write_entry(doc_id, owner_id, centroid.tolist(), counts[(doc_id, owner_id)])
+        
+        logger.info(f"Backfilled routing index with {len(sums)} documents")
+        return len(sums)
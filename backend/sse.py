@@ -0,0 +1,222 @@
+"""
+Server-sent event framing shared by every /ask entry point.
+
+Answers arrive as a stream of event dicts, most of them single-token
+{"type": "token", "content": ...} events. Writing one frame per token
+means one JSON encode, one write and usually one TCP packet per token.
+SSEWriter instead coalesces consecutive token events into one frame,
+flushing when the buffered text reaches `coalesce_bytes` or the oldest
+buffered token is `coalesce_ms` old, whichever comes first. The first token
+is always sent at once so time-to-first-token is unchanged. Any other event
+flushes pending tokens and is sent immediately, so ordering is preserved.
+
+Every frame carries an `id:` line holding the number of events sent so far
+in the stream, so a client reconnecting with Last-Event-ID names exactly the
+events it already has, however they were coalesced. A comment heartbeat is
+sent when the stream has been idle for `heartbeat_seconds`, so proxies do
+not close a connection waiting on a slow retrieval or model. Clients that
+read `data:` lines ignore both.
+
+JSON is encoded with orjson when it is installed, falling back to the
+standard library with compact separators.
+"""
+
+import json
+import time
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi.responses import StreamingResponse
+
+from metrics import SSE_WRITE_SECONDS, SSE_FRAMES_TOTAL, SSE_EVENTS_PER_FRAME
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+MEDIA_TYPE = "text/stream-server-sent-events"
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+
+
+def encode_json(payload: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def encode_frame(event_id: int, payload: Dict[str, Any]) -> bytes:
+    return b"id: %d\ndata: %s\n\n" % (event_id, encode_json(payload))
+
+
+def _is_token(event: Dict[str, Any]) -> bool:
+    return event.get("type") == "token" and len(event) == 2 and isinstance(event.get("content"), str)
+
+
+class SSEWriter:
+    """Turns a stream of event dicts into coalesced SSE frames."""
+    
+    def __init__(
+        self,
+        events: AsyncIterator[Dict[str, Any]],
+        coalesce_ms: float = 20,
+        coalesce_bytes: int = 256,
+        heartbeat_seconds: float = 15,
+        last_event_id: int = 0
+    ):
+        """
+        Args:
+            events: Event dicts to send
+            coalesce_ms: Longest a token waits for others to share its frame
+            coalesce_bytes: Flush buffered tokens once their text reaches this size
+            heartbeat_seconds: Idle time before a keep-alive comment is sent
+            last_event_id: Events the client already has when resuming a stream
+        """
+        self.events = events
+        self.coalesce_seconds = coalesce_ms / 1000
+        self.coalesce_bytes = coalesce_bytes
+        self.heartbeat_seconds = heartbeat_seconds
+        self.last_event_id = last_event_id
+        self.frames = 0
+        self.events_written = 0
+    
+    def _frame(self, payload: Dict[str, Any], events: int) -> bytes:
+        self.last_event_id += events
+        frame = encode_frame(self.last_event_id, payload)
+        self.frames += 1
+        self.events_written += events
+        SSE_FRAMES_TOTAL.inc(kind="data")
+        SSE_EVENTS_PER_FRAME.observe(events)
+        return frame
+    
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        outbox = deque()
+        tokens = []
+        buffered = 0
+        sent_token = False
+        finished = False
+        wakeup: Optional[asyncio.Future] = None
+        deadline: Optional[asyncio.TimerHandle] = None
+        
+        def wake():
+            if wakeup is not None and not wakeup.done():
+                wakeup.set_result(None)
+        
+        def flush():
+            nonlocal tokens, buffered, deadline
+            if deadline is not None:
+                deadline.cancel()
+                deadline = None
+            if tokens:
+                outbox.append(({"type": "token", "content": "".join(tokens)}, len(tokens)))
+                tokens, buffered = [], 0
+        
+        def on_deadline():
+            nonlocal deadline
+            deadline = None
+            flush()
+            wake()
+        
+        async def pump():
+            # Reads the source on its own task so the coalescing window and
+            # heartbeat can expire while the model is between tokens
+            nonlocal buffered, sent_token, finished, deadline
+            try:
+                async for event in self.events:
+                    if _is_token(event):
+                        tokens.append(event["content"])
+                        buffered += len(event["content"])
+                        if not sent_token or buffered >= self.coalesce_bytes:
+                            sent_token = True
+                            flush()
+                            wake()
+                        elif deadline is None:
+                            deadline = loop.call_later(self.coalesce_seconds, on_deadline)
+                    else:
+                        # Anything else flushes pending tokens first to keep ordering
+                        flush()
+                        outbox.append((event, 1))
+                        wake()
+            finally:
+                flush()
+                finished = True
+                wake()
+        
+        reader = loop.create_task(pump())
+        last_write = loop.time()
+        try:
+            while True:
+                while outbox:
+                    payload, events = outbox.popleft()
+                    frame = self._frame(payload, events)
+                    # Time spent suspended at yield is the response write
+                    write_start = time.perf_counter()
+                    yield frame
+                    SSE_WRITE_SECONDS.observe(time.perf_counter() - write_start)
+                    last_write = loop.time()
+                
+                if finished:
+                    # Re-raise anything the source raised
+                    reader.result()
+                    break
+                
+                idle = last_write + self.heartbeat_seconds - loop.time()
+                if idle <= 0:
+                    SSE_FRAMES_TOTAL.inc(kind="heartbeat")
+                    yield HEARTBEAT_FRAME
+                    last_write = loop.time()
+                    continue
+                
+                wakeup = loop.create_future()
+                timer = loop.call_later(idle, wake)
+                try:
+                    await wakeup
+                finally:
+                    timer.cancel()
+                    wakeup = None
+        
+        finally:
+            if deadline is not None:
+                deadline.cancel()
+            if not reader.done():
+                # The source must finish unwinding before it can be closed
+                reader.cancel()
+                await asyncio.wait({reader})
+            if not reader.cancelled():
+                reader.exception()
+            close = getattr(self.events, "aclose", None)
+            if close is not None:
+                await close()
+
+
+def sse_response(
+    events: AsyncIterator[Dict[str, Any]],
+    coalesce_ms: float = 20,
+    coalesce_bytes: int = 256,
+    heartbeat_seconds: float = 15,
+    headers: Optional[Dict[str, str]] = None,
+    background=None,
+    last_event_id: int = 0
+) -> StreamingResponse:
+    """Stream events as coalesced SSE frames with the headers every /ask endpoint sends."""
+    writer = SSEWriter(
+        events,
+        coalesce_ms=coalesce_ms,
+        coalesce_bytes=coalesce_bytes,
+        heartbeat_seconds=heartbeat_seconds,
+        last_event_id=last_event_id
+    )
+    return StreamingResponse(
+        writer,
+        media_type=MEDIA_TYPE,
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+            **(headers or {})
+        },
+        background=background
+    )
@@ -0,0 +1,345 @@
+"""
+Span-based request tracing with a local SQLite exporter.
+
+Spans are tracked through a context variable so nested work inside a request
+is attached to the right parent automatically. Work that outlives the request
+(background processing) continues the trace by passing a TraceContext along.
+Finished spans are queued and written by a background thread so recording
+never blocks the event loop.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import logging
+import threading
+import contextvars
+from typing import Optional, Dict, Any, List
+
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class TraceContext:
+    """Identifies a position in a trace so it can be continued elsewhere."""
+    
+    def __init__(self, trace_id: str, span_id: Optional[str] = None):
+        self.trace_id = trace_id
+        self.span_id = span_id
+    
+    def as_dict(self) -> Dict[str, Optional[str]]:
+        return {"trace_id": self.trace_id, "span_id": self.span_id}
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+class Span:
+    """A timed unit of work within a trace."""
+    
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any]
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.error = None
+        self.start_time = 0.0
+        self.duration_ms = 0.0
+        self._start = 0.0
+        self._token = None
+    
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+    
+    def context(self) -> TraceContext:
+        return TraceContext(self.trace_id, self.span_id)
+    
+    def __enter__(self):
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if exc is not None:
+            self.status = "error"
+            self.error = str(exc)[:500]
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited from a different context (e.g. an async generator closed elsewhere)
+            pass
+        self.tracer.finish(self)
+        return False
+    
+    def as_record(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled so call sites need no branches."""
+    
+    trace_id = None
+    span_id = None
+    
+    def set_attribute(self, key: str, value: Any):
+        pass
+    
+    def context(self) -> Optional[TraceContext]:
+        return None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class SQLiteSpanExporter:
+    """Writes finished spans to SQLite from a dedicated writer thread."""
+    
+    def __init__(self, db_path: str, retention_hours: float = 24.0, batch_size: int = 200):
+        self.db_path = db_path
+        self.retention_seconds = retention_hours * 3600
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=10000)
+        self._dropped = 0
+        
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._init_db()
+        
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS spans (
+                    span_id TEXT PRIMARY KEY,
+                    trace_id TEXT NOT NULL,
+                    parent_id TEXT,
+                    name TEXT NOT NULL,
+                    start_time REAL NOT NULL,
+                    duration_ms REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    attributes TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_trace ON spans (trace_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_root ON spans (parent_id, start_time)")
+    
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span.as_record())
+        except queue.Full:
+            self._dropped += 1
+    
+    def _run(self):
+        last_prune = time.time()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                with self._connect() as conn:
+                    conn.executemany("""
+                        INSERT OR REPLACE INTO spans
+                        (span_id, trace_id, parent_id, name, start_time, duration_ms, status, error, attributes)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, [(
+                        record["span_id"], record["trace_id"], record["parent_id"], record["name"],
+                        record["start_time"], record["duration_ms"], record["status"], record["error"],
+                        json.dumps(record["attributes"], default=str)
+                    ) for record in batch])
+                    
+                    if time.time() - last_prune > 300:
+                        conn.execute("DELETE FROM spans WHERE start_time < ?", (time.time() - self.retention_seconds,))
+                        last_prune = time.time()
+            except Exception as e:
+                logger.warning(f"Failed to export {len(batch)} spans: {e}")
+    
+    def slowest_traces(self, limit: int = 10, window_minutes: float = 60, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Return the slowest recent traces with their full span breakdown.
+        
+        A trace's duration is the extent of all its spans, so background work
+        continuing an upload trace counts towards it.
+        
+        Args:
+            limit: Number of traces to return
+            window_minutes: Only consider traces started within this window
+            name: Optional root span name filter (e.g. "ask", "upload")
+            
+        Returns:
+            List of traces ordered by duration, each with its spans
+        """
+        since = time.time() - window_minutes * 60
+        query = """
+            SELECT s.trace_id,
+                   MIN(s.start_time) AS started,
+                   (MAX(s.start_time + s.duration_ms / 1000.0) - MIN(s.start_time)) * 1000.0 AS total_ms
+            FROM spans s
+            JOIN spans root ON root.trace_id = s.trace_id AND root.parent_id IS NULL
+            WHERE root.start_time >= ?
+        """
+        params: list = [since]
+        if name:
+            query += " AND root.name = ?"
+            params.append(name)
+        query += " GROUP BY s.trace_id ORDER BY total_ms DESC LIMIT ?"
+        params.append(limit)
+        
+        traces = []
+        with self._connect() as conn:
+            for trace in conn.execute(query, params).fetchall():
+                rows = conn.execute(
+                    "SELECT * FROM spans WHERE trace_id = ? ORDER BY start_time ASC",
+                    (trace["trace_id"],)
+                ).fetchall()
+                
+                spans = [self._row_to_dict(row) for row in rows]
+                root = next((span for span in spans if span["parent_id"] is None), spans[0])
+                
+                breakdown = {}
+                for span in spans:
+                    if span["parent_id"] is not None:
+                        breakdown[span["name"]] = round(breakdown.get(span["name"], 0.0) + span["duration_ms"], 3)
+                
+                traces.append({
+                    "trace_id": trace["trace_id"],
+                    "name": root["name"],
+                    "start_time": trace["started"],
+                    "duration_ms": round(trace["total_ms"], 3),
+                    "status": "error" if any(span["status"] == "error" for span in spans) else "ok",
+                    "breakdown_ms": dict(sorted(breakdown.items(), key=lambda item: -item[1])),
+                    "spans": spans
+                })
+        
+        return traces
+    
+    def get_trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM spans WHERE trace_id = ? ORDER BY start_time ASC",
+                (trace_id,)
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+    
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "span_id": row["span_id"],
+            "parent_id": row["parent_id"],
+            "name": row["name"],
+            "start_time": row["start_time"],
+            "duration_ms": row["duration_ms"],
+            "status": row["status"],
+            "error": row["error"],
+            "attributes": json.loads(row["attributes"]) if row["attributes"] else {}
+        }
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the exporter."""
+    
+    def __init__(self):
+        self.exporter: Optional[SQLiteSpanExporter] = None
+    
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+    
+    def configure(self, exporter: Optional[SQLiteSpanExporter]):
+        self.exporter = exporter
+    
+    def span(
+        self,
+        name: str,
+        parent: Optional[TraceContext] = None,
+        trace_id: Optional[str] = None,
+        **attributes
+    ):
+        """
+        Start a span as a context manager.
+        
+        The parent is, in order: the explicit parent context, the span active
+        in the current context, or none (a new root span). A root span uses
+        trace_id when given so the ID can be returned to clients up front.
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, attributes)
+        
+        current = _current_span.get()
+        if current is not None:
+            return Span(self, name, current.trace_id, current.span_id, attributes)
+        
+        return Span(self, name, trace_id or new_trace_id(), None, attributes)
+    
+    def finish(self, span: Span):
+        if self.exporter:
+            self.exporter.export(span)
+
+
+def current_trace_context() -> Optional[TraceContext]:
+    """Context of the active span, for handing work to background tasks."""
+    span = _current_span.get()
+    return span.context() if span is not None else None
+
+
+tracer = Tracer()
+
+
+def configure_tracing(settings) -> Tracer:
+    """Enable the SQLite exporter according to settings."""
+    if settings.TRACING_ENABLED:
+        tracer.configure(SQLiteSpanExporter(
+            settings.TRACE_DB_PATH,
+            retention_hours=settings.TRACE_RETENTION_HOURS
+        ))
+        logger.info(f"Tracing enabled, writing spans to {settings.TRACE_DB_PATH}")
+    return tracer
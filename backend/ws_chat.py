@@ -0,0 +1,363 @@
+"""
+Multiplexed chat over one WebSocket.
+
+A client authenticates once per connection and then runs any number of
+concurrent question streams over the same socket, each labelled with a
+client-chosen stream ID. Messages are JSON text frames.
+
+Client to server:
+    {"type": "auth", "token": "..."}          first message; may be resent to refresh the token
+    {"type": "ask", "stream_id": "s1", "question": "...", "doc_ids": [...], "k": 6, "conversation_id": "..."}
+    {"type": "credit", "stream_id": "s1", "frames": 32}
+    {"type": "cancel", "stream_id": "s1"}
+    {"type": "ping"}
+
+Server to client:
+    {"type": "ready", "user_id": "...", "max_streams": 8, "window_frames": 64}
+    the /ask events ("token", "complete", "error") with a "stream_id" field added
+    {"type": "cancelled", "stream_id": "s1"}
+    {"type": "error", "stream_id": "s1", "status": 429, "error": "..."}   ask rejected or failed
+    {"type": "pong"}
+
+Flow control is credit based, per stream: a stream may send `window_frames`
+frames, after which it waits until the client grants more with "credit".
+While a stream cannot send, consecutive tokens are merged into one pending
+frame; once `buffer_bytes` of text is pending the stream stops reading its
+answer, which stops pulling from the LLM stream, so a slow tab throttles its
+own generation rather than buffering it in the server. For that, answers
+must be pull-based: chat streams are not coalesced with identical questions,
+whose shared generation runs ahead into a buffer. A stream blocked for
+`stall_seconds` is cancelled. Streams take turns on the socket, so one busy
+stream cannot starve the others.
+"""
+
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+
+from metrics import WS_CONNECTIONS_TOTAL, WS_STREAMS_TOTAL, WS_FRAMES_TOTAL, WS_BACKPRESSURE_SECONDS
+from sse import encode_json
+
+
+logger = logging.getLogger(__name__)
+
+
+# Close code for failed or missing authentication (4000-4999 is free for applications)
+CLOSE_UNAUTHORIZED = 4401
+
+Authenticate = Callable[[str], Awaitable[Tuple[Any, Optional[float]]]]
+OpenAnswer = Callable[[Any, Dict[str, Any]], Awaitable[AsyncIterator[Dict[str, Any]]]]
+
+
+class StreamStalled(Exception):
+    """The client did not grant credit for a blocked stream in time."""
+
+
+class _Stream:
+    """One question stream on a connection and the frames it has not sent yet."""
+    
+    def __init__(self, stream_id: str, credit: int):
+        self.stream_id = stream_id
+        self.credit = credit
+        # Frames in order; a trailing token frame is a list that later tokens extend
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.finished = False
+        self.cancelled = False
+        self.queued = False
+        self.space = asyncio.Event()
+        self.space.set()
+        self.task: Optional[asyncio.Task] = None
+    
+    @property
+    def sendable(self) -> bool:
+        return self.credit > 0 and bool(self.pending)
+    
+    def put(self, event: Dict[str, Any], buffer_bytes: int):
+        if event.get("type") == "token" and len(event) == 2 and isinstance(event.get("content"), str):
+            if self.pending and isinstance(self.pending[-1], list):
+                self.pending[-1].append(event["content"])
+            else:
+                self.pending.append([event["content"]])
+            self.pending_bytes += len(event["content"])
+            if self.pending_bytes >= buffer_bytes:
+                self.space.clear()
+        else:
+            self.pending.append(event)
+    
+    def take(self) -> Dict[str, Any]:
+        frame = self.pending.popleft()
+        self.credit -= 1
+        if isinstance(frame, list):
+            content = "".join(frame)
+            self.pending_bytes -= len(content)
+            self.space.set()
+            return {"type": "token", "content": content, "stream_id": self.stream_id}
+        return {**frame, "stream_id": self.stream_id}
+
+
+class ChatConnection:
+    """Runs the question streams of one authenticated socket."""
+    
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user: Any,
+        expires_at: Optional[float],
+        authenticate: Authenticate,
+        open_answer: OpenAnswer,
+        max_streams: int = 8,
+        window_frames: int = 64,
+        buffer_bytes: int = 16384,
+        stall_seconds: float = 60.0
+    ):
+        """
+        Args:
+            websocket: Accepted socket
+            user: Authenticated user
+            expires_at: Expiry timestamp of the user's token, if any
+            authenticate: Resolves a token to (user, expiry); raises HTTPException
+            open_answer: Starts an answer for (user, ask message); raises HTTPException
+            max_streams: Concurrent streams allowed on the connection
+            window_frames: Frames a stream may send before it needs credit
+            buffer_bytes: Token text buffered per stream before its answer is paused
+            stall_seconds: How long a paused stream waits for credit before it is cancelled
+        """
+        self.websocket = websocket
+        self.user = user
+        self.expires_at = expires_at
+        self.authenticate = authenticate
+        self.open_answer = open_answer
+        self.max_streams = max_streams
+        self.window_frames = window_frames
+        self.buffer_bytes = buffer_bytes
+        self.stall_seconds = stall_seconds
+        self.streams: Dict[str, _Stream] = {}
+        # Control frames go first; data frames take turns in `ready`
+        self.control = deque()
+        self.ready = deque()
+        self._wakeup = asyncio.Event()
+    
+    async def run(self):
+        """Serve the connection until the client disconnects."""
+        writer = asyncio.create_task(self._write_loop())
+        self._send_ready()
+        try:
+            while not writer.done():
+                try:
+                    message = json.loads(await self.websocket.receive_text())
+                    if not isinstance(message, dict):
+                        raise ValueError("Messages must be JSON objects")
+                except (ValueError, KeyError) as e:
+                    self._send_control({"type": "error", "status": 400, "error": f"Invalid message: {e}"})
+                    continue
+                await self._handle(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for stream in list(self.streams.values()):
+                stream.task.cancel()
+            if self.streams:
+                await asyncio.wait([stream.task for stream in self.streams.values()])
+            writer.cancel()
+            await asyncio.wait({writer})
+            if not writer.cancelled() and writer.exception() is not None:
+                logger.warning(f"Chat socket writer for user {self.user.id} failed: {writer.exception()}")
+    
+    async def _handle(self, message: Dict[str, Any]):
+        kind = message.get("type")
+        stream_id = message.get("stream_id")
+        
+        if kind == "ask":
+            self._ask(stream_id, message)
+        
+        elif kind == "credit":
+            stream = self.streams.get(stream_id)
+            frames = message.get("frames")
+            if stream is not None and isinstance(frames, int) and frames > 0:
+                stream.credit += frames
+                self._schedule(stream)
+        
+        elif kind == "cancel":
+            stream = self.streams.get(stream_id)
+            if stream is not None and not stream.finished:
+                stream.cancelled = True
+                stream.task.cancel()
+        
+        elif kind == "auth":
+            try:
+                user, expires_at = await self.authenticate(message.get("token") or "")
+                if user.id != self.user.id:
+                    raise HTTPException(status_code=403, detail="Token belongs to a different user")
+                self.user, self.expires_at = user, expires_at
+                self._send_ready()
+            except HTTPException as e:
+                self._send_control({"type": "error", "status": e.status_code, "error": e.detail})
+        
+        elif kind == "ping":
+            self._send_control({"type": "pong"})
+        
+        else:
+            self._send_control({
+                "type": "error",
+                "stream_id": stream_id,
+                "status": 400,
+                "error": f"Unknown message type: {kind}"
+            })
+    
+    def _ask(self, stream_id: Any, message: Dict[str, Any]):
+        error = None
+        if not isinstance(stream_id, str) or not 0 < len(stream_id) <= 64:
+            error = (400, "stream_id must be a string of 1 to 64 characters")
+        elif stream_id in self.streams:
+            error = (409, f"Stream {stream_id} is already open")
+        elif len(self.streams) >= self.max_streams:
+            error = (429, f"At most {self.max_streams} concurrent streams per connection")
+        elif self.expires_at is not None and time.time() >= self.expires_at:
+            error = (401, "Token expired; send a new auth message")
+        
+        if error is not None:
+            WS_STREAMS_TOTAL.inc(outcome="rejected")
+            self._send_control({"type": "error", "stream_id": stream_id, "status": error[0], "error": error[1]})
+            return
+        
+        stream = _Stream(stream_id, self.window_frames)
+        self.streams[stream_id] = stream
+        stream.task = asyncio.create_task(self._pump(stream, message))
+    
+    async def _pump(self, stream: _Stream, message: Dict[str, Any]):
+        """Read one answer into its stream, pausing while the stream's buffer is full."""
+        outcome = "completed"
+        answer = None
+        try:
+            try:
+                answer = await self.open_answer(self.user, message)
+            except HTTPException as e:
+                outcome = "rejected"
+                stream.put({"type": "error", "status": e.status_code, "error": e.detail}, self.buffer_bytes)
+                return
+            except ValueError as e:
+                outcome = "rejected"
+                stream.put({"type": "error", "status": 422, "error": str(e)}, self.buffer_bytes)
+                return
+            
+            async for event in answer:
+                if not stream.space.is_set():
+                    blocked = time.perf_counter()
+                    try:
+                        await asyncio.wait_for(stream.space.wait(), self.stall_seconds)
+                    except asyncio.TimeoutError:
+                        raise StreamStalled(f"No credit granted for {self.stall_seconds}s")
+                    finally:
+                        WS_BACKPRESSURE_SECONDS.observe(time.perf_counter() - blocked)
+                stream.put(event, self.buffer_bytes)
+                self._schedule(stream)
+        
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            if stream.cancelled:
+                # Pending frames of a cancelled stream are dropped
+                stream.pending.clear()
+                self._send_control({"type": "cancelled", "stream_id": stream.stream_id})
+        except StreamStalled as e:
+            outcome = "stalled"
+            stream.pending.clear()
+            self._send_control({"type": "error", "stream_id": stream.stream_id, "status": 408, "error": str(e)})
+        except Exception as e:
+            outcome = "failed"
+            logger.error(f"Chat stream {stream.stream_id} failed: {e}")
+            stream.put({"type": "error", "status": 500, "error": str(e)}, self.buffer_bytes)
+        
+        finally:
+            if answer is not None:
+                # Unwinds the answer down to the LLM call if it stopped early
+                await answer.aclose()
+            stream.finished = True
+            WS_STREAMS_TOTAL.inc(outcome=outcome)
+            self._schedule(stream)
+    
+    def _schedule(self, stream: _Stream):
+        """Queue a stream for the writer if it has something it may send, or forget it once it is done."""
+        if stream.sendable:
+            if not stream.queued:
+                stream.queued = True
+                self.ready.append(stream)
+                self._wakeup.set()
+        elif stream.finished and not stream.pending and self.streams.get(stream.stream_id) is stream:
+            # The ID can be reused once everything for it has been sent
+            del self.streams[stream.stream_id]
+    
+    def _send_ready(self):
+        self._send_control({
+            "type": "ready",
+            "user_id": self.user.id,
+            "max_streams": self.max_streams,
+            "window_frames": self.window_frames
+        })
+    
+    def _send_control(self, payload: Dict[str, Any]):
+        self.control.append(payload)
+        self._wakeup.set()
+    
+    async def _write_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            
+            while self.control or self.ready:
+                if self.control:
+                    await self._send(self.control.popleft(), "control")
+                    continue
+                
+                # One frame per stream per turn
+                stream = self.ready.popleft()
+                stream.queued = False
+                if not stream.sendable:
+                    continue
+                await self._send(stream.take(), "data")
+                self._schedule(stream)
+    
+    async def _send(self, payload: Dict[str, Any], kind: str):
+        # Awaiting the send applies TCP backpressure from a slow client
+        await self.websocket.send_text(encode_json(payload).decode("utf-8"))
+        WS_FRAMES_TOTAL.inc(kind=kind)
+
+
+async def serve_chat(
+    websocket: WebSocket,
+    authenticate: Authenticate,
+    open_answer: OpenAnswer,
+    auth_timeout: float = 10.0,
+    **limits
+):
+    """
+    Accept a chat socket, authenticate it with its first message and serve it.
+    
+    Args:
+        websocket: Incoming socket
+        authenticate: Resolves a token to (user, expiry); raises HTTPException
+        open_answer: Starts an answer for (user, ask message); raises HTTPException
+        auth_timeout: Seconds the client has to send its auth message
+        **limits: Passed to ChatConnection
+    """
+    await websocket.accept()
+    try:
+        message = json.loads(await asyncio.wait_for(websocket.receive_text(), auth_timeout))
+        if not isinstance(message, dict) or message.get("type") != "auth":
+            raise HTTPException(status_code=401, detail="First message must be {\"type\": \"auth\", \"token\": ...}")
+        user, expires_at = await authenticate(message.get("token") or "")
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, ValueError, HTTPException) as e:
+        WS_CONNECTIONS_TOTAL.inc(result="unauthorized")
+        reason = e.detail if isinstance(e, HTTPException) else "Authentication required"
+        await websocket.close(code=CLOSE_UNAUTHORIZED, reason=str(reason)[:120])
+        return
+    
+    WS_CONNECTIONS_TOTAL.inc(result="accepted")
+    await ChatConnection(websocket, user, expires_at, authenticate, open_answer, **limits).run()